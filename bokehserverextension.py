@@ -1,6 +1,19 @@
+import os
 from subprocess import Popen
 
 
 def load_jupyter_server_extension(nbapp):
-    """serve the bokeh-app directory with bokeh server"""
-    Popen(["bokeh", "serve", "rtdap_prototype", "--allow-websocket-origin=*"])
+    """serve the bokeh-app directory with bokeh server
+
+    RTDAP_NUM_PROCS sets the number of server worker processes (default 1, 0 = one per core);
+    with more than one worker, every worker memory maps the same serving snapshot of the data
+    """
+    num_procs = os.environ.get("RTDAP_NUM_PROCS", "1")
+    env = dict(os.environ)
+
+    cmd = ["bokeh", "serve", "rtdap_prototype", "--allow-websocket-origin=*"]
+    if num_procs != "1":
+        cmd += ["--num-procs", num_procs]
+        env.setdefault("RTDAP_SNAPSHOT", "1")
+
+    Popen(cmd, env=env)
@@ -0,0 +1,263 @@
+#libraries
+import logging
+import numpy as np
+from datetime import date
+from functools import partial
+
+#bokeh
+from bokeh.plotting import figure
+from bokeh.layouts import column, row
+from bokeh.models import Spacer, HoverTool, ColumnDataSource, RangeSlider
+from bokeh.models.widgets import Div, Select, DatePicker, DataTable, TableColumn, NumberFormatter
+from bokeh.io import curdoc
+
+from scripts.state import as_state
+from scripts.sketch import corridor_reliability, corridors_reliability, PERCENTILES
+from scripts.select import update_source, selection_executor
+from scripts.instrument import instrumented
+from scripts.cache import selection_cache, selection_key
+
+#reliability columns shown in the tables, and their number formats
+RELIABILITY_COLUMNS = [('Readings', '0,0')] + [('P%d Speed' % p, '0,0.0') for p in PERCENTILES] +\
+                      [('Travel Time Index', '0.00'), ('Buffer Index', '0.00'), ('Planning Time Index', '0.00')]
+
+logger = logging.getLogger('rtdap.analytics')
+
+def cached_reliability(state, corr, date_s, date_e, weekday, tod):
+
+    """
+    returns (corridor table, corridors table) reliability of a selection, from the shared
+    selection cache when any session has made the same selection against the same data
+
+    Keyword arguments:
+    state -- DashboardState the selection is made against
+    corr, date_s, date_e, weekday, tod -- the selection; tod applies to the corridors table
+    """
+
+    def compute():
+        return (corridor_reliability(state.sketch_index, corr, date_s, date_e, weekday),
+                corridors_reliability(state.sketch_index, state.store.corridors(), date_s, date_e, weekday, tod))
+
+    key = ('reliability',) + selection_key(state.data_key, corr, date_s, date_e, weekday, tod)
+
+    return selection_cache.get_or_compute(key, compute)
+
+def analytics_tab(rtdap_data):
+
+    def table_data(reliability, key):
+        """
+        returns column data of a reliability table
+
+        Keyword arguments:
+        reliability -- dataframe from corridor_reliability() or corridors_reliability()
+        key -- column name given to the dataframe's index
+        """
+        data = {key: reliability.index.tolist()}
+        for col, number_format in RELIABILITY_COLUMNS:
+            data[col] = reliability[col].values.astype(np.float64)
+        return data
+
+    def tod_chart_data(reliability):
+        """
+        returns column data of the time of day charts: every period's row of a corridor_reliability() table
+        """
+        periods = reliability.iloc[:-1]
+        data = {'tod': np.arange(1, len(periods) + 1)}
+        for col, number_format in RELIABILITY_COLUMNS[1:]:
+            data[col.replace(' ', '_')] = periods[col].values.astype(np.float64)
+        return data
+
+    def reliability_table(source, key, title, width=900):
+        """
+        returns bokeh DataTable of speed percentiles and reliability indices
+        """
+        columns = [TableColumn(field=key, title=title, width=150)]
+        columns += [TableColumn(field=col, title=col, formatter=NumberFormatter(format=number_format))
+                    for col, number_format in RELIABILITY_COLUMNS]
+
+        return DataTable(source=source, columns=columns, width=width, height=275,
+                         index_position=None, sortable=False, css_classes=["w3-small"])
+
+    def line_chart(source, fields, title, colors):
+        """
+        returns bokeh line chart of fields of the time of day chart data
+
+        Keyword arguments:
+        source -- ColumnDataSource of column data derived from tod_chart_data()
+        fields -- column names of the lines
+        title -- chart title
+        colors -- line colors
+        """
+        hover = HoverTool(tooltips=[("Time of Day", "@tod")] + [(f, "@%s{0.00}" % f.replace(' ', '_')) for f in fields])
+        p = figure(plot_width=450, plot_height=250, toolbar_location="above", title=title,
+                   tools=['reset', 'save', hover])
+
+        for field, color in zip(fields, colors):
+            p.line(x='tod', y=field.replace(' ', '_'), color=color, line_width=2, legend_label=field, source=source)
+            p.circle(x='tod', y=field.replace(' ', '_'), color=color, size=5, source=source)
+
+        p.legend.location = "bottom_left"
+        p.legend.label_text_font_size = '8pt'
+        p.xaxis.axis_label = "Time of Day"
+        p.xgrid.visible = False
+        p.background_fill_alpha = 0.5
+        p.border_fill_color = None
+
+        return p
+
+
+
+    """
+    return analytics tab contents
+
+    Keyword arguments:
+    rtdap_data - DashboardState shared by the server's sessions (or a VDSStore / dataframe)
+                 containing rtdap vds detail data
+    """
+
+    state = as_state(rtdap_data)
+    doc = curdoc()
+
+    #whether an update is scheduled for this tick, the number and future of the latest submitted update,
+    #and the corridor shown
+    view = {'pending': False, 'latest': 0, 'future': None, 'shown': None}
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #update_reliability -- merges the selected days' speed sketches in selection_executor, once per tick of widget changes
+
+    def selection_changed(attr, old, new):
+
+        """
+        schedules one reliability update for the widget changes of the current tick
+        """
+
+        if not view['pending']:
+            view['pending'] = True
+            doc.add_next_tick_callback(update_reliability)
+
+    @instrumented(doc)
+    def update_reliability():
+
+        """
+        computes the reliability of the current selection in selection_executor; the result
+        is applied on a later tick of the session's document
+        """
+
+        view['pending'] = False
+
+        if view['future'] is not None:
+            view['future'].cancel()
+
+        view['latest'] += 1
+        request_id = view['latest']
+
+        corr = corridor_select.value
+        future = selection_executor.submit(cached_reliability, state, corr,
+                                           str(date_picker_start.value), str(date_picker_end.value),
+                                           day_of_week.value, time_of_day.value)
+        view['future'] = future
+
+        future.add_done_callback(lambda f: doc.add_next_tick_callback(partial(apply_reliability, request_id, corr, f)))
+
+    @instrumented(doc)
+    def apply_reliability(request_id, corr, future):
+
+        """
+        updates the tables and charts with a computed reliability, unless the session
+        has changed the selection since
+
+        Keyword arguments:
+        request_id -- update_reliability request number of the result
+        corr -- corridor name of the selection
+        future -- completed future holding cached_reliability() results
+        """
+
+        if request_id != view['latest'] or future.cancelled():
+            return
+
+        try:
+            by_tod, by_corridor = future.result()
+        except Exception:
+            #the shown reliability stays in place, with a note that this selection failed
+            logger.exception('reliability of %s failed', corr)
+            title.text = ("<h1>" + view['shown'] + " Reliability</h1>"
+                          "<p>The " + corr + " selection could not be computed, please try again.</p>")
+            return
+
+        view['shown'] = corr
+        title.text = "<h1>" + corr + " Reliability</h1>"
+        update_source(tod_src, table_data(by_tod, 'tod'))
+        update_source(chart_src, tod_chart_data(by_tod))
+        update_source(corridors_src, table_data(by_corridor, 'corridor'))
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #Highway Performance Panel
+
+    panel_title = Div(text="Highway Performance", css_classes = ["panel-title","text-center"])
+    panel_text = Div(text="""Speed percentiles and travel time reliability by corridor and time of day.
+           The buffer index is the extra travel time, relative to the mean, needed to arrive on time
+           95% of the time; the planning time index is the 95th percentile travel time relative to
+           free flow (the 85th percentile speed from 8pm to 6am).""", css_classes = ["panel-content"])
+
+    years = state.store.years()
+    #Date Range
+    date_range = Div(text="Data References:<br>%d - %d" % (years[0], years[-1]),
+                     css_classes = ["panel-content","text-center"])
+
+
+    #Panel Buttons
+    corridor_select = Select(options=state.store.corridors(), title = 'Corridor:', height=60,
+                             value = state.store.corridors()[0])
+
+    date_picker_start = DatePicker(min_date = date(years[0], 1, 1),max_date = date(years[-1], 12, 31),
+                            css_classes = ["panel-content", "col-lg-4"], title = "Start Date:",
+                            height=60, value = date(years[0], 1, 1))
+
+    date_picker_end = DatePicker(min_date = date(years[0], 1, 1),max_date = date(years[-1], 12, 31),
+                            css_classes = ["panel-content", "col-lg-4"], title = "End Date:",
+                            height=60, value = date(years[-1], 12, 31))
+
+    day_of_week = Select(options=['All'] + state.store.days_of_week(),
+                        title = "Day of Week:", value = "All",
+                            height=60)
+
+    time_of_day = RangeSlider(start = 1, end= 8,step=1, value=(3, 4),
+                        title="Time of Day (corridors table):", bar_color="black", height=60)
+
+    for widget in [corridor_select, date_picker_start, date_picker_end, day_of_week, time_of_day]:
+        widget.on_change('value', selection_changed)
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #Create initial content
+
+    view['shown'] = corridor_select.value
+    by_tod, by_corridor = cached_reliability(state, corridor_select.value, str(date_picker_start.value),
+                                             str(date_picker_end.value), day_of_week.value, time_of_day.value)
+
+    title = Div(text="<h1>" + corridor_select.value + " Reliability</h1>", width=1000, css_classes=["w3-panel", "w3-white"])
+    corridors_title = Div(text="<b>All corridors, selected time of day</b>", css_classes=["w3-panel"])
+
+    tod_src = ColumnDataSource(data = table_data(by_tod, 'tod'))
+    chart_src = ColumnDataSource(data = tod_chart_data(by_tod))
+    corridors_src = ColumnDataSource(data = table_data(by_corridor, 'corridor'))
+
+    speed_chart = line_chart(chart_src, ['P%d Speed' % p for p in PERCENTILES], "Speed Percentiles",
+                             ['#d73027', '#fdae61', '#1a9850'])
+    index_chart = line_chart(chart_src, ['Travel Time Index', 'Buffer Index', 'Planning Time Index'],
+                             "Reliability Indices", ['navy', '#fdae61', '#d73027'])
+
+    return row(column(panel_title, panel_text, date_range,
+                                corridor_select, date_picker_start, date_picker_end, day_of_week,
+                                time_of_day, height = 700, css_classes = ["panel","col-lg-4"]),
+                      column(title,
+                             row(reliability_table(tod_src, 'tod', 'Time of Day'),
+                                 css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             Spacer(height=10),
+                             row(speed_chart, Spacer(width=20), index_chart,
+                                 css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             Spacer(height=10),
+                             corridors_title,
+                             row(reliability_table(corridors_src, 'corridor', 'Corridor'),
+                                 css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             css_classes = ["container-fluid","col-lg-8"]),
+                      css_classes = ["container-fluid","col-lg-12"])
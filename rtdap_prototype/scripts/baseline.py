@@ -0,0 +1,147 @@
+#libraries
+import os
+import json
+import pandas as pd
+import numpy as np
+
+from scripts.prepare import METRIC_COLUMNS
+
+BASELINE_FILE = '_baselines.json'
+
+def corridor_sums(df):
+
+    """
+    returns per corridor sums and non-missing counts of the metric columns
+
+    Keyword arguments:
+    df -- dataframe of vds detail rows with corridor and metric columns
+    """
+
+    values = df[METRIC_COLUMNS].astype(np.float64)
+    grouped = values.groupby(df['corridor'].astype(str))
+
+    sums = grouped.sum()
+    counts = grouped.count()
+    sums.columns = [c + '_sum' for c in METRIC_COLUMNS]
+    counts.columns = [c + '_count' for c in METRIC_COLUMNS]
+
+    return pd.concat([sums, counts], axis=1)
+
+def build_baselines(store):
+
+    """
+    returns per corridor sums and counts of the metric columns, built in one grouped pass
+    over the store
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    totals = None
+    for batch in store.iter_batches(columns=['corridor'] + METRIC_COLUMNS):
+        sums = corridor_sums(batch)
+        totals = sums if totals is None else totals.add(sums, fill_value=0)
+
+    if totals is None:
+        return corridor_sums(pd.DataFrame(columns=['corridor'] + METRIC_COLUMNS))
+
+    return totals
+
+def baseline_means(totals):
+
+    """
+    returns dictionary of corridor name -> {metric column: long-run mean}
+
+    Keyword arguments:
+    totals -- per corridor sums and counts from build_baselines()
+    """
+
+    means = {}
+    for corr, row in totals.iterrows():
+        means[corr] = {}
+        for col in METRIC_COLUMNS:
+            count = row[col + '_count']
+            means[corr][col] = row[col + '_sum'] / count if count > 0 else np.nan
+
+    return means
+
+def load_baselines(store):
+
+    """
+    returns dictionary of corridor name -> {metric column: long-run mean}; read from the
+    baseline file next to the store while the store is unchanged, rebuilt and saved otherwise
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    fingerprint = store.fingerprint()
+    if fingerprint is None:
+        return baseline_means(build_baselines(store))
+
+    totals = saved_totals(store, fingerprint)
+    if totals is not None:
+        return baseline_means(totals)
+
+    totals = build_baselines(store)
+    save_baselines(store, totals)
+
+    return baseline_means(totals)
+
+def saved_totals(store, fingerprint):
+
+    """
+    returns the per corridor sums and counts saved next to the store if they were built for
+    the given store fingerprint, None otherwise
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    fingerprint -- store fingerprint the totals must match
+    """
+
+    path = os.path.join(store.root, BASELINE_FILE)
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        saved = json.load(f)
+    if saved.get('fingerprint') != fingerprint:
+        return None
+
+    return pd.DataFrame(saved['totals']).T
+
+def save_baselines(store, totals):
+
+    """
+    saves per corridor sums and counts next to the store, tagged with the store's fingerprint
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    totals -- per corridor sums and counts from build_baselines()
+    """
+
+    path = os.path.join(store.root, BASELINE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'fingerprint': store.fingerprint(), 'totals': totals.T.to_dict()}, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def append_baselines(store, previous_fingerprint, sums):
+
+    """
+    adds the sums and counts of rows appended to the store to its saved totals, so only the
+    appended rows are read; returns False, leaving the totals to be rebuilt on load, if the
+    saved totals were not built for the store before the append
+
+    Keyword arguments:
+    store -- VDSStore after the append
+    previous_fingerprint -- fingerprint of the store before the append
+    sums -- corridor_sums() of the appended rows
+    """
+
+    totals = saved_totals(store, previous_fingerprint)
+    if totals is None:
+        return False
+
+    save_baselines(store, totals.add(sums, fill_value=0))
+
+    return True
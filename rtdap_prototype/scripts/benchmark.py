@@ -0,0 +1,358 @@
+#libraries
+import os
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from datetime import date, timedelta
+import pandas as pd
+import numpy as np
+
+#bokeh
+import bokeh
+from bokeh.document import Document
+from bokeh.io.doc import set_curdoc
+from bokeh.models import ColumnDataSource, Button, Select, DatePicker, RangeSlider
+from bokeh.events import ButtonClick
+
+from scripts.store import VDSStore, MANIFEST
+from scripts.sensors import load_sensor_index
+from scripts.state import DashboardState
+from scripts.cache import selection_cache
+from scripts.prepare import DOW_NAMES
+from scripts.histogram import metric_histograms, device_means
+from scripts.synthetic import SYNTHETIC_SCALES, write_synthetic_data
+from scripts.select import METRICS, rtdap_avg, filter_selection, summarize_selection, vbar_chart, hbar_chart,\
+                           hbar_data, compute_selection, selection_tab
+
+#stages timed for every selection, in report order
+STAGES = ['filter_selection', 'filter_cells', 'rtdap_avg', 'summarize_metrics', 'device_means',
+          'metric_histograms', 'vbar_chart', 'hbar_chart', 'compute_selection', 'submit_selection']
+
+#seconds to wait for a submitted selection to reach the session document
+SUBMIT_TIMEOUT = 120
+
+def benchmark_data(scale, seed=0, data_dir=os.path.join('data', 'benchmark')):
+
+    """
+    returns the data directory of a synthetic scale, generating it on first use
+
+    Keyword arguments:
+    scale -- SYNTHETIC_SCALES name
+    seed -- random seed of the generated data
+    data_dir -- directory holding the generated data directories
+    """
+
+    corridors, devices_per_corridor, years, start_year = SYNTHETIC_SCALES[scale]
+    scale_dir = os.path.join(data_dir, '%s-%d' % (scale, seed))
+
+    if not os.path.exists(os.path.join(scale_dir, 'vds_store', MANIFEST)):
+        write_synthetic_data(scale_dir, corridors, devices_per_corridor, years, start_year, seed)
+
+    return scale_dir
+
+def random_selections(store, count, seed=0):
+
+    """
+    returns list of (corridor, start date, end date, day of week, time of day) selections
+    drawn from the corridors and years of a store
+
+    Keyword arguments:
+    store -- VDSStore the selections are made against
+    count -- number of selections
+    seed -- random seed
+    """
+
+    rng = np.random.RandomState(seed)
+    corridors, years = store.corridors(), store.years()
+
+    selections = []
+    for i in range(count):
+        start = date(int(rng.choice(years)), 1, 1) + timedelta(days=int(rng.randint(0, 365)))
+        end = start + timedelta(days=int(rng.choice([7, 30, 90, 365, 365 * len(years)])))
+        tod_start = int(rng.randint(1, 9))
+        selections.append((str(rng.choice(corridors)), str(start), str(end),
+                           str(rng.choice(['All'] + DOW_NAMES)),
+                           (tod_start, int(rng.randint(tod_start, 9)))))
+
+    return selections
+
+def timed(func, *args):
+
+    """
+    returns (result, seconds) of a call
+    """
+
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+def traced(func, *args):
+
+    """
+    returns (result, peak bytes allocated by python) of a call
+    """
+
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result, peak
+
+class SessionDriver(object):
+
+    """
+    selection tab of a headless session document, driven the way a browser would:
+    set the widgets, click Select Subset, then run the document callbacks the
+    selection schedules once its result is computed
+
+    Keyword arguments:
+    state -- DashboardState shared with the session
+    """
+
+    def __init__(self, state):
+
+        self.doc = Document()
+        set_curdoc(self.doc)
+        self.doc.add_root(selection_tab(state))
+
+        self.button = list(self.doc.select({'type': Button}))[0]
+        selects = dict((s.title, s) for s in self.doc.select({'type': Select}))
+        self.corridor = selects['Corridor:']
+        self.day_of_week = selects['Day of Week:']
+        self.dates = list(self.doc.select({'type': DatePicker}))
+        self.time_of_day = list(self.doc.select({'type': RangeSlider}))[0]
+
+    def submit(self, corr, date_s, date_e, weekday, tod):
+
+        """
+        submits a selection and applies its result to the document; returns seconds from
+        the click until the result has been applied
+        """
+
+        self.corridor.value = corr
+        self.dates[0].value, self.dates[1].value = date_s, date_e
+        self.day_of_week.value = weekday
+        self.time_of_day.value = tod
+
+        start = time.perf_counter()
+        self.button._trigger_event(ButtonClick(self.button))
+
+        #the selection is applied by the first callback scheduled; run it and any it schedules
+        applied = False
+        while not applied or len(self.doc.session_callbacks):
+            if time.perf_counter() - start > SUBMIT_TIMEOUT:
+                raise RuntimeError('selection not applied within %d seconds' % SUBMIT_TIMEOUT)
+            callbacks = list(self.doc.session_callbacks)
+            for callback in callbacks:
+                self.doc.remove_next_tick_callback(callback)
+                callback.callback()
+            applied = applied or len(callbacks) > 0
+            if not applied:
+                time.sleep(0.0005)
+
+        return time.perf_counter() - start
+
+def selection_stages(state, driver, corr, date_s, date_e, weekday, tod):
+
+    """
+    returns dictionary of stage -> seconds for one selection
+
+    Keyword arguments:
+    state -- DashboardState the selection is made against
+    driver -- SessionDriver used for the end to end submit_selection stage
+    corr, date_s, date_e, weekday, tod -- the selection
+    """
+
+    seconds = {}
+
+    corr_index = state.corridor_index(corr)
+    filtered, seconds['filter_selection'] = timed(filter_selection, corr_index, corr, date_s, date_e, weekday, tod)
+    cells, seconds['filter_cells'] = timed(filter_selection, state.cube_index, corr, date_s, date_e, weekday, tod)
+
+    seconds['rtdap_avg'] = timed(lambda: [rtdap_avg(state.baselines, corr, col) for col, label, missing in METRICS])[1]
+
+    #the summary compute_selection() ships, including the coverage lookup of absent sensor-hours
+    summary, seconds['summarize_metrics'] = timed(summarize_selection, state, cells, corr, date_s, date_e, weekday, tod)
+
+    devices, full_means = state.device_baselines(corr)
+    selected_means, seconds['device_means'] = timed(device_means, filtered, devices)
+    hist_data, seconds['metric_histograms'] = timed(metric_histograms, devices, full_means, filtered, None,
+                                                    [col for col, label, missing in METRICS], selected_means)
+
+    seconds['vbar_chart'] = timed(lambda: [vbar_chart(ColumnDataSource(data=hist_data[col]), label)
+                                           for col, label, missing in METRICS])[1]
+    seconds['hbar_chart'] = timed(hbar_chart, ColumnDataSource(data=hbar_data(summary, 'Mean Diff')), 'Mean Diff')[1]
+
+    seconds['compute_selection'] = timed(compute_selection, state, corr, date_s, date_e, weekday, tod)[1]
+
+    selection_cache.clear()
+    seconds['submit_selection'] = driver.submit(corr, date_s, date_e, weekday, tod)
+
+    return seconds
+
+def summarize_seconds(values):
+
+    """
+    returns dictionary of latency percentiles, mean and max in milliseconds
+    """
+
+    ms = np.asarray(values) * 1000.0
+
+    return {'p50': float(np.percentile(ms, 50)),
+            'p90': float(np.percentile(ms, 90)),
+            'p99': float(np.percentile(ms, 99)),
+            'mean': float(ms.mean()),
+            'max': float(ms.max()),
+            'runs': int(len(ms))}
+
+def git_revision():
+
+    """
+    returns the short git hash of the working tree, or 'unknown' outside a git checkout
+    """
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_benchmark(scale, runs=50, warmup=5, seed=0, data_dir=os.path.join('data', 'benchmark')):
+
+    """
+    returns benchmark results of the selection pipeline on a synthetic scale: load time,
+    per stage latency percentiles over random selections, and per stage peak python memory
+
+    Keyword arguments:
+    scale -- SYNTHETIC_SCALES name
+    runs -- timed selections
+    warmup -- untimed selections run first
+    seed -- random seed of the data and the selections
+    data_dir -- directory holding the generated data directories
+    """
+
+    scale_dir, generate_seconds = timed(benchmark_data, scale, seed, data_dir)
+
+    store = VDSStore(os.path.join(scale_dir, 'vds_store'))
+    (state, load_peak), load_seconds = timed(traced, lambda: DashboardState(store, sensors=load_sensor_index(scale_dir)))
+    warm_seconds = timed(state.warm)[1]
+
+    driver = SessionDriver(state)
+    selections = random_selections(store, warmup + runs, seed)
+
+    for selection in selections[:warmup]:
+        selection_stages(state, driver, *selection)
+
+    #latency runs without tracing, then one traced run per stage for peak memory
+    timings = dict((stage, []) for stage in STAGES)
+    for selection in selections[warmup:]:
+        for stage, seconds in selection_stages(state, driver, *selection).items():
+            timings[stage].append(seconds)
+
+    corr, date_s, date_e, weekday, tod = selections[-1]
+    corr_index = state.corridor_index(corr)
+    filtered = filter_selection(corr_index, corr, date_s, date_e, weekday, tod)
+    devices, full_means = state.device_baselines(corr)
+    peaks = {'filter_selection': traced(filter_selection, corr_index, corr, date_s, date_e, weekday, tod)[1],
+             'device_means': traced(device_means, filtered, devices)[1],
+             'metric_histograms': traced(metric_histograms, devices, full_means, filtered)[1],
+             'compute_selection': traced(compute_selection, state, corr, date_s, date_e, weekday, tod)[1]}
+    selection_cache.clear()
+    peaks['submit_selection'] = traced(driver.submit, *selections[-1])[1]
+
+    return {'scale': scale,
+            'seed': seed,
+            'revision': git_revision(),
+            'timestamp': pd.Timestamp.now().isoformat(),
+            'versions': {'python': platform.python_version(), 'numpy': np.__version__,
+                         'pandas': pd.__version__, 'bokeh': bokeh.__version__},
+            'store': {'rows': store.manifest['rows'], 'corridors': len(store.corridors()),
+                      'years': len(store.years())},
+            'setup_seconds': {'generate': generate_seconds, 'load': load_seconds, 'warm': warm_seconds},
+            'load_peak_mb': load_peak / 1024.0**2,
+            'latency_ms': dict((stage, summarize_seconds(timings[stage])) for stage in STAGES),
+            'peak_mb': dict((stage, peak / 1024.0**2) for stage, peak in peaks.items())}
+
+def print_results(results):
+
+    """
+    prints a benchmark result table
+    """
+
+    print('%s  %s  %s rows  (revision %s)' % (results['scale'], results['timestamp'],
+                                              '{0:,}'.format(results['store']['rows']), results['revision']))
+    print('load %.2fs  warm %.2fs  load peak %.1f MB' % (results['setup_seconds']['load'],
+                                                          results['setup_seconds']['warm'], results['load_peak_mb']))
+    print('%-20s %10s %10s %10s %10s %10s %10s' % ('stage', 'p50 ms', 'p90 ms', 'p99 ms', 'mean ms', 'max ms', 'peak MB'))
+    for stage in STAGES:
+        latency = results['latency_ms'][stage]
+        peak = results['peak_mb'].get(stage)
+        print('%-20s %10.2f %10.2f %10.2f %10.2f %10.2f %10s' % (stage, latency['p50'], latency['p90'], latency['p99'],
+                                                                 latency['mean'], latency['max'],
+                                                                 '-' if peak is None else '%.1f' % peak))
+
+def compare_results(base, new):
+
+    """
+    prints the ratio of each stage's latency and peak memory between two saved results
+
+    Keyword arguments:
+    base -- results of the baseline revision
+    new -- results of the revision compared against it
+    """
+
+    print('%s (%s) -> %s (%s), %s' % (base['revision'], base['timestamp'], new['revision'], new['timestamp'], new['scale']))
+    print('%-20s %10s %10s %10s' % ('stage', 'p50', 'p99', 'peak'))
+    for stage in STAGES:
+        ratios = []
+        for metric in ['p50', 'p99']:
+            ratios.append(new['latency_ms'][stage][metric] / max(base['latency_ms'][stage][metric], 1e-9))
+        if stage in base['peak_mb'] and stage in new['peak_mb']:
+            ratios.append(new['peak_mb'][stage] / max(base['peak_mb'][stage], 1e-9))
+        print('%-20s ' % stage + ' '.join('%9.2fx' % r for r in ratios))
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='benchmark the selection pipeline on synthetic vds data')
+    parser.add_argument('scales', nargs='*',
+                        help='synthetic data scales to run: %s (default: corridor-year)' % ', '.join(sorted(SYNTHETIC_SCALES)))
+    parser.add_argument('--runs', type=int, default=50, help='timed selections per scale')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed selections run first')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the data and the selections')
+    parser.add_argument('--data', default=os.path.join('data', 'benchmark'), help='directory of the generated data')
+    parser.add_argument('--results', default=os.path.join('data', 'benchmark', 'results'),
+                        help='directory the results json files are saved to')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two saved results files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as base, open(args.compare[1]) as new:
+            compare_results(json.load(base), json.load(new))
+        return
+
+    scales = args.scales or ['corridor-year']
+    for scale in scales:
+        if scale not in SYNTHETIC_SCALES:
+            parser.error('unknown scale %s' % scale)
+
+    if not os.path.exists(args.results):
+        os.makedirs(args.results)
+
+    for scale in scales:
+        results = run_benchmark(scale, args.runs, args.warmup, args.seed, args.data)
+        print_results(results)
+
+        path = os.path.join(args.results, '%s-%s-%d.json' % (results['revision'], scale, args.seed))
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('saved %s' % path)
+
+if __name__ == '__main__':
+    main()
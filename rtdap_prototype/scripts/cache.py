@@ -0,0 +1,139 @@
+#libraries
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import numpy as np
+
+def selection_key(data_key, corr, date_s, date_e, weekday, tod):
+
+    """
+    returns a normalized, hashable key for a data selection
+
+    Keyword arguments:
+    data_key -- identifies the data the selection is made against (store fingerprint)
+    corr -- corridor name
+    date_s -- start date
+    date_e -- end date
+    weekday -- day of week (Monday - Friday, or All)
+    tod -- time of day (8 tod time periods)
+    """
+
+    return (data_key, str(corr),
+            pd.Timestamp(str(date_s)).strftime('%Y-%m-%d'),
+            pd.Timestamp(str(date_e)).strftime('%Y-%m-%d'),
+            str(weekday), (int(tod[0]), int(tod[1])))
+
+def result_size(value):
+
+    """
+    returns approximate memory used by a cached result in bytes
+
+    Keyword arguments:
+    value -- dataframe, array, string or (nested) dict / list of them
+    """
+
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(result_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(result_size(v) for v in value)
+
+    return sys.getsizeof(value)
+
+class SelectionCache(object):
+
+    """
+    thread safe least recently used cache of selection results, shared by every
+    session in the server process
+
+    Keyword arguments:
+    max_mb -- memory cap in megabytes; least recently used results are evicted above it
+    """
+
+    def __init__(self, max_mb=256):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+
+        """
+        returns cached result for key, or None
+        """
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+
+        """
+        stores result for key, evicting least recently used results over the memory cap
+        """
+
+        size = result_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.sizes.pop(key)
+                del self.entries[key]
+
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                old_key, _ = self.entries.popitem(last=False)
+                self.total_bytes -= self.sizes.pop(old_key)
+
+    def get_or_compute(self, key, compute):
+
+        """
+        returns cached result for key, calling compute() and caching its result on a miss
+        """
+
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+
+        """
+        returns dictionary of hit, miss, entry and memory counts
+        """
+
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self.entries), 'mb': self.total_bytes / 1024.0**2,
+                    'max_mb': self.max_bytes / 1024.0**2}
+
+#shared by all sessions; size cap set with the RTDAP_CACHE_MB environment variable
+selection_cache = SelectionCache(max_mb=float(os.environ.get('RTDAP_CACHE_MB', 256)))
@@ -0,0 +1,151 @@
+#libraries
+import os
+import pandas as pd
+import numpy as np
+
+#bokeh
+from bokeh.models import CustomJS
+
+from scripts.prepare import METRIC_COLUMNS, MISSING_COLUMNS, DOW_NAMES
+
+#summarize selections in the browser from the selected corridor's cube cells, so date, day of
+#week and time of day changes need no server work; set with RTDAP_CLIENT_FILTER=1
+CLIENT_FILTER = os.environ.get('RTDAP_CLIENT_FILTER', '0') == '1'
+
+DAY_NS = 24 * 3600 * 10**9
+
+#recomputes the summary table and mean difference chart of select.summarize_metrics(),
+#table_data() and hbar_data() from the cube cells matching the widget values
+SUMMARY_JS = """
+function day(value) {
+    var ms = (typeof value === 'number') ? value : Date.parse(value);
+    return Math.floor(ms / 86400000);
+}
+
+var cells = cube.data;
+var start = day(date_start.value), end = day(date_end.value);
+var all_days = day_of_week.value === 'All';
+var dow = dows.indexOf(day_of_week.value);
+var tod_s = time_of_day.value[0], tod_e = time_of_day.value[1];
+
+var matched = 0, rows = 0;
+var sums = [0, 0, 0], counts = [0, 0, 0], missing = [0, 0, 0];
+for (var i = 0; i < cells.date.length; i++) {
+    if (cells.date[i] < start || cells.date[i] > end) continue;
+    if (!all_days && cells.dow[i] !== dow) continue;
+    if (cells.hour[i] < tod_s || cells.hour[i] > tod_e) continue;
+
+    //cells of sensor-hours without any record only add to the missing values
+    matched += cells.rows[i] > 0 ? 1 : 0;
+    rows += cells.rows[i];
+    for (var m = 0; m < metrics.length; m++) {
+        sums[m] += cells[metrics[m] + '_sum'][i];
+        counts[m] += cells[metrics[m] + '_count'][i];
+        missing[m] += cells[missing_columns[m]][i] + cells.absent[i];
+    }
+}
+
+var zero = function(v) { return isFinite(v) ? v : 0; };
+var table_data = {'attribute': [], 'Frequency': [], 'Mean': [], 'Mean Diff': [], 'Missing Values': []};
+var bar_data = {'type': [], 'order': [], 'color': [], 'Mean Diff': []};
+
+if (matched > 0) {
+    var diffs = [];
+    for (var m = 0; m < metrics.length; m++) {
+        var mean = counts[m] > 0 ? sums[m] / counts[m] : NaN;
+        diffs.push(zero((baseline.data.avg[m] - mean) / mean));
+
+        table_data['attribute'].push(labels[m]);
+        table_data['Frequency'].push(rows);
+        table_data['Mean'].push(zero(mean));
+        table_data['Mean Diff'].push(diffs[m]);
+        table_data['Missing Values'].push(missing[m]);
+    }
+
+    //Volume, Occupancy, Speed from the bottom of the chart
+    for (var m = metrics.length - 1; m >= 0; m--) {
+        var diff = diffs[m];
+        bar_data['type'].push(labels[m]);
+        bar_data['order'].push(metrics.length - 1 - m);
+        bar_data['color'].push(diff < -.05 ? '#FF0000' : (diff > .05 ? '#008000' : '#C0C0C0'));
+        bar_data['Mean Diff'].push(diff);
+    }
+}
+
+table.data = table_data;
+bar.data = bar_data;
+"""
+
+def client_cube_data(cube_index, corr, dows, coverage=None):
+
+    """
+    returns column data of a corridor's aggregate cube cells as typed arrays: days since
+    1970-01-01, day of week code, time of day period, row count, per metric sums, non-missing
+    counts and missing flag counts, and expected sensor-hours without a record
+
+    Keyword arguments:
+    cube_index -- SelectionIndex of the aggregate cube
+    corr -- corridor name
+    dows -- day of week names, in the order of the day of week codes
+    coverage -- CoverageIndex of the store, None when there is none
+    """
+
+    cells = cube_index.corridor_rows(corr)
+    if coverage is None:
+        cells = cells.assign(absent=0)
+    else:
+        #cells with no record at all are added with only their absent sensor-hours
+        cells = cells.drop(columns=['corridor']).merge(coverage.absent_cells(corr), on=['date','hour'], how='outer')
+        weekdays = np.array(DOW_NAMES + ['Saturday','Sunday'])[cells['date'].dt.dayofweek.values]
+        cells['dow'] = cells['dow'].astype(object).where(cells['rows'].notnull(), weekdays)
+        cells = cells.fillna(0)
+
+    data = {'date': (np.asarray(cells['date'].values, dtype='datetime64[ns]').view(np.int64) // DAY_NS).astype(np.int32),
+            'dow': pd.Categorical(cells['dow'].astype(str), categories=dows).codes.astype(np.int8),
+            'hour': cells['hour'].values.astype(np.int8),
+            'rows': cells['rows'].values.astype(np.int32)}
+
+    #sums as float32 halve the payload; a cell sums at most a few thousand readings
+    for col in METRIC_COLUMNS:
+        data[col + '_sum'] = cells[col + '_sum'].values.astype(np.float32)
+        data[col + '_count'] = cells[col + '_count'].values.astype(np.int32)
+    for col in MISSING_COLUMNS:
+        data[col] = cells[col].values.astype(np.int32)
+    data['absent'] = cells['absent'].values.astype(np.int32)
+
+    return data
+
+def client_baseline_data(means):
+
+    """
+    returns column data of a corridor's long-run metric means, in METRIC_COLUMNS order
+
+    Keyword arguments:
+    means -- long-run means of the corridor, one per metric column
+    """
+
+    return {'metric': list(METRIC_COLUMNS), 'avg': np.asarray(means, dtype=np.float64)}
+
+def summary_callback(cube, baseline, table, bar, date_start, date_end, day_of_week, time_of_day, dows, labels):
+
+    """
+    returns CustomJS callback recomputing the summary table and mean difference chart in the browser
+
+    Keyword arguments:
+    cube -- ColumnDataSource of client_cube_data()
+    baseline -- ColumnDataSource of client_baseline_data()
+    table -- ColumnDataSource of the summary table
+    bar -- ColumnDataSource of the mean difference chart
+    date_start, date_end -- start and end DatePickers
+    day_of_week -- day of week Select
+    time_of_day -- time of day RangeSlider
+    dows -- day of week names, in the order of the cube's day of week codes
+    labels -- metric labels, in METRIC_COLUMNS order
+    """
+
+    return CustomJS(args=dict(cube=cube, baseline=baseline, table=table, bar=bar,
+                              date_start=date_start, date_end=date_end,
+                              day_of_week=day_of_week, time_of_day=time_of_day,
+                              dows=list(dows), labels=list(labels),
+                              metrics=list(METRIC_COLUMNS), missing_columns=list(MISSING_COLUMNS)),
+                    code=SUMMARY_JS)
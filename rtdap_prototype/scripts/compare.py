@@ -0,0 +1,202 @@
+#libraries
+import pandas as pd
+import numpy as np
+
+from scripts.prepare import METRIC_COLUMNS, DOW_NAMES
+
+#columns of the device compare cells, and their keys below the corridor
+COMPARE_KEYS = ['FieldDeviceID','year','month','dow','hour']
+COMPARE_COLUMNS = ['corridor'] + COMPARE_KEYS + METRIC_COLUMNS
+
+#labels of the compared metrics, in METRIC_COLUMNS order
+COMPARE_LABELS = ['Speed','Occupancy','Volume']
+
+#month (1-12) to compare_tab season (1=Winter, 2=Fall, 3=Spring, 4=Summer)
+MONTH_SEASONS = np.array([1,1,3,3,3,4,4,4,2,2,2,1])
+
+#cells of a device-year: months x days of week x time of day periods
+MONTHS, DOWS, TODS = 12, len(DOW_NAMES), 8
+
+def compare_cells(df):
+
+    """
+    returns compare cells for vds detail rows: metric sums and non-missing metric counts
+    per (corridor, FieldDeviceID, year, month, dow, hour)
+
+    Keyword arguments:
+    df -- dataframe of prepared vds detail rows
+    """
+
+    df = df[COMPARE_COLUMNS].copy()
+    df['corridor'] = df['corridor'].astype(str)
+    df['FieldDeviceID'] = df['FieldDeviceID'].astype(str)
+
+    aggs = {}
+    for col in METRIC_COLUMNS:
+        df[col + '_sum'] = df[col].astype(np.float64)
+        df[col + '_count'] = df[col].notnull().astype(np.int32)
+        aggs[col + '_sum'] = 'sum'
+        aggs[col + '_count'] = 'sum'
+
+    return df.groupby(['corridor'] + COMPARE_KEYS, sort=False, observed=True).agg(aggs).reset_index()
+
+class CompareCube(object):
+
+    """
+    device level metric sums and counts held as dense (cells x devices * metrics) matrices,
+    one row per (year, month, dow, time of day) cell; a view of the data is a 0/1 weight per
+    cell, so any number of views are evaluated for every device in one matrix product
+
+    Keyword arguments:
+    cells -- dataframe of compare cells from compare_cells()
+    years -- years in the store
+    """
+
+    def __init__(self, cells, years):
+
+        self.years = sorted(int(y) for y in years)
+
+        #every (corridor, device) pair is one device of the cube
+        codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([cells['corridor'], cells['FieldDeviceID']]))
+        self.devices = pd.Index(pairs.get_level_values(1))
+        self.device_corridors = pd.Index(pairs.get_level_values(0))
+        self.corridors = sorted(self.device_corridors.unique())
+        self.corridor_codes = pd.Index(self.corridors).get_indexer(self.device_corridors)
+
+        year = pd.Index(self.years).get_indexer(cells['year'].astype(int))
+        dow = pd.Index(DOW_NAMES).get_indexer(cells['dow'].astype(str))
+        keep = (year >= 0) & (dow >= 0)
+
+        cell = (((year * MONTHS + cells['month'].values.astype(np.int64) - 1) * DOWS + dow) * TODS +
+                cells['hour'].values.astype(np.int64) - 1)[keep]
+        codes = codes[keep]
+
+        n_cells = len(self.years) * MONTHS * DOWS * TODS
+        n_columns = len(self.devices) * len(METRIC_COLUMNS)
+        positions = (cell[:, None] * n_columns + codes[:, None] * len(METRIC_COLUMNS) +
+                     np.arange(len(METRIC_COLUMNS))).ravel()
+
+        #float32 keeps statewide cubes small; sums of at most a few thousand readings per cell stay exact enough for means
+        self.sums = np.bincount(positions, weights=np.column_stack([cells[c + '_sum'].values[keep] for c in METRIC_COLUMNS]).ravel(),
+                                minlength=n_cells * n_columns).astype(np.float32).reshape(n_cells, n_columns)
+        self.counts = np.bincount(positions, weights=np.column_stack([cells[c + '_count'].values[keep] for c in METRIC_COLUMNS]).ravel(),
+                                  minlength=n_cells * n_columns).astype(np.float32).reshape(n_cells, n_columns)
+
+    def weights(self, view):
+
+        """
+        returns 0/1 weight of every cube cell for a view
+
+        Keyword arguments:
+        view -- dictionary of inclusive (start, end) ranges: year, season, month, dow (1-5) and tod (1-8)
+        """
+
+        def between(values, value_range):
+            return (values >= value_range[0]) & (values <= value_range[1])
+
+        months = np.arange(1, MONTHS + 1)
+        year_weights = between(np.array(self.years), view['year'])
+        month_weights = between(months, view['month']) & between(MONTH_SEASONS, view['season'])
+        dow_weights = between(np.arange(1, DOWS + 1), view['dow'])
+        tod_weights = between(np.arange(1, TODS + 1), view['tod'])
+
+        cells = (year_weights[:, None, None, None] & month_weights[None, :, None, None] &
+                 dow_weights[None, None, :, None] & tod_weights[None, None, None, :])
+
+        return cells.ravel().astype(np.float32)
+
+    def evaluate(self, views):
+
+        """
+        returns (sums, counts) arrays of shape (views x devices x metrics) for a list of views,
+        evaluated together in one pass over the cube
+
+        Keyword arguments:
+        views -- list of view dictionaries (see weights())
+        """
+
+        weights = np.vstack([self.weights(view) for view in views])
+        shape = (len(views), len(self.devices), len(METRIC_COLUMNS))
+
+        return (weights @ self.sums).reshape(shape), (weights @ self.counts).reshape(shape)
+
+def view_means(sums, counts):
+
+    """
+    returns means of metric sums and counts, NaN where there are no readings
+    """
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def compare_deltas(cube, first, second):
+
+    """
+    returns dictionary of 'corridors' and 'devices' dataframes of each view's metric means
+    and the change from the first view to the second
+
+    Keyword arguments:
+    cube -- CompareCube the views were evaluated on
+    first -- (sums, counts) of the first view, each (devices x metrics)
+    second -- (sums, counts) of the second view, each (devices x metrics)
+    """
+
+    def corridor_totals(values):
+        return np.column_stack([np.bincount(cube.corridor_codes, weights=values[:, j], minlength=len(cube.corridors))
+                                for j in range(values.shape[1])])
+
+    def delta_frame(index, means_1, means_2):
+        df = pd.DataFrame(index=index)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for j, label in enumerate(COMPARE_LABELS):
+                df[label + ' 1'] = means_1[:, j]
+                df[label + ' 2'] = means_2[:, j]
+                df[label + ' Diff'] = means_2[:, j] - means_1[:, j]
+                df[label + ' % Diff'] = np.where(means_1[:, j] > 0, (means_2[:, j] - means_1[:, j]) / means_1[:, j], np.nan)
+        return df
+
+    corridors = delta_frame(pd.Index(cube.corridors, name='corridor'),
+                            view_means(corridor_totals(first[0]), corridor_totals(first[1])),
+                            view_means(corridor_totals(second[0]), corridor_totals(second[1])))
+
+    devices = delta_frame(pd.MultiIndex.from_arrays([cube.device_corridors, cube.devices],
+                                                    names=['corridor','FieldDeviceID']),
+                          view_means(*first), view_means(*second))
+
+    return {'corridors': corridors, 'devices': devices}
+
+class Comparison(object):
+
+    """
+    the two views of one compare_tab session; update() re-evaluates only the views whose
+    ranges changed since the last update, together in one pass over the cube
+
+    Keyword arguments:
+    cube -- CompareCube the views are evaluated on
+    views -- views already evaluated on the cube, e.g. by another session
+    totals -- (sums, counts) of those views
+    """
+
+    def __init__(self, cube, views=None, totals=None):
+
+        self.cube = cube
+        self.views = [dict(v) if v is not None else None for v in (views or [None, None])]
+        self.totals = list(totals or [None, None])
+
+    def update(self, views):
+
+        """
+        returns compare_deltas() of two views
+
+        Keyword arguments:
+        views -- [first view, second view] dictionaries (see CompareCube.weights())
+        """
+
+        changed = [i for i in range(2) if views[i] != self.views[i]]
+        if changed:
+            sums, counts = self.cube.evaluate([views[i] for i in changed])
+            for j, i in enumerate(changed):
+                self.views[i] = dict(views[i])
+                self.totals[i] = (sums[j], counts[j])
+
+        return compare_deltas(self.cube, self.totals[0], self.totals[1])
@@ -0,0 +1,282 @@
+#libraries
+import numpy as np
+
+#bokeh
+from bokeh.plotting import figure
+from bokeh.layouts import column, row
+from bokeh.models import Spacer, HoverTool, ColumnDataSource, RangeSlider, NumeralTickFormatter
+from bokeh.models.widgets import Div, Select, DataTable, TableColumn, NumberFormatter
+from bokeh.io import curdoc
+
+from scripts.state import as_state
+from scripts.compare import Comparison, COMPARE_LABELS
+from scripts.select import update_source
+from scripts.instrument import instrumented
+from scripts.cache import selection_cache
+
+#devices listed in the device table, largest change first
+TOP_DEVICES = 25
+
+def cached_comparison(state, views):
+
+    """
+    returns (Comparison evaluated for two views, its compare_deltas()); the evaluation is shared
+    through the selection cache, so sessions opening the tab with the same views against the
+    same data start from it instead of evaluating the cube again
+
+    Keyword arguments:
+    state -- DashboardState the views are evaluated against
+    views -- [first view, second view] dictionaries (see CompareCube.weights())
+    """
+
+    cube = state.compare_cube()
+
+    def compute():
+        engine = Comparison(cube)
+        deltas = engine.update(views)
+        return {'views': engine.views, 'totals': engine.totals, 'deltas': deltas}
+
+    key = ('compare', state.data_key) + tuple(tuple((k, tuple(v[k])) for k in sorted(v)) for v in views)
+    seed = selection_cache.get_or_compute(key, compute)
+
+    return Comparison(cube, seed['views'], seed['totals']), seed['deltas']
+
+def compare_tab(rtdap_data):
+
+    def corridor_data(deltas):
+        """
+        returns column data of the corridor table, every metric of both views
+
+        Keyword arguments:
+        deltas -- compare_deltas() results
+        """
+        corridors = deltas['corridors']
+        data = {'corridor': corridors.index.tolist()}
+        #copies, since deltas are shared through the selection cache and sources are patched in place
+        for col in corridors.columns:
+            data[col] = corridors[col].to_numpy(copy=True)
+        return data
+
+    def chart_data(deltas, label):
+        """
+        returns column data of the corridor chart: each corridor's change in a metric
+
+        Keyword arguments:
+        deltas -- compare_deltas() results
+        label -- metric label (Speed, Occupancy, Volume)
+        """
+        values = np.nan_to_num(deltas['corridors'][label + ' % Diff'].values)
+        return {'corridor': deltas['corridors'].index.tolist(),
+                'value': values,
+                'color': np.where(values >= 0, '#1a9850', '#d73027').tolist()}
+
+    def device_data(deltas, label):
+        """
+        returns column data of the device table: the devices with the largest change in a metric
+
+        Keyword arguments:
+        deltas -- compare_deltas() results
+        label -- metric label (Speed, Occupancy, Volume)
+        """
+        devices = deltas['devices']
+        change = devices[label + ' % Diff'].abs().values
+        top = np.argsort(-np.nan_to_num(change), kind='mergesort')[:TOP_DEVICES]
+        top = top[~np.isnan(change[top])]
+        return {'corridor': devices.index.get_level_values(0)[top].tolist(),
+                'FieldDeviceID': devices.index.get_level_values(1)[top].tolist(),
+                'first': devices[label + ' 1'].to_numpy(copy=True)[top],
+                'second': devices[label + ' 2'].to_numpy(copy=True)[top],
+                'change': devices[label + ' % Diff'].to_numpy(copy=True)[top]}
+
+    def corridor_table(source):
+        """
+        returns bokeh DataTable of both views' corridor means and their % difference
+        """
+        columns = [TableColumn(field='corridor', title='Corridor', width=150)]
+        for label in COMPARE_LABELS:
+            columns += [TableColumn(field=label + ' 1', title=label + ' 1', formatter=NumberFormatter(format='0,0.0')),
+                        TableColumn(field=label + ' 2', title=label + ' 2', formatter=NumberFormatter(format='0,0.0')),
+                        TableColumn(field=label + ' % Diff', title='% Diff', formatter=NumberFormatter(format='0.0%'))]
+
+        return DataTable(source=source, columns=columns, width=900, height=250,
+                         index_position=None, sortable=True, css_classes=["w3-small"])
+
+    def device_table(source):
+        """
+        returns bokeh DataTable of the devices with the largest change in the chart metric
+        """
+        columns = [TableColumn(field='corridor', title='Corridor', width=150),
+                   TableColumn(field='FieldDeviceID', title='Device', width=250),
+                   TableColumn(field='first', title='View 1', formatter=NumberFormatter(format='0,0.0')),
+                   TableColumn(field='second', title='View 2', formatter=NumberFormatter(format='0,0.0')),
+                   TableColumn(field='change', title='% Diff', formatter=NumberFormatter(format='0.0%'))]
+
+        return DataTable(source=source, columns=columns, width=700, height=250,
+                         index_position=None, sortable=True, css_classes=["w3-small"])
+
+    def corridor_chart(source, corridors):
+        """
+        returns bokeh horizontal barchart of each corridor's % difference from view 1 to view 2
+        """
+        hover = HoverTool(tooltips=[("Corridor", "@corridor"), ("% Difference", "@value{0.0%}")])
+        p = figure(plot_width=500, plot_height=max(175, 30 * len(corridors)), y_range=corridors,
+                   toolbar_location="above", title="View 2 vs View 1", tools=['reset', 'save', hover])
+
+        p.hbar(y='corridor', height=0.5, left=0, right='value', fill_color='color', line_color=None, source=source)
+
+        p.xaxis.formatter = NumeralTickFormatter(format="0.f%")
+        p.xgrid.visible = False
+        p.ygrid.visible = False
+        p.background_fill_alpha = 0.5
+        p.border_fill_color = None
+
+        return p
+
+
+
+    """
+    return comparison tab contents
+
+    Keyword arguments:
+    rtdap_data - DashboardState shared by the server's sessions (or a VDSStore / dataframe)
+                 containing rtdap vds detail data
+    """
+
+    state = as_state(rtdap_data)
+    doc = curdoc()
+
+    #this session's two views, and whether an update is scheduled for this tick
+    comparison = {'engine': None, 'deltas': None, 'pending': False}
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #update_comparison -- re-evaluates the views whose sliders moved, once per tick while dragging
+
+    def current_views():
+
+        """
+        returns the two view dictionaries of the current slider values
+        """
+
+        return [{'year': year_v1.value, 'season': season_v1.value, 'month': month_v1.value,
+                 'dow': week_v1.value, 'tod': time_of_day_v1.value},
+                {'year': year_v2.value, 'season': season_v2.value, 'month': month_v2.value,
+                 'dow': week_v2.value, 'tod': time_of_day_v2.value}]
+
+    def view_changed(attr, old, new):
+
+        """
+        schedules one comparison update for the slider changes of the current tick
+        """
+
+        if not comparison['pending']:
+            comparison['pending'] = True
+            doc.add_next_tick_callback(update_comparison)
+
+    @instrumented(doc)
+    def update_comparison():
+
+        """
+        evaluates the changed views against the latest compare cube and updates the tables and chart
+        """
+
+        comparison['pending'] = False
+
+        cube = state.compare_cube()
+        if comparison['engine'].cube is not cube:
+            comparison['engine'] = Comparison(cube)
+            chart.y_range.factors = cube.corridors
+
+        comparison['deltas'] = comparison['engine'].update(current_views())
+        update_source(corridor_src, corridor_data(comparison['deltas']))
+        show_metric()
+
+    def show_metric():
+
+        """
+        shows the chart metric's corridor and device changes from the latest comparison
+        """
+
+        update_source(chart_src, chart_data(comparison['deltas'], metric_select.value))
+        update_source(device_src, device_data(comparison['deltas'], metric_select.value))
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #Comparison Panel
+
+    panel_title = Div(text="[Corridor Comparison]", css_classes = ["panel-title","text-center"])
+    panel_text = Div(text="""Compare corridor and detector means between two views of the data.
+           Each view is set by its own year, season, month, day of week and time of day ranges;
+           moving a slider updates only its view.""", css_classes = ["panel-content"])
+
+    years = state.store.years()
+    #Date Range
+    date_range = Div(text="Data References:<br>%d - %d" % (years[0], years[-1]),
+                     css_classes = ["panel-content","text-center"])
+
+
+    #Panel Buttons
+    year_text = Div(text="<b>Year:", height=10)
+    year_v1 = RangeSlider(start = years[0], end= max(years[-1], years[0] + 1),step=1, value=(years[0], years[-1]), height=25,
+                            bar_color="black",title = "View 1")
+    year_v2 = RangeSlider(start = years[0], end= max(years[-1], years[0] + 1),step=1, value=(years[0], years[-1]), height=25,
+                            bar_color="black",title = "View 2")
+
+    season_text = Div(text="<b>Season</b><br> (1=Winter, 2=Fall, 3=Spring, 4=Summer):", height=25)
+    season_v1 = RangeSlider(start = 1, end= 4,step=1, value=(1, 2), height=25,
+                            bar_color="black",title = "View 1")
+    season_v2 = RangeSlider(start = 1, end= 4,step=1, value=(3, 4), height=25,
+                            bar_color="black",title = "View 2")
+
+    month_text = Div(text="<b>Month:", height=10)
+    month_v1 = RangeSlider(start = 1, end= 12,step=1, value=(1, 12), height=25,
+                            bar_color="black",title = "View 1")
+    month_v2 = RangeSlider(start = 1, end= 12,step=1, value=(1, 12), height=25,
+                            bar_color="black",title = "View 2")
+
+    week_text = Div(text="<b>Day of Week:", height=10)
+    week_v1 = RangeSlider(start = 1, end= 5,step=1, value=(1, 5), height=25,
+                            bar_color="black",title = "View 1")
+    week_v2 = RangeSlider(start = 1, end= 5,step=1, value=(1, 5), height=25,
+                            bar_color="black",title = "View 2")
+
+    #time of day periods of the store (see the Data Selection tab), not clock hours
+    time_of_day_text = Div(text="<b>Time of Day:", height=10)
+    time_of_day_v1 = RangeSlider(start = 1, end= 8,step=1, value=(1, 8),
+                       bar_color="black", height=25)
+    time_of_day_v2 = RangeSlider(start = 1, end= 8,step=1, value=(1, 8),
+                        bar_color="black", height=25)
+
+    metric_select = Select(options=COMPARE_LABELS, title = "Chart Metric:", value = "Speed", height=60)
+
+    for slider in [year_v1, year_v2, season_v1, season_v2, month_v1, month_v2,
+                   week_v1, week_v2, time_of_day_v1, time_of_day_v2]:
+        slider.on_change('value', view_changed)
+    metric_select.on_change('value', lambda attr, old, new: show_metric())
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #Create initial content
+
+    comparison['engine'], comparison['deltas'] = cached_comparison(state, current_views())
+
+    corridor_src = ColumnDataSource(data = corridor_data(comparison['deltas']))
+    chart_src = ColumnDataSource(data = chart_data(comparison['deltas'], metric_select.value))
+    device_src = ColumnDataSource(data = device_data(comparison['deltas'], metric_select.value))
+
+    title = Div(text="<h1>Corridor Comparison</h1>", width=1000, css_classes=["w3-panel", "w3-white"])
+    chart = corridor_chart(chart_src, comparison['engine'].cube.corridors)
+
+    return row(column(panel_title, panel_text, date_range,
+                              year_text, year_v1, year_v2, Spacer(height=25),
+                              season_text, season_v1, season_v2, Spacer(height=25),
+                              month_text, month_v1, month_v2, Spacer(height=25),
+                              week_text, week_v1, week_v2, Spacer(height=25),
+                              time_of_day_text, time_of_day_v1, time_of_day_v2, Spacer(height=25),
+                              metric_select,
+                             height = 1000, css_classes = ["panel","col-lg-4"]),
+                      column(title,
+                             row(chart, css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             Spacer(height=10),
+                             row(corridor_table(corridor_src), css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             Spacer(height=10),
+                             row(device_table(device_src), css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             css_classes = ["container-fluid","col-lg-8"]),
+                      css_classes = ["container-fluid","col-lg-12"])
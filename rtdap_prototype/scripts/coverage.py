@@ -0,0 +1,420 @@
+#libraries
+import os
+import pandas as pd
+import numpy as np
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from scripts.prepare import TOD_BUCKETS, DOW_NAMES, CLOCK_HOUR
+
+COVERAGE_FILE = '_coverage.parquet'
+COVERAGE_COLUMNS = ['FieldDeviceID','corridor','date',CLOCK_HOUR]
+
+#the 24 hours of a day are packed into 3 bytes, so whole days are byte aligned
+DAY_BYTES = 3
+
+#set bits in each byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+#the extract keeps weekday rows only, so only weekday hours are expected
+WEEKDAYS = len(DOW_NAMES)
+
+DAY_NS = 24 * 3600 * 10**9
+
+def day_numbers(dates, start):
+
+    """
+    returns days since start of each date
+
+    Keyword arguments:
+    dates -- array of dates
+    start -- numpy datetime64[D] first day of the bitmaps
+    """
+
+    return (np.asarray(dates, dtype='datetime64[D]') - start).astype(np.int64)
+
+def tod_mask(tod):
+
+    """
+    returns the packed 3 byte day mask of the clock hours in a time of day period range
+
+    Keyword arguments:
+    tod -- (first, last) time of day period
+    """
+
+    return np.packbits((TOD_BUCKETS >= int(tod[0])) & (TOD_BUCKETS <= int(tod[1])))
+
+def device_spans(present):
+
+    """
+    returns (first, last) day each detector reported, -1 for detectors without a report
+
+    Keyword arguments:
+    present -- (detectors x days x DAY_BYTES) packed hourly bits
+    """
+
+    reported = present.any(axis=2)
+    any_day = reported.any(axis=1)
+    first = np.where(any_day, reported.argmax(axis=1), -1)
+    last = np.where(any_day, reported.shape[1] - 1 - reported[:, ::-1].argmax(axis=1), -1)
+
+    return first, last
+
+class CoverageIndex(object):
+
+    """
+    packed bitmaps of the hours each detector reported: one bit per (FieldDeviceID, date, clock hour)
+    from the start day, 3 bytes per day. a detector is expected to report every weekday hour from
+    the first to the last day it reported, so an expected hour without a bit is a sensor-hour the
+    extract has no record of; coverage and gap queries are bitwise operations over the bitmaps
+
+    Keyword arguments:
+    devices -- dataframe of FieldDeviceID and corridor per detector, in bitmap row order
+    start -- numpy datetime64[D] first day of the bitmaps
+    present -- (detectors x days x DAY_BYTES) uint8 array of packed hourly bits
+    """
+
+    def __init__(self, devices, start, present):
+
+        self.devices = devices[['FieldDeviceID','corridor']].reset_index(drop=True)
+        self.start = np.datetime64(start, 'D')
+        self.present = present
+        self.days = present.shape[1]
+        self.first, self.last = device_spans(present)
+
+        #1970-01-01 was a Thursday
+        self.dow = (day_numbers([self.start], np.datetime64('1970-01-01', 'D'))[0] + 3 + np.arange(self.days)) % 7
+
+        self.rows = dict((c, np.flatnonzero(self.devices['corridor'].values == c))
+                         for c in pd.unique(self.devices['corridor']))
+
+    def day_range(self, date_s, date_e):
+
+        """
+        returns (first, end) day numbers of a date range, clipped to the bitmaps
+        """
+
+        first = pd.Timestamp(date_s).value // DAY_NS - self.start.astype(np.int64)
+        last = pd.Timestamp(date_e).value // DAY_NS - self.start.astype(np.int64)
+
+        return int(np.clip(first, 0, self.days)), int(np.clip(last + 1, 0, self.days))
+
+    def expected_days(self, rows, first, end, weekday):
+
+        """
+        returns (detectors x days) bool array of the days each detector is expected to report
+
+        Keyword arguments:
+        rows -- bitmap rows of the detectors
+        first, end -- day number range from day_range()
+        weekday -- day of week (Monday - Friday, or All)
+        """
+
+        days = np.arange(first, end)
+        if weekday == 'All':
+            on_day = self.dow[first:end] < WEEKDAYS
+        else:
+            on_day = self.dow[first:end] == DOW_NAMES.index(weekday)
+
+        return on_day[None, :] & (days[None, :] >= self.first[rows, None]) & (days[None, :] <= self.last[rows, None])
+
+    def coverage(self, corr, date_s, date_e, weekday='All', tod=(1, 8)):
+
+        """
+        returns dataframe of expected, present and missing sensor-hours and the share present,
+        per detector of a corridor selection
+
+        Keyword arguments:
+        corr -- corridor name
+        date_s -- start date
+        date_e -- end date
+        weekday -- day of week (Monday - Friday, or All)
+        tod -- (first, last) time of day period
+        """
+
+        rows = self.rows.get(corr, np.array([], dtype=np.int64))
+        first, end = self.day_range(date_s, date_e)
+        mask = tod_mask(tod)
+
+        expected_days = self.expected_days(rows, first, end, weekday)
+        present_hours = POPCOUNT[self.present[rows, first:end] & mask].sum(axis=2)
+
+        expected = expected_days.sum(axis=1) * POPCOUNT[mask].sum()
+        present = np.where(expected_days, present_hours, 0).sum(axis=1)
+
+        df = pd.DataFrame({'Expected': expected, 'Present': present, 'Missing': expected - present},
+                          index=pd.Index(self.devices['FieldDeviceID'].values[rows], name='FieldDeviceID'))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['Coverage'] = present / expected.astype(np.float64)
+
+        return df
+
+    def absent(self, corr, date_s, date_e, weekday='All', tod=(1, 8)):
+
+        """
+        returns number of expected sensor-hours of a corridor selection with no record
+        """
+
+        return int(self.coverage(corr, date_s, date_e, weekday, tod)['Missing'].sum())
+
+    def gap_bits(self, rows, first, end):
+
+        """
+        returns (detectors x hours) bool array of the expected hours without a record
+        """
+
+        present = np.unpackbits(self.present[rows, first:end], axis=2).astype(bool)
+        expected = self.expected_days(rows, first, end, 'All')
+
+        return (expected[:, :, None] & ~present).reshape(len(rows), -1)
+
+    def gaps(self, corr, date_s, date_e, min_hours=1):
+
+        """
+        returns dataframe of each run of consecutive expected hours without a record, per
+        detector of a corridor: FieldDeviceID, start and end hour, and hours
+
+        Keyword arguments:
+        corr -- corridor name
+        date_s -- start date
+        date_e -- end date
+        min_hours -- shortest run listed
+        """
+
+        rows = self.rows.get(corr, np.array([], dtype=np.int64))
+        first, end = self.day_range(date_s, date_e)
+
+        gap = self.gap_bits(rows, first, end).astype(np.int8)
+        edges = np.diff(np.pad(gap, ((0, 0), (1, 1))), axis=1)
+        device, starts = np.nonzero(edges == 1)
+        ends = np.nonzero(edges == -1)[1]
+
+        origin = (self.start + first).astype('datetime64[h]')
+        df = pd.DataFrame({'FieldDeviceID': self.devices['FieldDeviceID'].values[rows][device],
+                           'start': origin + starts,
+                           'end': origin + ends - 1,
+                           'hours': ends - starts})
+
+        return df.loc[df['hours'] >= min_hours].reset_index(drop=True)
+
+    def absent_cells(self, corr):
+
+        """
+        returns dataframe of expected sensor-hours with no record per (date, hour) time of
+        day period of a corridor, the cells of the aggregate cube
+
+        Keyword arguments:
+        corr -- corridor name
+        """
+
+        rows = self.rows.get(corr, np.array([], dtype=np.int64))
+        gap = self.gap_bits(rows, 0, self.days).reshape(len(rows), self.days, 24).sum(axis=0)
+
+        #clock hours summed into their time of day periods
+        periods = np.zeros((24, TOD_BUCKETS.max()), dtype=np.int64)
+        periods[np.arange(24), TOD_BUCKETS - 1] = 1
+        counts = gap @ periods
+
+        day, hour = np.nonzero(counts)
+        return pd.DataFrame({'date': (self.start + day).astype('datetime64[ns]'),
+                             'hour': (hour + 1).astype(np.int8),
+                             'absent': counts[day, hour].astype(np.int32)})
+
+def coverage_span(years):
+
+    """
+    returns (start day, number of days) of bitmaps covering whole years
+    """
+
+    start = np.datetime64('%d-01-01' % min(years), 'D')
+    end = np.datetime64('%d-01-01' % (max(years) + 1), 'D')
+
+    return start, int((end - start).astype(np.int64))
+
+def coverage_hours(df):
+
+    """
+    returns the detector, corridor, date and clock hour of vds detail rows
+
+    Keyword arguments:
+    df -- dataframe of prepared vds detail rows
+    """
+
+    hours = df[COVERAGE_COLUMNS].copy()
+    hours['FieldDeviceID'] = hours['FieldDeviceID'].astype(str)
+    hours['corridor'] = hours['corridor'].astype(str)
+
+    return hours
+
+def coverage_bits(batches, start, days):
+
+    """
+    returns CoverageIndex of the hours of detail row batches
+
+    Keyword arguments:
+    batches -- iterable of coverage_hours() dataframes
+    start -- numpy datetime64[D] first day of the bitmaps
+    days -- number of days of the bitmaps
+    """
+
+    #one unpacked hour array per detector while reading, packed at the end
+    bits, corridors = {}, {}
+    for hours in batches:
+        day = day_numbers(hours['date'].values, start)
+        keep = (day >= 0) & (day < days)
+        position = day[keep] * 24 + hours[CLOCK_HOUR].values[keep].astype(np.int64)
+
+        devices, device = np.unique(hours['FieldDeviceID'].values[keep], return_inverse=True)
+        corridor = hours['corridor'].values[keep]
+        order = np.argsort(device, kind='mergesort')
+        splits = np.cumsum(np.bincount(device, minlength=len(devices)))[:-1]
+
+        for d, positions in zip(devices, np.split(order, splits)):
+            if d not in bits:
+                bits[d] = np.zeros(days * 24, dtype=bool)
+                corridors[d] = corridor[positions[0]]
+            bits[d][position[positions]] = True
+
+    names = sorted(bits)
+    present = np.zeros((len(names), days, DAY_BYTES), dtype=np.uint8)
+    for i, d in enumerate(names):
+        present[i] = np.packbits(bits.pop(d).reshape(days, 24), axis=1)
+
+    return CoverageIndex(pd.DataFrame({'FieldDeviceID': names, 'corridor': [corridors[d] for d in names]}),
+                         start, present)
+
+def build_coverage(store):
+
+    """
+    returns the CoverageIndex of the store, built one record batch at a time; None for
+    stores written without clock hours
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    if CLOCK_HOUR not in store.columns():
+        return None
+
+    start, days = coverage_span(store.years())
+
+    return coverage_bits((coverage_hours(b) for b in store.iter_batches(columns=COVERAGE_COLUMNS)), start, days)
+
+def merge_coverage(coverage, other):
+
+    """
+    returns CoverageIndex of the hours present in either of two indexes
+
+    Keyword arguments:
+    coverage, other -- CoverageIndexes
+    """
+
+    start = min(coverage.start, other.start)
+    end = max(coverage.start + coverage.days, other.start + other.days)
+
+    devices = pd.concat([coverage.devices, other.devices]).drop_duplicates('FieldDeviceID')
+    devices = devices.sort_values('FieldDeviceID').reset_index(drop=True)
+    present = np.zeros((len(devices), int((end - start).astype(np.int64)), DAY_BYTES), dtype=np.uint8)
+
+    for index in [coverage, other]:
+        rows = pd.Index(devices['FieldDeviceID']).get_indexer(index.devices['FieldDeviceID'])
+        offset = int((index.start - start).astype(np.int64))
+        present[rows, offset:offset + index.days] |= index.present
+
+    return CoverageIndex(devices, start, present)
+
+def load_coverage(store):
+
+    """
+    returns the CoverageIndex of the store; read from the coverage file next to the store
+    while the store is unchanged, rebuilt and saved otherwise. None for stores written
+    without clock hours
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    fingerprint = store.fingerprint()
+    if fingerprint is None:
+        return build_coverage(store)
+
+    coverage = saved_coverage(store, fingerprint)
+    if coverage is not None:
+        return coverage
+
+    coverage = build_coverage(store)
+    if coverage is not None:
+        save_coverage(store, coverage)
+
+    return coverage
+
+def saved_coverage(store, fingerprint):
+
+    """
+    returns the CoverageIndex saved next to the store if it was built for the given store
+    fingerprint, None otherwise
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    fingerprint -- store fingerprint the coverage must match
+    """
+
+    path = os.path.join(store.root, COVERAGE_FILE)
+    if not os.path.exists(path):
+        return None
+
+    metadata = pq.read_schema(path).metadata or {}
+    if metadata.get(b'fingerprint', b'').decode() != fingerprint:
+        return None
+
+    df = pd.read_parquet(path)
+    start = np.datetime64(metadata[b'start'].decode(), 'D')
+    days = int(metadata[b'days'].decode())
+
+    present = np.frombuffer(b''.join(df['present'].values), dtype=np.uint8).reshape(len(df), days, DAY_BYTES)
+
+    return CoverageIndex(df, start, present.copy())
+
+def save_coverage(store, coverage):
+
+    """
+    saves the coverage bitmaps next to the store, one compressed row per detector, tagged
+    with the store's fingerprint
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    coverage -- CoverageIndex from build_coverage()
+    """
+
+    path = os.path.join(store.root, COVERAGE_FILE)
+    df = coverage.devices.assign(present=[row.tobytes() for row in coverage.present])
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {}, fingerprint=store.fingerprint(),
+                                               start=str(coverage.start), days=str(coverage.days)))
+
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+def append_coverage(store, previous_fingerprint, hours):
+
+    """
+    sets the bits of rows appended to the store in its saved coverage bitmaps. returns False,
+    leaving the coverage to be rebuilt on load, if the saved coverage was not built for the
+    store before the append
+
+    Keyword arguments:
+    store -- VDSStore after the append
+    previous_fingerprint -- fingerprint of the store before the append
+    hours -- coverage_hours() of the appended rows
+    """
+
+    coverage = saved_coverage(store, previous_fingerprint)
+    if coverage is None:
+        return False
+
+    start, days = coverage_span(store.years())
+    save_coverage(store, merge_coverage(coverage, coverage_bits([hours], start, days)))
+
+    return True
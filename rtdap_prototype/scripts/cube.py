@@ -0,0 +1,167 @@
+#libraries
+import os
+import pandas as pd
+import numpy as np
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from scripts.prepare import METRIC_COLUMNS, MISSING_COLUMNS
+
+CUBE_FILE = '_cube.parquet'
+CUBE_KEYS = ['corridor','date','dow','hour']
+
+def cube_cells(df):
+
+    """
+    returns cube cells for vds detail rows: row count, metric sums, non-missing metric
+    counts and missing flag counts per (corridor, date, dow, hour)
+
+    Keyword arguments:
+    df -- dataframe of prepared vds detail rows
+    """
+
+    #rows without a weekday are never selected from the detail rows (see SelectionIndex), so they are left out
+    df = df.loc[df['dow'].notnull(), CUBE_KEYS + METRIC_COLUMNS + MISSING_COLUMNS].copy()
+    df['corridor'] = df['corridor'].astype(str)
+    df['dow'] = df['dow'].astype(str)
+    df['rows'] = 1
+
+    aggs = {'rows': 'sum'}
+    for col in METRIC_COLUMNS:
+        df[col + '_sum'] = df[col].astype(np.float64)
+        df[col + '_count'] = df[col].notnull().astype(np.int32)
+        aggs[col + '_sum'] = 'sum'
+        aggs[col + '_count'] = 'sum'
+    for col in MISSING_COLUMNS:
+        aggs[col] = 'sum'
+
+    return df.groupby(CUBE_KEYS, sort=False).agg(aggs).reset_index()
+
+def sum_cells(cells):
+
+    """
+    returns cube cells with cells of the same (corridor, date, dow, hour) summed together
+
+    Keyword arguments:
+    cells -- dataframe of cube cells, possibly from several batches
+    """
+
+    cube = cells.groupby(CUBE_KEYS, sort=False, observed=True).sum().reset_index()
+
+    for col in ['rows'] + [c + '_count' for c in METRIC_COLUMNS] + MISSING_COLUMNS:
+        cube[col] = cube[col].astype(np.int32)
+    cube['corridor'] = cube['corridor'].astype(str)
+    cube['dow'] = cube['dow'].astype(str).astype('category')
+    cube['hour'] = cube['hour'].astype(np.int8)
+
+    return cube
+
+def build_cube(store):
+
+    """
+    returns the aggregate cube of the store, built one record batch at a time
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    cells = [cube_cells(batch) for batch in store.iter_batches(columns=CUBE_KEYS + METRIC_COLUMNS + MISSING_COLUMNS)]
+
+    #cells split across batches are summed back together
+    return sum_cells(pd.concat(cells, ignore_index=True))
+
+def load_cube(store):
+
+    """
+    returns the aggregate cube of the store; read from the cube file next to the store
+    while the store is unchanged, rebuilt and saved otherwise
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    fingerprint = store.fingerprint()
+    if fingerprint is None:
+        return build_cube(store)
+
+    cube = saved_cube(store, fingerprint)
+    if cube is not None:
+        return cube
+
+    cube = build_cube(store)
+    save_cube(store, cube)
+
+    return cube
+
+def saved_cube(store, fingerprint):
+
+    """
+    returns the cube saved next to the store if it was built for the given store
+    fingerprint, None otherwise
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    fingerprint -- store fingerprint the cube must match
+    """
+
+    path = os.path.join(store.root, CUBE_FILE)
+    if not os.path.exists(path):
+        return None
+
+    metadata = pq.read_schema(path).metadata or {}
+    if metadata.get(b'fingerprint', b'').decode() != fingerprint:
+        return None
+
+    #cubes saved before rows without a weekday were left out hold them as a 'nan' day of week
+    cube = pd.read_parquet(path)
+    if 'nan' in cube['dow'].astype(str).values:
+        return None
+
+    return cube
+
+def save_cube(store, cube):
+
+    """
+    saves the cube next to the store, tagged with the store's fingerprint
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    cube -- aggregate cube from build_cube()
+    """
+
+    path = os.path.join(store.root, CUBE_FILE)
+    table = pa.Table.from_pandas(cube, preserve_index=False)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {}, fingerprint=store.fingerprint()))
+
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def append_cube(store, previous_fingerprint, cells):
+
+    """
+    merges the cube cells of rows appended to the store into its saved cube; only cells the
+    appended rows fall in are re-summed. returns False, leaving the cube to be rebuilt on load,
+    if the saved cube was not built for the store before the append
+
+    Keyword arguments:
+    store -- VDSStore after the append
+    previous_fingerprint -- fingerprint of the store before the append
+    cells -- cube_cells() of the appended rows
+    """
+
+    cube = saved_cube(store, previous_fingerprint)
+    if cube is None:
+        return False
+
+    cells = sum_cells(cells)
+    keys = pd.MultiIndex.from_frame(cells[CUBE_KEYS].astype({'dow': str}))
+    affected = pd.MultiIndex.from_frame(cube[CUBE_KEYS].astype({'dow': str})).isin(keys)
+
+    merged = sum_cells(pd.concat([cube.loc[affected].astype({'dow': str}), cells.astype({'dow': str})], ignore_index=True))
+    cube = pd.concat([cube.loc[~affected].astype({'dow': str}), merged], ignore_index=True)
+    cube['dow'] = cube['dow'].astype('category')
+
+    save_cube(store, cube)
+
+    return True
@@ -0,0 +1,102 @@
+#libraries
+import pandas as pd
+import numpy as np
+
+#scatter plots drawn as density rasters: (title, x column, y column) of the selected detail rows
+DENSITY_PLOTS = {'volume_time': ('Volume over Time', 'date', 'avgVolume'),
+                 'speed_volume': ('Speed vs Volume', 'avgVolume', 'avgSpeed')}
+
+#screen pixels per raster cell
+DENSITY_CELL_PIXELS = 3
+
+def scatter_points(df, x, y):
+
+    """
+    returns (x values, y values) arrays of the rows where both values are present;
+    dates are returned as milliseconds since 1970-01-01 for bokeh datetime axes
+
+    Keyword arguments:
+    df -- dataframe of selected vds detail rows
+    x -- column name of x values
+    y -- column name of y values
+    """
+
+    values = []
+    for col in [x, y]:
+        v = df[col].values
+        if np.issubdtype(v.dtype, np.datetime64):
+            v = v.astype('datetime64[ms]').view(np.int64).astype(np.float64)
+        else:
+            v = v.astype(np.float32)
+        values.append(v)
+
+    present = ~(np.isnan(values[0]) | np.isnan(values[1]))
+
+    return values[0][present], values[1][present]
+
+def data_extent(values, pad=0.02):
+
+    """
+    returns (start, end) range covering an array of values with padding on both sides
+
+    Keyword arguments:
+    values -- array of values
+    pad -- fraction of the span added to each side
+    """
+
+    if len(values) == 0:
+        return (0.0, 1.0)
+
+    start, end = float(values.min()), float(values.max())
+    span = end - start if end > start else max(abs(start), 1.0)
+
+    return (start - span * pad, end + span * pad)
+
+def density_image(x, y, x_range, y_range, width, height):
+
+    """
+    returns column data of a bokeh image glyph counting the points in each cell of a
+    width x height grid over the viewport; cells without points are NaN so they draw
+    transparent, and the payload size only depends on the grid size
+
+    Keyword arguments:
+    x -- array of point x values
+    y -- array of point y values
+    x_range -- (start, end) of the viewport x axis
+    y_range -- (start, end) of the viewport y axis
+    width -- number of grid columns
+    height -- number of grid rows
+    """
+
+    x0, x1 = float(x_range[0]), float(x_range[1])
+    y0, y1 = float(y_range[0]), float(y_range[1])
+    width, height = max(int(width), 1), max(int(height), 1)
+
+    counts = np.zeros(width * height, dtype=np.float64)
+    if x1 > x0 and y1 > y0 and len(x) > 0:
+        col = np.floor((x - x0) * (width / (x1 - x0)))
+        row = np.floor((y - y0) * (height / (y1 - y0)))
+        inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+
+        cells = row[inside].astype(np.int64) * width + col[inside].astype(np.int64)
+        counts = np.bincount(cells, minlength=width * height).astype(np.float64)
+
+    counts[counts == 0] = np.nan
+
+    return {'image': [counts.reshape(height, width)],
+            'x': [x0], 'y': [y0],
+            'dw': [x1 - x0], 'dh': [y1 - y0]}
+
+def density_grid_size(plot_width, plot_height, cell_pixels=DENSITY_CELL_PIXELS):
+
+    """
+    returns (width, height) of the density grid for a plot so one cell covers
+    cell_pixels screen pixels
+
+    Keyword arguments:
+    plot_width -- plot width in pixels
+    plot_height -- plot height in pixels
+    cell_pixels -- screen pixels per grid cell
+    """
+
+    return (max(int(plot_width) // cell_pixels, 1), max(int(plot_height) // cell_pixels, 1))
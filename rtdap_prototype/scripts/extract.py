@@ -0,0 +1,472 @@
+#Extracts hourly vds detail summaries from the rtdap databases into the dashboard's parquet store
+#
+#usage (from rtdap_prototype):
+#   python -m scripts.extract rtdap_2017.ini:GatewayVDSDetail_2017 rtdap_2016.ini:GatewayVDSDetail_2016
+#       --store data/vds_store --corridors data/device_corridors.csv --workers 4
+#
+#   add --incremental to only pull the hours completed since the last extract of each table
+#
+#config files hold a [postgresql] section of psycopg2 connection parameters, or a [sqlite]
+#section with a database path for local testing
+
+#libraries
+import os
+import json
+import glob
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+import pyarrow.dataset as ds
+
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+from scripts.prepare import prepare_vds_table, METRIC_COLUMNS, MISSING_COLUMNS
+from scripts.store import write_vds_store, write_manifest, MANIFEST, VDSStore
+from scripts.baseline import corridor_sums, append_baselines
+from scripts.cube import cube_cells, append_cube
+from scripts.sketch import sketch_cells, append_sketches
+from scripts.coverage import coverage_hours, append_coverage
+
+#LocationTimeStamp high-water mark per source table: the start of the first hour not yet extracted
+WATERMARKS = '_watermarks.json'
+
+#lower bound of a table's first extract
+FIRST_TIMESTAMP = '1900-01-01 00:00:00'
+
+#(config file, table) pairs pulled by pull_summary in rtdap_collect_data.ipynb
+DEFAULT_SOURCES = [('rtdap_2018.ini','GatewayVDSDetail_2018'),
+                   ('rtdap_2017.ini','GatewayVDSDetail_2017'),
+                   ('rtdap_2016.ini','GatewayVDSDetail_2016'),
+                   ('rtdap_2013_2015.ini','GatewayVDSDetail_2015'),
+                   ('rtdap_2013_2015.ini','GatewayVDSDetail_2014'),
+                   ('rtdap_2013_2015.ini','GatewayVDSDetail_2013')]
+
+#column names of the extracted rows, as read by prepare_vds_table
+EXTRACT_COLUMNS = ['FieldDeviceID','avgOccupancy','avgVolume','avgSpeed','dow','year','month','day','hour']
+
+#hourly device means of operational Illinois detectors on weekdays
+POSTGRES_QUERY = '''
+    select "FieldDeviceID",
+    AVG("Occupancy")::float8 AS "avgOccupancy",
+    AVG("Volume")::float8 AS "avgVolume",
+    AVG("Speed")::float8 AS "avgSpeed",
+    extract(isodow from "LocationTimeStamp")::int AS "dow",
+    extract(year from "LocationTimeStamp")::int AS "year",
+    extract(month from "LocationTimeStamp")::int AS "month",
+    extract(day from "LocationTimeStamp")::int AS "day",
+    extract(hour from "LocationTimeStamp")::int AS "hour"
+    from "{table}"
+    where extract(isodow from "LocationTimeStamp") < %s AND "DeviceStatus" = %s
+    AND LEFT("OwningAgencyID",2) = %s
+    AND "LocationTimeStamp" >= %s::timestamp AND "LocationTimeStamp" < %s::timestamp
+    group by 1, 5, 6, 7, 8, 9
+    '''
+
+#start of the latest hour in a table; rows from that hour on are left for the next extract
+POSTGRES_LAST_HOUR = '''select to_char(date_trunc('hour', max("LocationTimeStamp")), 'YYYY-MM-DD HH24:MI:SS') from "{table}"'''
+
+#the same query for a sqlite stand-in with text timestamps
+SQLITE_QUERY = '''
+    select "FieldDeviceID",
+    AVG("Occupancy") AS "avgOccupancy",
+    AVG("Volume") AS "avgVolume",
+    AVG("Speed") AS "avgSpeed",
+    (CAST(strftime('%w', "LocationTimeStamp") AS INTEGER) + 6) % 7 + 1 AS "dow",
+    CAST(strftime('%Y', "LocationTimeStamp") AS INTEGER) AS "year",
+    CAST(strftime('%m', "LocationTimeStamp") AS INTEGER) AS "month",
+    CAST(strftime('%d', "LocationTimeStamp") AS INTEGER) AS "day",
+    CAST(strftime('%H', "LocationTimeStamp") AS INTEGER) AS "hour"
+    from "{table}"
+    where (CAST(strftime('%w', "LocationTimeStamp") AS INTEGER) + 6) % 7 + 1 < ? AND "DeviceStatus" = ?
+    AND substr("OwningAgencyID",1,2) = ?
+    AND "LocationTimeStamp" >= ? AND "LocationTimeStamp" < ?
+    group by 1, 5, 6, 7, 8, 9
+    '''
+
+SQLITE_LAST_HOUR = '''select strftime('%Y-%m-%d %H:00:00', max("LocationTimeStamp")) from "{table}"'''
+
+#query parameters: isodow below (weekdays only), device status, owning agency prefix
+QUERY_PARAMETERS = (6, 'OPERATIONAL', 'IL')
+
+def read_config(filename):
+
+    """
+    returns (dialect, connection parameters) of a config file: its postgresql section,
+    or its sqlite section for a local stand-in database
+
+    Keyword arguments:
+    filename -- config file name (ie rtdap_2017.ini)
+    """
+
+    parser = ConfigParser()
+    with open(filename) as f:
+        parser.read_file(f)
+
+    for section in ['postgresql', 'sqlite']:
+        if parser.has_section(section):
+            return section, dict(parser.items(section))
+
+    raise Exception('Section postgresql or sqlite not found in {0} file'.format(filename))
+
+class ConnectionPools(object):
+
+    """
+    one thread safe connection pool per config file, shared by the tables read through it
+
+    Keyword arguments:
+    max_connections -- most open connections per config file
+    """
+
+    def __init__(self, max_connections=4):
+        self.max_connections = max_connections
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, config_file):
+
+        """
+        yields (dialect, connection) for a config file, returning the connection to its pool
+        afterwards; sqlite connections can not move between threads and are opened per use
+
+        Keyword arguments:
+        config_file -- config file name
+        """
+
+        with self.lock:
+            if config_file not in self.pools:
+                dialect, params = read_config(config_file)
+                pool = None
+                if dialect == 'postgresql':
+                    if psycopg2 is None:
+                        raise ImportError('psycopg2 is required to extract from postgresql')
+                    pool = psycopg2.pool.ThreadedConnectionPool(1, self.max_connections, **params)
+                self.pools[config_file] = (dialect, params, pool)
+
+        dialect, params, pool = self.pools[config_file]
+
+        if pool is None:
+            conn = sqlite3.connect(params['database'])
+            try:
+                yield dialect, conn
+            finally:
+                conn.close()
+            return
+
+        conn = pool.getconn()
+        try:
+            yield dialect, conn
+        finally:
+            conn.rollback()
+            pool.putconn(conn)
+
+    def close(self):
+
+        """
+        closes every pooled connection
+        """
+
+        for dialect, params, pool in self.pools.values():
+            if pool is not None:
+                pool.closeall()
+        self.pools = {}
+
+def last_hour(dialect, conn, table):
+
+    """
+    returns 'YYYY-MM-DD HH:00:00' start of the latest hour with rows in a table, None if it is empty
+
+    Keyword arguments:
+    dialect -- postgresql or sqlite
+    conn -- open database connection
+    table -- source table name (ie GatewayVDSDetail_2017)
+    """
+
+    cur = conn.cursor()
+    cur.execute((POSTGRES_LAST_HOUR if dialect == 'postgresql' else SQLITE_LAST_HOUR).format(table=table))
+    value = cur.fetchone()[0]
+    cur.close()
+
+    return value
+
+def stream_rows(dialect, conn, table, chunksize, since, until):
+
+    """
+    yields lists of up to chunksize extracted rows of a table from the hours in [since, until);
+    postgresql rows come from a server side cursor, so only one chunk is held in memory at a time
+
+    Keyword arguments:
+    dialect -- postgresql or sqlite
+    conn -- open database connection
+    table -- source table name (ie GatewayVDSDetail_2017)
+    chunksize -- rows per chunk
+    since -- 'YYYY-MM-DD HH:MM:SS' first LocationTimeStamp to extract
+    until -- 'YYYY-MM-DD HH:MM:SS' LocationTimeStamp to stop before
+    """
+
+    if dialect == 'postgresql':
+        cur = conn.cursor(name='vds_extract_%s' % table.lower())
+        cur.itersize = chunksize
+        cur.execute(POSTGRES_QUERY.format(table=table), QUERY_PARAMETERS + (since, until))
+    else:
+        cur = conn.cursor()
+        cur.execute(SQLITE_QUERY.format(table=table), QUERY_PARAMETERS + (since, until))
+
+    try:
+        while True:
+            rows = cur.fetchmany(chunksize)
+            if len(rows) == 0:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+def load_corridor_map(path):
+
+    """
+    returns dictionary of FieldDeviceID -> corridor name from a csv with FieldDeviceID and
+    corridor columns, or an empty dictionary if there is no file
+
+    Keyword arguments:
+    path -- device corridor csv
+    """
+
+    if path is None or not os.path.exists(path):
+        return {}
+
+    mapping = pd.read_csv(path, dtype=str)
+
+    return dict(zip(mapping['FieldDeviceID'], mapping['corridor']))
+
+def rows_to_vds_table(rows, corridor_map):
+
+    """
+    returns prepared vds detail rows of a chunk of extracted rows: missing flags set where a
+    metric had no readings in the hour, corridors looked up by device (N/A if not listed)
+
+    Keyword arguments:
+    rows -- list of extracted row tuples in EXTRACT_COLUMNS order
+    corridor_map -- dictionary from load_corridor_map()
+    """
+
+    df = pd.DataFrame.from_records(rows, columns=EXTRACT_COLUMNS)
+    df['FieldDeviceID'] = df['FieldDeviceID'].astype(str)
+
+    for col in EXTRACT_COLUMNS[1:]:
+        df[col] = pd.to_numeric(df[col])
+
+    for col, missing in zip(METRIC_COLUMNS, MISSING_COLUMNS):
+        df[missing] = df[col].isnull().astype(np.int8)
+
+    df['corridor'] = df['FieldDeviceID'].map(corridor_map).fillna('N/A')
+
+    return prepare_vds_table(df, verbose=False)
+
+def remove_parts(root, part_prefix):
+
+    """
+    removes the store files an earlier extract of a table wrote, so a table can be extracted again
+
+    Keyword arguments:
+    root -- directory of the parquet store
+    part_prefix -- file name prefix of the table's files
+    """
+
+    for path in glob.glob(os.path.join(root, '*', '*', part_prefix + '-*.parquet')):
+        os.remove(path)
+
+def read_watermarks(root):
+
+    """
+    returns dictionary of source table -> LocationTimeStamp high-water mark of the store
+
+    Keyword arguments:
+    root -- directory of the parquet store
+    """
+
+    path = os.path.join(root, WATERMARKS)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+def write_watermarks(root, watermarks):
+
+    """
+    writes the store's LocationTimeStamp high-water marks
+
+    Keyword arguments:
+    root -- directory of the parquet store
+    watermarks -- dictionary of source table -> high-water mark
+    """
+
+    with open(os.path.join(root, WATERMARKS), 'w') as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+
+def extract_table(pools, config_file, table, root, corridor_map, chunksize=200000, since=None):
+
+    """
+    streams the complete hours of one source table after its high-water mark into the parquet
+    store, writing each chunk as it arrives; returns a dictionary of the new high-water mark
+    and the corridors, years, days of week, corridor sums, cube cells, speed sketch cells and
+    coverage hours of the written rows
+
+    Keyword arguments:
+    pools -- ConnectionPools of the extract
+    config_file -- config file of the table's database
+    table -- source table name
+    root -- directory of the parquet store
+    corridor_map -- dictionary from load_corridor_map()
+    chunksize -- rows fetched, prepared and written at a time
+    since -- high-water mark of an incremental extract; None extracts the whole table, replacing earlier extracts
+    """
+
+    result = {'table': table, 'watermark': since, 'corridors': set(), 'years': set(), 'dows': set(),
+              'rows': 0, 'sums': [], 'cells': [], 'sketches': [], 'hours': []}
+
+    with pools.connection(config_file) as (dialect, conn):
+        until = last_hour(dialect, conn, table)
+        if until is None or (since is not None and until <= since):
+            print('{0}: no new hours'.format(table))
+            return result
+
+        if since is None:
+            remove_parts(root, table)
+            part_prefix = table
+        else:
+            part_prefix = '%s-%s' % (table, until.replace('-', '').replace(' ', '').replace(':', '')[:10])
+
+        for i, rows in enumerate(stream_rows(dialect, conn, table, chunksize, since or FIRST_TIMESTAMP, until)):
+            chunk = rows_to_vds_table(rows, corridor_map)
+            write_vds_store(chunk, root, part_name='%s-%05d' % (part_prefix, i))
+
+            result['corridors'].update(chunk['corridor'].astype(str).unique())
+            result['years'].update(chunk['year'].unique())
+            result['dows'].update(chunk['dow'].dropna().astype(str).unique())
+            result['rows'] += len(chunk)
+
+            #aggregates of incremental rows, merged into the saved baselines, cube and speed sketches
+            if since is not None:
+                result['sums'].append(corridor_sums(chunk))
+                result['cells'].append(cube_cells(chunk))
+                result['sketches'].append(sketch_cells(chunk))
+                result['hours'].append(coverage_hours(chunk))
+
+    result['watermark'] = until
+    print('{0}: {1:,} rows up to {2}'.format(table, result['rows'], until))
+
+    return result
+
+def extract_vds_store(sources, root, corridor_map=None, workers=4, chunksize=200000, incremental=False):
+
+    """
+    extracts source tables into the parquet store in parallel and writes the store manifest;
+    memory is bounded by workers x chunksize rows. an incremental extract appends only the
+    hours after each table's high-water mark and merges them into the saved corridor
+    baselines, cube, speed sketches and coverage bitmaps, so a refresh reads the new rows once instead
+    of the whole store
+
+    Keyword arguments:
+    sources -- list of (config file, table) pairs
+    root -- directory of the parquet store
+    corridor_map -- dictionary from load_corridor_map()
+    workers -- tables extracted at the same time
+    chunksize -- rows fetched, prepared and written at a time
+    incremental -- only extract hours after each table's high-water mark
+    """
+
+    corridor_map = corridor_map or {}
+    if not os.path.exists(root):
+        os.makedirs(root)
+
+    watermarks = read_watermarks(root)
+    has_manifest = os.path.exists(os.path.join(root, MANIFEST))
+    previous_fingerprint = VDSStore(root).fingerprint() if incremental and has_manifest else None
+
+    pools = ConnectionPools(max_connections=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(extract_table, pools, config_file, table, root, corridor_map, chunksize,
+                                       watermarks.get(table) if incremental else None)
+                       for config_file, table in sources]
+            results = [f.result() for f in futures]
+    finally:
+        pools.close()
+
+    corridors = set(c for result in results for c in result['corridors'])
+    years = set(y for result in results for y in result['years'])
+    dows = set(d for result in results for d in result['dows'])
+
+    #the manifest also lists the partitions of tables not extracted this time
+    if has_manifest:
+        with open(os.path.join(root, MANIFEST)) as f:
+            previous = json.load(f)
+        present = set(os.listdir(root))
+        years.update(y for y in previous['years'] if 'year=%d' % y in present)
+        corridors.update(previous['corridors'])
+        dows.update(previous['dows'])
+
+    if previous_fingerprint is not None:
+        sums = [s for result in results for s in result['sums']]
+        cells = [c for result in results for c in result['cells']]
+        sketches = [c for result in results for c in result['sketches']]
+        hours = [h for result in results for h in result['hours']]
+        if len(sums) > 0:
+            store = VDSStore(root)
+            append_baselines(store, previous_fingerprint, pd.concat(sums).groupby(level=0).sum())
+            append_cube(store, previous_fingerprint, pd.concat(cells, ignore_index=True))
+            append_sketches(store, previous_fingerprint, pd.concat(sketches, ignore_index=True))
+            append_coverage(store, previous_fingerprint, pd.concat(hours, ignore_index=True))
+
+    for result in results:
+        if result['watermark'] is not None:
+            watermarks[result['table']] = result['watermark']
+    write_watermarks(root, watermarks)
+
+    rows = ds.dataset(root, format='parquet', partitioning='hive').count_rows()
+
+    #written last: dashboards reload the store when its manifest changes
+    return write_manifest(root, corridors, years, dows, rows)
+
+def parse_source(text):
+
+    """
+    returns (config file, table) of a config_file:table command line argument
+    """
+
+    config_file, table = text.rsplit(':', 1)
+
+    return config_file, table
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='extract vds detail summaries into the dashboard parquet store')
+    parser.add_argument('sources', nargs='*', type=parse_source,
+                        help='config_file:table pairs (default: the notebook config files and tables)')
+    parser.add_argument('--store', default=os.path.join('data', 'vds_store'), help='parquet store directory')
+    parser.add_argument('--corridors', default=None, help='csv of FieldDeviceID and corridor columns')
+    parser.add_argument('--workers', type=int, default=4, help='tables extracted in parallel')
+    parser.add_argument('--chunksize', type=int, default=200000, help='rows fetched per chunk')
+    parser.add_argument('--incremental', action='store_true', help='only extract hours after each table\'s high-water mark')
+    args = parser.parse_args(argv)
+
+    manifest = extract_vds_store(args.sources or DEFAULT_SOURCES, args.store,
+                                 corridor_map=load_corridor_map(args.corridors),
+                                 workers=args.workers, chunksize=args.chunksize,
+                                 incremental=args.incremental)
+    print('{0}: {1:,} rows extracted, years {2}'.format(args.store, manifest['rows'], manifest['years']))
+
+if __name__ == '__main__':
+    main()
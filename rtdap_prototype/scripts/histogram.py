@@ -0,0 +1,127 @@
+#libraries
+import pandas as pd
+import numpy as np
+
+from scripts.prepare import METRIC_COLUMNS
+
+#bin edges of (long-run device mean - selected device mean) per metric, 41 bins each scaled to
+#the metric's typical difference: 1 mph speed, 0.5 point occupancy and 20 vehicle volume bins;
+#bins are right closed
+HISTOGRAM_BINS = {'avgSpeed': np.arange(-20, 22) * 1.0,
+                  'avgOccupancy': np.arange(-20, 22) * 0.5,
+                  'avgVolume': np.arange(-20, 22) * 20.0}
+
+def device_codes(df, devices):
+
+    """
+    returns integer position of each row's FieldDeviceID in devices (-1 if not listed)
+
+    Keyword arguments:
+    df -- dataframe of vds detail rows
+    devices -- pandas Index of device ids
+    """
+
+    ids = df['FieldDeviceID']
+    if hasattr(ids, 'cat') and ids.cat.categories.equals(devices):
+        #category codes are int8 / int16; widen before they are used in cell arithmetic
+        return ids.cat.codes.values.astype(np.int64)
+
+    return devices.get_indexer(ids.astype(str))
+
+def device_means(df, devices, columns=METRIC_COLUMNS):
+
+    """
+    returns (devices x columns) array of per device means, NaN where a device has no values;
+    all columns are summed in a single bincount over the stacked device codes
+
+    Keyword arguments:
+    df -- dataframe of vds detail rows
+    devices -- pandas Index of device ids
+    columns -- metric column names
+    """
+
+    codes = device_codes(df, devices)
+    values = np.column_stack([df[col].values.astype(np.float64) for col in columns])
+
+    keep = codes >= 0
+    codes, values = codes[keep], values[keep]
+
+    n_devices, n_columns = len(devices), len(columns)
+    cells = (codes[:, None] * n_columns + np.arange(n_columns)).ravel()
+    present = ~np.isnan(values.ravel())
+
+    sums = np.bincount(cells[present], weights=values.ravel()[present], minlength=n_devices * n_columns)
+    counts = np.bincount(cells[present], minlength=n_devices * n_columns)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+
+    return means.reshape(n_devices, n_columns)
+
+def corridor_devices(df):
+
+    """
+    returns pandas Index of the device ids of a corridor's rows
+
+    Keyword arguments:
+    df -- dataframe of a corridor's vds detail rows
+    """
+
+    ids = df['FieldDeviceID']
+    if hasattr(ids, 'cat'):
+        return ids.cat.categories
+
+    return pd.Index(ids.astype(str).unique())
+
+def device_differences(full_means, selected_means):
+
+    """
+    returns (devices x columns) array of per device mean difference,
+    (long-run mean - selected mean) / selected mean, NaN unless both means are above zero
+
+    Keyword arguments:
+    full_means -- long-run device means from device_means() over all corridor rows
+    selected_means -- device means from device_means() over the selected rows
+    """
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        difference = (full_means - selected_means) / selected_means
+
+    return np.where((full_means > 0) & (selected_means > 0), difference, np.nan)
+
+def metric_histograms(devices, full_means, df, bins=None, columns=METRIC_COLUMNS, selected_means=None):
+
+    """
+    returns dictionary of metric column -> column data of the metric's difference distribution:
+    the count of devices per bin of (long-run device mean - selected device mean), for devices
+    with both means above zero
+
+    Keyword arguments:
+    devices -- pandas Index of the corridor's device ids
+    full_means -- long-run device means from device_means() over all corridor rows
+    df -- dataframe of the selected corridor rows
+    bins -- dictionary of metric column -> bin edges (default HISTOGRAM_BINS)
+    columns -- metric column names, in the order of full_means
+    selected_means -- device_means() of df, if already computed
+    """
+
+    bins = HISTOGRAM_BINS if bins is None else bins
+    if selected_means is None:
+        selected_means = device_means(df, devices, columns)
+
+    histograms = {}
+    for i, col in enumerate(columns):
+        edges = np.asarray(bins[col])
+        full, selected = full_means[:, i], selected_means[:, i]
+
+        with np.errstate(invalid='ignore'):
+            difference = (full - selected)[(full > 0) & (selected > 0)]
+
+        #right closed bins, (edges[j], edges[j+1]]
+        bin_index = np.searchsorted(edges, difference, side='left') - 1
+        bin_index = bin_index[(bin_index >= 0) & (bin_index < len(edges) - 1)]
+
+        histograms[col] = {'bins': edges[:-1],
+                           'difference': np.bincount(bin_index, minlength=len(edges) - 1)}
+
+    return histograms
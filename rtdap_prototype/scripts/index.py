@@ -0,0 +1,135 @@
+#libraries
+import pandas as pd
+import numpy as np
+
+#sort order of the indexed rows; every (corridor, dow, hour) group is date sorted
+INDEX_KEYS = ['corridor','dow','hour','date']
+
+#columns read from the vds store for a corridor selection
+SELECT_COLUMNS = ['FieldDeviceID','corridor','date','dow','hour','avgSpeed','avgOccupancy','avgVolume',
+                  'missing_speed','missing_occ','missing_vol']
+
+def date_value(value, unit='ns'):
+
+    """
+    returns time since 1970-01-01, in a datetime64 unit, of the midnight starting a date,
+    datetime or 'YYYY-MM-DD' string
+
+    Keyword arguments:
+    value -- date to convert
+    unit -- datetime64 unit of the result (ns, us, ms, s)
+    """
+
+    return int(pd.Timestamp(value).normalize().to_datetime64().astype('datetime64[%s]' % unit).view(np.int64))
+
+class SelectionIndex(object):
+
+    """
+    vds detail rows sorted by corridor, day of week, time of day and date;
+    a selection resolves to one searchsorted date slice per (corridor, dow, hour)
+    group, so the cost of a query follows the rows it returns
+
+    Keyword arguments:
+    df -- dataframe of prepared vds detail rows
+    presorted -- df is already sorted by INDEX_KEYS with a default index, and is used without copying
+    """
+
+    def __init__(self, df, presorted=False):
+
+        if not presorted:
+            df = df.sort_values(INDEX_KEYS, kind='mergesort').reset_index(drop=True)
+        self.df = df
+
+        #dates as int64 in the date column's own unit, a view of the column rather than a converted
+        #copy, so workers sharing a memory mapped snapshot share its dates too
+        dates = df['date'].values
+        self.date_unit = np.datetime_data(dates.dtype)[0]
+        self.dates = dates.view(np.int64)
+
+        corridor_codes = pd.factorize(df['corridor'])[0]
+        dow_codes = pd.factorize(df['dow'])[0]
+        hour = df['hour'].values
+
+        new_group = np.ones(len(df), dtype=bool)
+        new_group[1:] = (corridor_codes[1:] != corridor_codes[:-1]) |\
+                        (dow_codes[1:] != dow_codes[:-1]) |\
+                        (hour[1:] != hour[:-1])
+
+        starts = np.flatnonzero(new_group)
+        ends = np.append(starts[1:], len(df))
+
+        corridors = df['corridor'].values
+        dows = df['dow'].values
+
+        self.ranges = {}
+        for start, end in zip(starts, ends):
+            self.ranges[(corridors[start], dows[start], int(hour[start]))] = (start, end)
+
+        self.dows = [d for d in pd.unique(dows) if pd.notnull(d)]
+
+    def positions(self, corr, date_s, date_e, weekday, tod):
+
+        """
+        returns row positions in the sorted table matching the selection
+
+        Keyword arguments:
+        corr -- corridor name
+        date_s -- start date
+        date_e -- end date
+        weekday -- day of week (Monday - Friday, or All)
+        tod -- time of day (8 tod time periods)
+        """
+
+        date_start = date_value(date_s, self.date_unit)
+        date_end = date_value(date_e, self.date_unit)
+
+        weekdays = self.dows if weekday == 'All' else [weekday]
+
+        slices = []
+        for dow in weekdays:
+            for hour in range(int(tod[0]), int(tod[1]) + 1):
+                group = self.ranges.get((corr, dow, hour))
+                if group is None:
+                    continue
+
+                start, end = group
+                dates = self.dates[start:end]
+                lo = start + np.searchsorted(dates, date_start, side='left')
+                hi = start + np.searchsorted(dates, date_end, side='right')
+                if hi > lo:
+                    slices.append(np.arange(lo, hi))
+
+        if len(slices) == 0:
+            return np.array([], dtype=np.int64)
+
+        return np.concatenate(slices)
+
+    def select(self, corr, date_s, date_e, weekday, tod):
+
+        """
+        returns subset of the indexed rows matching the selection
+
+        Keyword arguments:
+        corr -- corridor name
+        date_s -- start date
+        date_e -- end date
+        weekday -- day of week (Monday - Friday, or All)
+        tod -- time of day (8 tod time periods)
+        """
+
+        return self.df.take(self.positions(corr, date_s, date_e, weekday, tod))
+
+    def corridor_rows(self, corr):
+
+        """
+        returns all indexed rows for a corridor
+
+        Keyword arguments:
+        corr -- corridor name
+        """
+
+        groups = [self.ranges[key] for key in self.ranges if key[0] == corr]
+        if len(groups) == 0:
+            return self.df.iloc[0:0]
+
+        return self.df.iloc[min(g[0] for g in groups):max(g[1] for g in groups)]
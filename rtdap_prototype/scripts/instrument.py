@@ -0,0 +1,403 @@
+#libraries
+import os
+import time
+import json
+import random
+import hashlib
+import logging
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+import numpy as np
+
+#bokeh
+from bokeh.document.events import DocumentPatchedEvent
+from bokeh.protocol.messages.patch_doc import process_document_events
+
+#web
+from tornado.web import Application, RequestHandler
+
+#share of callbacks traced with stage timings, row counts and payload sizes; every callback
+#is counted either way (set RTDAP_METRICS_SAMPLE=1 to trace all of them while debugging)
+METRICS_SAMPLE = float(os.environ.get('RTDAP_METRICS_SAMPLE', 0.1))
+
+#port of the /metrics http endpoint started with the bokeh server (0 turns it off)
+METRICS_PORT = int(os.environ.get('RTDAP_METRICS_PORT', 5007))
+
+#address the /metrics endpoint listens on; local only unless set, since it has no authentication
+METRICS_ADDRESS = os.environ.get('RTDAP_METRICS_ADDRESS', '127.0.0.1')
+
+#json lines file traced callbacks are also written to
+METRICS_LOG = os.environ.get('RTDAP_METRICS_LOG')
+
+#recent traces kept per stage for percentiles
+METRICS_WINDOW = 1000
+
+#one json record per traced callback
+logger = logging.getLogger('rtdap.metrics')
+if METRICS_LOG:
+    handler = logging.FileHandler(METRICS_LOG)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+class Trace(object):
+
+    """
+    stage timings, row counts and payload sizes of one sampled callback, recorded
+    to its Metrics when finished; a trace may be passed from the session to
+    selection_executor and back, but is only used by one thread at a time
+
+    Keyword arguments:
+    metrics -- Metrics the trace is recorded to
+    name -- callback name
+    session_id -- id of the bokeh session that ran the callback
+    """
+
+    def __init__(self, metrics, name, session_id=None):
+
+        self.metrics = metrics
+        self.name = name
+        self.session_id = session_id
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+
+    def __bool__(self):
+        return True
+
+    @contextmanager
+    def stage(self, stage):
+
+        """
+        times the block as a stage of the callback; a repeated stage adds up
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+
+    def count(self, name, value):
+
+        """
+        records a count of the callback (rows selected, cache hits); a repeated count adds up
+        """
+
+        self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    @contextmanager
+    def payload(self, doc):
+
+        """
+        times the block as the callback's render stage and counts the bytes of the document
+        patch its model changes send to the browser
+
+        Keyword arguments:
+        doc -- session document the block changes
+        """
+
+        events = self.metrics.capture(doc)
+        try:
+            with self.stage('render'):
+                yield
+        finally:
+            self.metrics.release(doc, events)
+            self.count('payload_bytes', patch_size(events))
+            self.count('events', len(events))
+
+    def finish(self):
+
+        """
+        records the trace with its total time since it was started
+        """
+
+        self.stages['total'] = time.perf_counter() - self.start
+        self.metrics.record(self)
+
+class NullTrace(object):
+
+    """
+    stand in for the trace of a callback that is not sampled; does nothing
+    """
+
+    def __bool__(self):
+        return False
+
+    @contextmanager
+    def stage(self, stage):
+        yield
+
+    def count(self, name, value):
+        pass
+
+    @contextmanager
+    def payload(self, doc):
+        yield
+
+    def finish(self):
+        pass
+
+NULL_TRACE = NullTrace()
+
+def patch_size(events):
+
+    """
+    returns bytes of the PATCH-DOC websocket message of a list of document change events:
+    the json content plus the binary array buffers sent with it
+    """
+
+    #only patch events are sent; callback bookkeeping events stay on the server
+    events = [e for e in events if isinstance(e, DocumentPatchedEvent)]
+    if len(events) == 0:
+        return 0
+
+    patch_json, buffers = process_document_events(events, use_buffers=True)
+
+    return len(patch_json) + sum(len(payload) for header, payload in buffers)
+
+def session_id(doc):
+
+    """
+    returns id of the bokeh session of a document, or None outside a server session
+    """
+
+    context = doc.session_context if doc is not None else None
+    return context.id if context is not None else None
+
+def session_label(session):
+
+    """
+    returns a short hash of a bokeh session id, so metrics can tell sessions apart
+    without publishing ids that would let a client join another user's session
+    """
+
+    return hashlib.sha256(str(session).encode()).hexdigest()[:12] if session is not None else None
+
+def summarize_values(values, scale=1.0):
+
+    """
+    returns dictionary of count, mean, percentiles and max of recent values
+
+    Keyword arguments:
+    values -- recent values of a stage or count
+    scale -- factor applied to the values (1000 for seconds to milliseconds)
+    """
+
+    values = np.asarray(values, dtype=np.float64) * scale
+
+    return {'count': int(len(values)),
+            'mean': float(values.mean()),
+            'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max())}
+
+class Metrics(object):
+
+    """
+    callback metrics of this server process, shared by all sessions: callback counts,
+    recent stage timings and counts of sampled callbacks, and per session callback
+    counts and payload bytes
+
+    Keyword arguments:
+    sample -- share of callbacks traced
+    window -- recent traces kept per stage
+    """
+
+    def __init__(self, sample=METRICS_SAMPLE, window=METRICS_WINDOW):
+
+        self.sample = sample
+        self.window = window
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+        self.callbacks = {}
+        self.stages = {}
+        self.counts = {}
+        self.sessions = {}
+        self.sessions_total = 0
+
+        #event lists of the traced callbacks changing each document; traced callbacks may nest
+        self.captures = weakref.WeakKeyDictionary()
+
+    def trace(self, name, doc=None):
+
+        """
+        counts a callback and returns a Trace if it is sampled, otherwise NULL_TRACE
+
+        Keyword arguments:
+        name -- callback name
+        doc -- session document the callback runs in
+        """
+
+        session = session_id(doc)
+        with self.lock:
+            self.callbacks[name] = self.callbacks.get(name, 0) + 1
+            if session in self.sessions:
+                self.sessions[session]['callbacks'] += 1
+
+        if self.sample <= 0 or random.random() >= self.sample:
+            return NULL_TRACE
+
+        return Trace(self, name, session)
+
+    def capture(self, doc):
+
+        """
+        starts collecting the change events of a document; returns the list they are added to
+        """
+
+        if doc not in self.captures:
+            self.captures[doc] = []
+            doc.on_change(capture_listener(self.captures, doc))
+
+        events = []
+        self.captures[doc].append(events)
+
+        return events
+
+    def release(self, doc, events):
+
+        """
+        stops collecting the change events of a document into a list returned by capture()
+        """
+
+        self.captures[doc] = [e for e in self.captures[doc] if e is not events]
+
+    def record(self, trace):
+
+        """
+        adds a finished trace to the recent stage timings and counts and logs it
+        """
+
+        with self.lock:
+            for stage, seconds in trace.stages.items():
+                key = '%s.%s' % (trace.name, stage)
+                self.stages.setdefault(key, deque(maxlen=self.window)).append(seconds)
+            for name, value in trace.counts.items():
+                key = '%s.%s' % (trace.name, name)
+                self.counts.setdefault(key, deque(maxlen=self.window)).append(value)
+            if trace.session_id in self.sessions:
+                self.sessions[trace.session_id]['payload_bytes'] += trace.counts.get('payload_bytes', 0)
+
+        logger.info(json.dumps({'time': time.time(),
+                                'callback': trace.name,
+                                'session': session_label(trace.session_id),
+                                'ms': dict((stage, round(seconds * 1000.0, 3)) for stage, seconds in trace.stages.items()),
+                                'counts': trace.counts}))
+
+    def session_created(self, session):
+
+        """
+        starts counting the callbacks of a session
+        """
+
+        with self.lock:
+            self.sessions[session] = {'started': time.time(), 'callbacks': 0, 'payload_bytes': 0}
+            self.sessions_total += 1
+
+    def session_destroyed(self, session):
+
+        """
+        stops counting the callbacks of a session
+        """
+
+        with self.lock:
+            self.sessions.pop(session, None)
+
+    def snapshot(self):
+
+        """
+        returns json serializable dictionary of the current metrics
+        """
+
+        with self.lock:
+            return {'uptime_seconds': time.time() - self.started,
+                    'sample': self.sample,
+                    'sessions': {'active': len(self.sessions),
+                                 'total': self.sessions_total,
+                                 'by_session': dict((session_label(k), dict(v)) for k, v in self.sessions.items())},
+                    'callbacks': dict(self.callbacks),
+                    'stages_ms': dict((k, summarize_values(v, 1000.0)) for k, v in self.stages.items()),
+                    'counts': dict((k, summarize_values(v)) for k, v in self.counts.items())}
+
+def capture_listener(captures, doc):
+
+    """
+    returns document change callback adding events to the document's active capture lists
+    """
+
+    doc_ref = weakref.ref(doc)
+
+    def on_change(event):
+        for events in captures.get(doc_ref(), ()):
+            events.append(event)
+
+    return on_change
+
+#callback metrics of this server process
+metrics = Metrics()
+
+def instrumented(doc, name=None):
+
+    """
+    returns decorator counting a session callback and, when sampled, timing it and
+    measuring the document patch it sends
+
+    Keyword arguments:
+    doc -- session document the callback runs in
+    name -- callback name (default: the function name)
+    """
+
+    def decorator(func):
+
+        @wraps(func)
+        def callback(*args, **kwargs):
+            trace = metrics.trace(name or func.__name__, doc)
+            if not trace:
+                return func(*args, **kwargs)
+
+            try:
+                with trace.payload(doc):
+                    return func(*args, **kwargs)
+            finally:
+                trace.finish()
+
+        return callback
+
+    return decorator
+
+class MetricsHandler(RequestHandler):
+
+    """
+    GET /metrics -- json of the process callback metrics
+    """
+
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(metrics.snapshot()))
+
+def start_metrics_server(port=METRICS_PORT, address=METRICS_ADDRESS):
+
+    """
+    starts the /metrics http endpoint on the current tornado loop; returns the http server,
+    or None if the port is 0 or taken (by another process of a --num-procs server, whose
+    metrics are then the only ones served)
+
+    Keyword arguments:
+    port -- port to listen on
+    address -- address to listen on (RTDAP_METRICS_ADDRESS, local only by default)
+    """
+
+    if port <= 0:
+        return None
+
+    try:
+        return Application([(r'/metrics', MetricsHandler)]).listen(port, address=address)
+    except OSError as e:
+        logger.warning('metrics endpoint not started on %s:%d: %s' % (address, port, e))
+        return None
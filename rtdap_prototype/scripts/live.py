@@ -0,0 +1,501 @@
+#libraries
+import os
+import time
+import logging
+import threading
+
+import pandas as pd
+import numpy as np
+
+from scripts.extract import ConnectionPools, QUERY_PARAMETERS
+
+#live feed settings; RTDAP_LIVE_SOURCE is replay:<csv path> or poll:<config file>:<table>
+LIVE_INTERVAL = float(os.environ.get('RTDAP_LIVE_INTERVAL', 1.0))
+LIVE_WINDOW_MINUTES = int(os.environ.get('RTDAP_LIVE_WINDOW_MINUTES', 60))
+LIVE_BUCKET_MINUTES = int(os.environ.get('RTDAP_LIVE_BUCKET_MINUTES', 1))
+LIVE_ROLLOVER = int(os.environ.get('RTDAP_LIVE_ROLLOVER', 5000))
+#longest wait, in seconds, between reads while the live source keeps failing
+LIVE_MAX_BACKOFF = float(os.environ.get('RTDAP_LIVE_MAX_BACKOFF', 60))
+
+logger = logging.getLogger('rtdap.live')
+
+#raw detector readings, as in the GatewayVDSDetail tables
+RECORD_COLUMNS = ['FieldDeviceID','Occupancy','Volume','Speed','LocationTimeStamp']
+LIVE_METRICS = ['Speed','Occupancy','Volume']
+
+#operational Illinois detector readings after a LocationTimeStamp, oldest first
+POSTGRES_POLL = '''
+    select "FieldDeviceID", "Occupancy"::float8, "Volume"::float8, "Speed"::float8,
+    to_char("LocationTimeStamp", 'YYYY-MM-DD HH24:MI:SS')
+    from "{table}"
+    where extract(isodow from "LocationTimeStamp") < %s AND "DeviceStatus" = %s
+    AND LEFT("OwningAgencyID",2) = %s AND "LocationTimeStamp" > %s::timestamp
+    order by "LocationTimeStamp"
+    limit %s
+    '''
+
+SQLITE_POLL = '''
+    select "FieldDeviceID", "Occupancy", "Volume", "Speed", "LocationTimeStamp"
+    from "{table}"
+    where (CAST(strftime('%w', "LocationTimeStamp") AS INTEGER) + 6) % 7 + 1 < ? AND "DeviceStatus" = ?
+    AND substr("OwningAgencyID",1,2) = ? AND "LocationTimeStamp" > ?
+    order by "LocationTimeStamp"
+    limit ?
+    '''
+
+class PollingSource(object):
+
+    """
+    live source polling a GatewayVDSDetail table for readings newer than the last one seen
+
+    Keyword arguments:
+    config_file -- config file of the table's database ([postgresql] or [sqlite] section)
+    table -- source table name (ie GatewayVDSDetail_2018)
+    since -- 'YYYY-MM-DD HH:MM:SS' LocationTimeStamp to start after (default: now)
+    limit -- most readings fetched per poll
+    """
+
+    def __init__(self, config_file, table, since=None, limit=100000):
+        self.config_file = config_file
+        self.table = table
+        self.since = since or pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.limit = limit
+        self.pools = ConnectionPools(max_connections=1)
+
+    def read(self):
+
+        """
+        returns dataframe of the readings added since the last read
+        """
+
+        with self.pools.connection(self.config_file) as (dialect, conn):
+            cur = conn.cursor()
+            query = POSTGRES_POLL if dialect == 'postgresql' else SQLITE_POLL
+            cur.execute(query.format(table=self.table), QUERY_PARAMETERS + (self.since, self.limit))
+            rows = cur.fetchall()
+            cur.close()
+
+        records = pd.DataFrame.from_records(rows, columns=RECORD_COLUMNS)
+        if len(records) == 0:
+            return records
+
+        #a full poll may end partway through a timestamp; read that timestamp again next time
+        last = records['LocationTimeStamp'].iloc[-1]
+        if len(records) == self.limit and (records['LocationTimeStamp'] != last).any():
+            records = records.loc[records['LocationTimeStamp'] != last]
+
+        self.since = records['LocationTimeStamp'].iloc[-1]
+        records['LocationTimeStamp'] = pd.to_datetime(records['LocationTimeStamp'])
+
+        return records
+
+class ReplaySource(object):
+
+    """
+    live source replaying a csv of readings (RECORD_COLUMNS, in time order) for testing;
+    readings are released as the replay clock passes their LocationTimeStamp
+
+    Keyword arguments:
+    path -- csv of readings
+    speed -- replay seconds per wall clock second
+    loop -- start over at the end of the file
+    chunksize -- csv rows read at a time
+    """
+
+    def __init__(self, path, speed=1.0, loop=True, chunksize=50000):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.chunksize = chunksize
+
+        self.started = time.time()
+        self.clock_start = None
+
+        #shift of the replayed timestamps; each pass starts one bucket after the last reading of the
+        #pass before, so looped readings stay newer than the rolling aggregates' window
+        self.offset = pd.Timedelta(0)
+        self.last = None
+
+        self.open()
+
+    def open(self):
+        self.chunks = pd.read_csv(self.path, chunksize=self.chunksize, dtype={'FieldDeviceID': str},
+                                  parse_dates=['LocationTimeStamp'])
+        self.pending = None
+
+    def read(self):
+
+        """
+        returns dataframe of the readings the replay clock has passed since the last read
+        """
+
+        released = []
+        while True:
+            if self.pending is None or len(self.pending) == 0:
+                try:
+                    self.pending = next(self.chunks)[RECORD_COLUMNS]
+                except StopIteration:
+                    if self.loop and self.last is not None:
+                        self.offset = self.last + pd.Timedelta(minutes=LIVE_BUCKET_MINUTES) - self.clock_start
+                        self.open()
+                        continue
+                    break
+
+                if len(self.pending) == 0:
+                    continue
+                if self.offset:
+                    self.pending = self.pending.assign(LocationTimeStamp=self.pending['LocationTimeStamp'] + self.offset)
+                self.last = self.pending['LocationTimeStamp'].iloc[-1]
+
+            if self.clock_start is None:
+                self.clock_start = self.pending['LocationTimeStamp'].iloc[0]
+            clock = self.clock_start + pd.Timedelta(seconds=(time.time() - self.started) * self.speed)
+
+            due = self.pending['LocationTimeStamp'] <= clock
+            released.append(self.pending.loc[due])
+            self.pending = self.pending.loc[~due]
+            if len(self.pending) > 0:
+                break
+
+        if len(released) == 0:
+            return pd.DataFrame(columns=RECORD_COLUMNS)
+
+        return pd.concat(released, ignore_index=True)
+
+def make_source(spec):
+
+    """
+    returns the live source described by a RTDAP_LIVE_SOURCE value, None if spec is empty
+
+    Keyword arguments:
+    spec -- replay:<csv path> or poll:<config file>:<table>
+    """
+
+    if not spec:
+        return None
+
+    kind, _, rest = spec.partition(':')
+    if kind == 'replay':
+        return ReplaySource(rest, speed=float(os.environ.get('RTDAP_LIVE_SPEED', 1.0)))
+    if kind == 'poll':
+        config_file, table = rest.rsplit(':', 1)
+        return PollingSource(config_file, table)
+
+    raise ValueError('unknown live source {0}'.format(spec))
+
+class RingBuffer(object):
+
+    """
+    fixed size buffer of the latest rows of numeric columns, numbered by a running sequence
+    so readers can ask for the rows added since their last read
+
+    Keyword arguments:
+    columns -- dictionary of column name -> numpy dtype
+    size -- rows kept
+    """
+
+    def __init__(self, columns, size):
+        self.size = size
+        self.data = dict((col, np.zeros(size, dtype=dtype)) for col, dtype in columns.items())
+        self.seq = 0
+
+    def append(self, data):
+
+        """
+        adds rows, overwriting the oldest ones
+
+        Keyword arguments:
+        data -- dictionary of column name -> array, all the same length
+        """
+
+        n = len(next(iter(data.values())))
+        if n == 0:
+            return
+
+        skip = max(n - self.size, 0)
+        positions = (self.seq + skip + np.arange(n - skip)) % self.size
+        for col, values in data.items():
+            self.data[col][positions] = np.asarray(values)[skip:]
+
+        self.seq += n
+
+    def since(self, seq):
+
+        """
+        returns (dictionary of column -> array of the rows added after sequence number seq,
+        current sequence number); rows already overwritten are skipped
+
+        Keyword arguments:
+        seq -- sequence number of the reader's last read
+        """
+
+        start = max(seq, self.seq - self.size)
+        positions = np.arange(start, self.seq) % self.size
+
+        return dict((col, values[positions]) for col, values in self.data.items()), self.seq
+
+class RollingAggregates(object):
+
+    """
+    per corridor sums and counts of the live metrics in a ring of time buckets; readings are
+    added to their bucket as they arrive and a bucket is cleared when its slot is reused, so
+    rolling means never rescan readings and memory does not grow with uptime
+
+    Keyword arguments:
+    corridors -- corridor names
+    window_minutes -- length of the rolling window
+    bucket_minutes -- length of one bucket
+    """
+
+    def __init__(self, corridors, window_minutes=60, bucket_minutes=1):
+        self.corridors = list(corridors)
+        self.bucket_ns = int(bucket_minutes * 60 * 1e9)
+        self.n_buckets = max(int(window_minutes // bucket_minutes), 1)
+
+        n_corridors, n_metrics = len(self.corridors), len(LIVE_METRICS)
+        self.sums = np.zeros((n_corridors, self.n_buckets, n_metrics))
+        self.counts = np.zeros((n_corridors, self.n_buckets, n_metrics), dtype=np.int64)
+        self.records = np.zeros((n_corridors, self.n_buckets), dtype=np.int64)
+        self.bucket_ids = np.full(self.n_buckets, -1, dtype=np.int64)
+
+        self.latest = -1
+        self.emitted = -1
+
+    def add(self, corridor_codes, times, values):
+
+        """
+        adds readings to their corridors' buckets; readings older than the window are dropped
+
+        Keyword arguments:
+        corridor_codes -- array of corridor positions in corridors
+        times -- datetime64 array of reading times
+        values -- (readings x LIVE_METRICS) array, NaN where missing
+        """
+
+        if len(times) == 0:
+            return
+
+        ids = np.asarray(times, dtype='datetime64[ns]').view(np.int64) // self.bucket_ns
+        self.latest = max(self.latest, int(ids.max()))
+        if self.emitted < 0:
+            self.emitted = int(ids.min()) - 1
+
+        keep = ids > self.latest - self.n_buckets
+        ids, corridor_codes, values = ids[keep], corridor_codes[keep], values[keep]
+
+        #clear the slots taken over by newer buckets
+        slots = ids % self.n_buckets
+        for bucket_id in np.unique(ids):
+            slot = bucket_id % self.n_buckets
+            if self.bucket_ids[slot] < bucket_id:
+                self.sums[:, slot] = 0
+                self.counts[:, slot] = 0
+                self.records[:, slot] = 0
+                self.bucket_ids[slot] = bucket_id
+
+        #readings whose slot already holds a newer bucket are too late to count
+        current = self.bucket_ids[slots] == ids
+        cells = corridor_codes[current] * self.n_buckets + slots[current]
+        values = values[current]
+
+        size = self.records.size
+        self.records += np.bincount(cells, minlength=size).reshape(self.records.shape)
+        for i in range(len(LIVE_METRICS)):
+            present = ~np.isnan(values[:, i])
+            self.sums[:, :, i] += np.bincount(cells[present], weights=values[present, i],
+                                              minlength=size).reshape(self.records.shape)
+            self.counts[:, :, i] += np.bincount(cells[present], minlength=size).reshape(self.records.shape)
+
+    def window(self):
+
+        """
+        returns (records, means) per corridor over the buckets in the rolling window;
+        means is a (corridors x LIVE_METRICS) array
+        """
+
+        live = self.bucket_ids > self.latest - self.n_buckets
+        sums = self.sums[:, live].sum(axis=1)
+        counts = self.counts[:, live].sum(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+
+        return self.records[:, live].sum(axis=1), means
+
+    def closed(self):
+
+        """
+        returns (bucket start times as datetime64, (buckets x corridors x LIVE_METRICS) means)
+        of the buckets completed since the last call; a bucket completes when a later one starts
+        """
+
+        ids = np.arange(max(self.emitted + 1, self.latest - self.n_buckets + 1), self.latest)
+        self.emitted = max(self.emitted, self.latest - 1)
+
+        slots = ids % self.n_buckets
+        valid = self.bucket_ids[slots] == ids
+        sums = np.where(valid[None, :, None], self.sums[:, slots], 0)
+        counts = np.where(valid[None, :, None], self.counts[:, slots], 0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+
+        return (ids * self.bucket_ns).astype('datetime64[ns]'), means.transpose(1, 0, 2)
+
+class LiveFeed(object):
+
+    """
+    process wide live feed: a background thread reads the source and updates the rolling
+    corridor aggregates and the ring buffers of recent readings and completed buckets that
+    every session's periodic callback streams from
+
+    Keyword arguments:
+    source -- PollingSource, ReplaySource or any object with a read() method returning readings
+    corridor_map -- dictionary of FieldDeviceID -> corridor name; others count toward N/A
+    interval -- seconds between reads
+    """
+
+    def __init__(self, source, corridor_map, interval=LIVE_INTERVAL):
+        self.source = source
+        self.interval = interval
+
+        self.corridors = sorted(set(corridor_map.values()) | set(['N/A']))
+        self.devices = pd.Index(list(corridor_map.keys()))
+        self.device_corridors = np.array([self.corridors.index(corridor_map[d]) for d in self.devices], dtype=np.int64)
+        self.na_code = self.corridors.index('N/A')
+
+        self.aggregates = RollingAggregates(self.corridors, LIVE_WINDOW_MINUTES, LIVE_BUCKET_MINUTES)
+        self.readings = RingBuffer({'time': np.float64, 'speed': np.float32, 'volume': np.float32,
+                                    'corridor': np.int64}, LIVE_ROLLOVER)
+        self.buckets = RingBuffer(dict([('time', np.float64)] +
+                                       [('c%d' % i, np.float32) for i in range(len(self.corridors))]),
+                                  self.aggregates.n_buckets)
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.error = None
+
+    def ingest(self, records):
+
+        """
+        adds readings to the aggregates and ring buffers
+
+        Keyword arguments:
+        records -- dataframe of readings (RECORD_COLUMNS)
+        """
+
+        if len(records) == 0:
+            return
+
+        positions = self.devices.get_indexer(records['FieldDeviceID'].astype(str))
+        codes = np.where(positions >= 0, self.device_corridors[positions], self.na_code)
+        times = records['LocationTimeStamp'].values.astype('datetime64[ns]')
+        values = records[LIVE_METRICS].values.astype(np.float64)
+
+        with self.lock:
+            self.aggregates.add(codes, times, values)
+            self.readings.append({'time': times.astype('datetime64[ms]').view(np.int64).astype(np.float64),
+                                  'speed': values[:, 0], 'volume': values[:, 2], 'corridor': codes})
+
+            bucket_times, means = self.aggregates.closed()
+            if len(bucket_times):
+                closed = {'time': bucket_times.astype('datetime64[ms]').view(np.int64).astype(np.float64)}
+                for i in range(len(self.corridors)):
+                    closed['c%d' % i] = means[:, i, 0]
+                self.buckets.append(closed)
+
+    def run(self):
+
+        """
+        reads the source every interval; while reads keep failing, each failure is logged and
+        the wait doubles, up to LIVE_MAX_BACKOFF seconds
+        """
+
+        failures = 0
+        while True:
+            started = time.time()
+            try:
+                self.ingest(self.source.read())
+                if failures:
+                    logger.info('live source recovered after %d failed reads', failures)
+                self.error = None
+                failures = 0
+            except Exception as error:
+                self.error = error
+                failures += 1
+                logger.exception('live source read failed (%d in a row)', failures)
+
+            wait = min(self.interval * 2 ** failures, max(LIVE_MAX_BACKOFF, self.interval)) if failures else self.interval
+            time.sleep(max(wait - (time.time() - started), 0))
+
+    def start(self):
+
+        """
+        starts the reading thread
+        """
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='rtdap-live', daemon=True)
+            self.thread.start()
+
+    def updates(self, readings_seq, buckets_seq):
+
+        """
+        returns (new readings, new completed buckets, corridor window records and means,
+        readings sequence number, buckets sequence number) for a session's periodic callback
+
+        Keyword arguments:
+        readings_seq -- readings sequence number of the session's last update
+        buckets_seq -- buckets sequence number of the session's last update
+        """
+
+        with self.lock:
+            readings, readings_seq = self.readings.since(readings_seq)
+            buckets, buckets_seq = self.buckets.since(buckets_seq)
+            records, means = self.aggregates.window()
+
+        return readings, buckets, records, means, readings_seq, buckets_seq
+
+def device_corridors(store):
+
+    """
+    returns dictionary of FieldDeviceID -> corridor name of the devices in a store
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    pairs = set()
+    for batch in store.iter_batches(columns=['FieldDeviceID', 'corridor']):
+        batch = batch.astype(str).drop_duplicates()
+        pairs.update(zip(batch['FieldDeviceID'], batch['corridor']))
+
+    return dict(pairs)
+
+#live feed of this server process, started by get_feed()
+_feed = None
+_feed_lock = threading.Lock()
+
+def get_feed(state, spec=None):
+
+    """
+    returns the process wide LiveFeed, creating and starting it on first use; None when
+    no live source is configured
+
+    Keyword arguments:
+    state -- DashboardState whose store maps devices to corridors
+    spec -- live source (default: RTDAP_LIVE_SOURCE environment variable)
+    """
+
+    global _feed
+
+    spec = os.environ.get('RTDAP_LIVE_SOURCE', '') if spec is None else spec
+    if not spec or state is None:
+        return None
+
+    with _feed_lock:
+        if _feed is None:
+            _feed = LiveFeed(make_source(spec), device_corridors(state.store))
+            _feed.start()
+
+    return _feed
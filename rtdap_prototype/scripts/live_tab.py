@@ -0,0 +1,149 @@
+#libraries
+import numpy as np
+
+#bokeh
+from bokeh.plotting import figure
+from bokeh.layouts import column, row
+from bokeh.models import Spacer, HoverTool, ColumnDataSource, LinearColorMapper, Legend, LegendItem
+from bokeh.models.widgets import Div, DataTable, TableColumn, NumberFormatter
+from bokeh.palettes import Category10
+from bokeh.io import curdoc
+
+from scripts.live import LIVE_INTERVAL, LIVE_ROLLOVER, LIVE_WINDOW_MINUTES
+from scripts.select import update_source
+from scripts.instrument import instrumented
+
+def live_tab(feed):
+
+    def window_data(records, means):
+        """
+        returns column data of the rolling window table
+
+        Keyword arguments:
+        records -- readings per corridor in the window
+        means -- (corridors x LIVE_METRICS) window means
+        """
+        return {'corridor': list(feed.corridors),
+                'Readings': records,
+                'Speed': np.nan_to_num(means[:, 0]),
+                'Occupancy': np.nan_to_num(means[:, 1]),
+                'Volume': np.nan_to_num(means[:, 2])}
+
+    def window_table(source):
+        """
+        returns bokeh DataTable of the rolling corridor means
+
+        Keyword arguments:
+        source -- ColumnDataSource of column data derived from window_data()
+        """
+        columns = [TableColumn(field='corridor', title='Corridor', width=150),
+                   TableColumn(field='Readings', title='Readings', formatter=NumberFormatter(format='0,0')),
+                   TableColumn(field='Speed', title='Speed', formatter=NumberFormatter(format='0,0.0')),
+                   TableColumn(field='Occupancy', title='Occupancy', formatter=NumberFormatter(format='0,0.00')),
+                   TableColumn(field='Volume', title='Volume', formatter=NumberFormatter(format='0,0.0'))]
+
+        return DataTable(source=source, columns=columns, width=550, height=175,
+                         index_position=None, sortable=False, css_classes=["w3-small"])
+
+    def bucket_chart(source):
+        """
+        returns bokeh line chart of each corridor's mean speed per completed bucket
+
+        Keyword arguments:
+        source -- ColumnDataSource streamed from LiveFeed.buckets
+        """
+        p = figure(plot_width=650, plot_height=250, x_axis_type='datetime', toolbar_location="above",
+                   title="Mean Speed by Corridor", tools=['pan', 'wheel_zoom', 'reset'])
+
+        items = []
+        for i, corr in enumerate(feed.corridors):
+            line = p.line(x='time', y='c%d' % i, color=palette[i], line_width=2, source=source)
+            items.append(LegendItem(label=corr, renderers=[line]))
+        p.add_layout(Legend(items=items, label_text_font_size='8pt'), 'right')
+
+        p.background_fill_alpha = 0.5
+        p.border_fill_color = None
+
+        return p
+
+    def readings_chart(source):
+        """
+        returns bokeh scatter of the latest readings' speeds
+
+        Keyword arguments:
+        source -- ColumnDataSource streamed from LiveFeed.readings
+        """
+        hover = HoverTool(tooltips=[("Speed", "@speed{0.0}"), ("Volume", "@volume{0,0}")])
+        p = figure(plot_width=650, plot_height=250, x_axis_type='datetime', toolbar_location="above",
+                   title="Latest Readings", tools=['pan', 'wheel_zoom', 'reset', hover])
+
+        color_mapper = LinearColorMapper(palette=palette, low=0, high=len(palette) - 1)
+        p.circle(x='time', y='speed', size=3, alpha=0.5, line_color=None, source=source,
+                 fill_color={'field': 'corridor', 'transform': color_mapper})
+
+        p.background_fill_alpha = 0.5
+        p.border_fill_color = None
+
+        return p
+
+
+
+    """
+    return live tab contents
+
+    Keyword arguments:
+    feed -- LiveFeed shared by the server's sessions
+    """
+
+    doc = curdoc()
+    palette = (Category10[10] * (len(feed.corridors) // 10 + 1))[:max(len(feed.corridors), 3)]
+
+    #sequence numbers of the feed's ring buffers this session has streamed up to
+    streamed = {'readings': 0, 'buckets': 0}
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #update_live -- periodic callback streaming what the feed received since the last update
+
+    @instrumented(doc)
+    def update_live():
+
+        """
+        streams new readings and completed buckets to the charts and patches the window table;
+        the work done follows the new readings, not the window or uptime
+        """
+
+        readings, buckets, records, means, streamed['readings'], streamed['buckets'] = \
+            feed.updates(streamed['readings'], streamed['buckets'])
+
+        if len(readings['time']):
+            readings_src.stream(readings, rollover=LIVE_ROLLOVER)
+            status.text = "Latest reading: %s" % np.datetime64(int(readings['time'].max()), 'ms')
+        if len(buckets['time']):
+            bucket_src.stream(buckets, rollover=feed.aggregates.n_buckets)
+        if feed.error is not None:
+            status.text = "Live source error: %s" % feed.error
+
+        update_source(window_src, window_data(records, means))
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #Create content
+
+    title = Div(text="<h1>Live Detector Feed</h1>", width=2000, css_classes=["w3-panel", "w3-white"])
+    status = Div(text="Waiting for readings", css_classes=["w3-panel"])
+    window_text = Div(text="Rolling %d minute corridor means" % LIVE_WINDOW_MINUTES, css_classes=["w3-panel"])
+
+    window_src = ColumnDataSource(data=window_data(*feed.aggregates.window()))
+    readings_src = ColumnDataSource(data=dict((col, []) for col in feed.readings.data))
+    bucket_src = ColumnDataSource(data=dict((col, []) for col in feed.buckets.data))
+
+    doc.add_periodic_callback(update_live, int(LIVE_INTERVAL * 1000))
+
+    return column(title,
+                  row(Spacer(width=20),
+                      column(status, window_text,
+                             row(window_table(window_src), css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             Spacer(height=10),
+                             row(bucket_chart(bucket_src), css_classes=["w3-panel", "w3-white", "w3-card-4"]),
+                             Spacer(height=10),
+                             row(readings_chart(readings_src), css_classes=["w3-panel", "w3-white", "w3-card-4"]))),
+                  css_classes=["w3-container", "w3-light-grey"])
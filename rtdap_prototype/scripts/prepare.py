@@ -0,0 +1,72 @@
+#libraries
+import pandas as pd
+import numpy as np
+
+#hour of day (0-23) to time of day category (1-8)
+TOD_BUCKETS = np.array([1,1,1,1,1,1,2,3,3,4,5,5,5,5,6,6,7,7,8,8,1,1,1,1], dtype=np.int8)
+
+DOW_NAMES = ['Monday','Tuesday','Wednesday','Thursday','Friday']
+
+METRIC_COLUMNS = ['avgSpeed','avgOccupancy','avgVolume']
+MISSING_COLUMNS = ['missing_speed','missing_occ','missing_vol']
+
+#clock hour (0-23) of each row, kept for the sensor-hour coverage bitmaps
+CLOCK_HOUR = 'clock_hour'
+
+def memory_mb(df):
+
+    """
+    returns memory used by a dataframe in megabytes, including python objects
+
+    Keyword arguments:
+    df -- dataframe to measure
+    """
+
+    return df.memory_usage(deep=True).sum() / 1024.0**2
+
+def prepare_vds_table(vds_table, verbose=False):
+
+    """
+    returns vds detail rows with corridor, time of day, date and day of week
+    fields formatted for the dashboard, stored with compact dtypes
+
+    Keyword arguments:
+    vds_table -- dataframe read from vds_table_2008_2018.csv
+    verbose -- print the memory used before and after preparing the table
+    """
+
+    before = memory_mb(vds_table) if verbose else 0
+
+    df = pd.DataFrame(index=vds_table.index)
+
+    df['FieldDeviceID'] = vds_table['FieldDeviceID'].astype('category')
+
+    for col in METRIC_COLUMNS:
+        df[col] = vds_table[col].astype(np.float32)
+
+    #day of week 1-5 to names, anything else is left missing
+    dow_codes = vds_table['dow'].fillna(0).values.astype(np.int8) - 1
+    dow_codes[(dow_codes < 0) | (dow_codes >= len(DOW_NAMES))] = -1
+    df['dow'] = pd.Categorical.from_codes(dow_codes, categories=DOW_NAMES, ordered=True)
+
+    df['year'] = vds_table['year'].astype(np.int16)
+    df['month'] = vds_table['month'].astype(np.int8)
+    df['day'] = vds_table['day'].astype(np.int8)
+    df['hour'] = TOD_BUCKETS[vds_table['hour'].values.astype(np.int64)]
+    df[CLOCK_HOUR] = vds_table['hour'].values.astype(np.int8)
+
+    corridor = vds_table['corridor'].astype(object).fillna('N/A')
+    corridor = corridor.where(~corridor.isin(['0', 0]), 'N/A')
+    df['corridor'] = corridor.astype(str).astype('category')
+
+    for col in MISSING_COLUMNS:
+        if col in vds_table.columns:
+            df[col] = vds_table[col].fillna(0).astype(np.int8)
+
+    df['date'] = pd.to_datetime(vds_table[['year','month','day']])
+
+    if verbose:
+        after = memory_mb(df)
+        print('vds table memory: {0:,.1f} MB -> {1:,.1f} MB ({2:,.1f} MB saved)'.format(before, after, before - after))
+
+    return df
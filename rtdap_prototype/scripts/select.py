@@ -1,287 +1,687 @@
 #libraries
+import os
+import logging
 import pandas as pd
 import numpy as np
-import random
 from datetime import datetime, date
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 #bokeh
-from bokeh.io import show, output_notebook, push_notebook
 from bokeh.plotting import figure
 
-from bokeh.layouts import layout, column, row, WidgetBox
-from bokeh.models import CustomJS, Panel, Spacer, HoverTool, LogColorMapper, ColumnDataSource,FactorRange, RangeSlider,NumeralTickFormatter
-from bokeh.models.widgets import Div, Tabs, Paragraph, Dropdown, Button, PreText, Toggle, Select,DatePicker,DateRangeSlider
-
-from bokeh.tile_providers import STAMEN_TERRAIN_RETINA,CARTODBPOSITRON_RETINA
-#mapping
-from shapely.geometry import Polygon, Point, MultiPoint, MultiPolygon
-import geopandas as gpd
-
-from bokeh.transform import factor_cmap
-from bokeh.application.handlers import FunctionHandler
-from bokeh.application import Application
-from bokeh.core.properties import value
+from bokeh.layouts import column, row
+from bokeh.models import Spacer, HoverTool, LogColorMapper, ColumnDataSource, RangeSlider,NumeralTickFormatter,\
+                         Range1d, LinearColorMapper
+from bokeh.models.widgets import Div, Button, Select,DatePicker, DataTable, TableColumn, NumberFormatter
 
 #color
-from bokeh.palettes import Spectral6
+from bokeh.palettes import Viridis256, RdYlGn11
 
 from bokeh.io import curdoc
 
+from scripts.state import as_state
+from scripts.cache import selection_cache, selection_key
+from scripts.histogram import metric_histograms, device_means, device_differences
+from scripts.density import DENSITY_PLOTS, scatter_points, data_extent, density_image, density_grid_size
+from scripts.instrument import metrics, instrumented, NULL_TRACE
+from scripts.client_filter import CLIENT_FILTER, client_cube_data, client_baseline_data, summary_callback
+
+logger = logging.getLogger('rtdap.select')
+
+#selection computations run here instead of on the bokeh server event loop, shared by all sessions;
+#pool size set with the RTDAP_WORKERS environment variable
+selection_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('RTDAP_WORKERS', 4)))
+
+#metric columns, labels and missing value columns shown for a selection
+METRICS = [('avgSpeed','Speed','missing_speed'),
+           ('avgOccupancy','Occupancy','missing_occ'),
+           ('avgVolume','Volume','missing_vol')]
+
+#grid size of the density plots
+DENSITY_GRID = density_grid_size(300, 250)
+
+def hbar_data(df, col):
+    """
+    returns column data of the mean % diff barchart, ordered speed, occupancy, volume from the top
+
+    Keyword arguments:
+    df -- summary dataframe indexed by metric label
+    col -- column name for values to diplay in graph
+    """
+    values = df[col].fillna(0).values
+    labels = df.index.values
+
+    order = np.zeros(len(df), dtype=int)
+    order = np.where(labels == 'Speed', 2, order)
+    order = np.where(labels == 'Occupancy', 1, order)
+    order = np.where(labels == 'Volume', 0, order)
+
+    color = np.where(values < -.05, '#FF0000', np.where(values > .05, '#008000', '#C0C0C0'))
+
+    sort = np.argsort(order)
+
+    return {'type': labels[sort].tolist(),
+            'order': order[sort],
+            'color': color[sort].tolist(),
+            col: values[sort]}
+
+def table_data(df):
+    """
+    returns column data of the summary table
+
+    Keyword arguments:
+    df -- summary dataframe indexed by metric label
+    """
+    df = df.fillna(0)
+
+    return {'attribute': df.index.values.tolist(),
+            'Frequency': df['Frequency'].values,
+            'Mean': df['Mean'].values,
+            'Mean Diff': df['Mean Diff'].values,
+            'Missing Values': df['Missing Values'].values}
+
+def source_data(data):
+    """
+    returns a copy of column data for a ColumnDataSource to own; patches write into a source's
+    column arrays in place, so a source must never hold arrays shared through selection_cache
+
+    Keyword arguments:
+    data -- column data
+    """
+    def copy(values):
+        if isinstance(values, np.ndarray):
+            return np.array(values, copy=True)
+        return [np.array(v, copy=True) if isinstance(v, np.ndarray) else v for v in values]
+
+    return dict((key, copy(values)) for key, values in data.items())
+
+def update_source(source, data):
+    """
+    updates a ColumnDataSource in place: with patches of the changed columns when the row
+    count is unchanged, otherwise by replacing its data with a copy (see source_data())
+
+    Keyword arguments:
+    source -- ColumnDataSource to update
+    data -- new column data
+    """
+    old = source.data
+    lengths = set(len(v) for v in data.values())
+    if set(old.keys()) != set(data.keys()) or lengths != set(len(v) for v in old.values()):
+        source.data = source_data(data)
+        return
+
+    patches = {}
+    for key, values in data.items():
+        old_values, new_values = np.asarray(old[key]), np.asarray(values)
+        #float columns compare NaN as equal, and are patched as arrays so NaN is serialized
+        if old_values.dtype.kind == 'f' and new_values.dtype.kind == 'f':
+            if not np.array_equal(old_values, new_values, equal_nan=True):
+                patches[key] = [(slice(0, len(values)), np.array(new_values, copy=True))]
+        elif not np.array_equal(old_values, new_values):
+            patches[key] = [(slice(0, len(values)), list(values))]
+
+    if patches:
+        source.patch(patches)
+
+def make_base_map(tile_map=None,map_width=800,map_height=500, xaxis=None, yaxis=None,
+                xrange=(-9990000,-9619944), yrange=(5011119,5310000),plot_tools="pan,wheel_zoom,reset,save",
+                sensor_source=None):
+
+    """
+    returns bokeh map figure with a tile layer and, when given a sensor source,
+    the detector locations colored by their selection metric
+
+    Keyword arguments:
+    sensor_source -- ColumnDataSource of the visible sensors, derived from sensor_data()
+    """
+
+    p = figure(tools=plot_tools, width=map_width,height=map_height, x_axis_location=xaxis, y_axis_location=yaxis,
+                x_range=Range1d(*xrange), y_range=Range1d(*yrange), toolbar_location="above")
+
+    p.grid.grid_line_color = None
+    #p.background_fill_color = None
+    p.background_fill_alpha = 0.5
+    p.border_fill_color = None
+
+    #tile sources are models and can only belong to one session's document;
+    #the tile providers module is only imported by the first map
+    if tile_map is None:
+        from bokeh.tile_providers import get_provider, Vendors
+        tile_map = get_provider(Vendors.CARTODBPOSITRON_RETINA)
+
+    p.add_tile(tile_map)
+
+    if sensor_source is not None:
+        #negative mean differences red, positive green, as in the mean difference barchart
+        color_mapper = LinearColorMapper(palette=list(reversed(RdYlGn11)), low=-.25, high=.25, nan_color='#808080')
+        sensors = p.circle(x='x', y='y', size=7, line_color='black', line_width=0.5, alpha=0.9,
+                           fill_color={'field': 'value', 'transform': color_mapper}, source=sensor_source)
+
+        p.add_tools(HoverTool(renderers=[sensors],
+                              tooltips=[("Sensor", "@id"),
+                                        ("Road", "@road @direction"),
+                                        ("% Difference", "@value{0.0%}")]))
+
+    return p
+
+def rtdap_avg(baselines,corr,value):
+
+    """
+    returns mean for specificed attribute by highway corridor
+
+    Keyword arguments:
+    baselines -- corridor baseline means from load_baselines()
+    corr -- corridor name
+    value -- dataframe column name to calculate mean
+    """
+
+    return baselines.get(corr, {}).get(value, np.nan)
+
+def filter_selection(index, corr, date_s, date_e, weekday, tod):
+
+    """
+    returns subset of data based on corridor and time selections
+
+    Keyword arguments:
+    index -- SelectionIndex of the corridor data to filter by time selections
+    corr -- corridor name
+    date_s -- start date
+    date_e -- end date
+    weekday -- day of week (Monday - Friday)
+    tod -- time of day (8 tod time periods)
+    """
+
+    date_start = datetime.strptime(date_s, '%Y-%m-%d')
+    date_end = datetime.strptime(date_e, '%Y-%m-%d')
+
+    return index.select(corr, date_start, date_end, weekday, tod)
+
+def summarize_metrics(cells, corr, avg, select, label, missing, absent=0):
+
+    """
+    return a summary of frequency, mean, mean difference, and count of missing values: readings
+    flagged missing plus expected sensor-hours with no record at all
+
+    Keyword arguments:
+    cells -- aggregate cube cells of the selection to summarize
+    corr -- corridor name
+    avg -- mean value derived from rtdap_avg(), used calculate mean diff
+    select -- dateframe column name to calculate mean
+    label -- name for values being calculate (ie Speed, Volumne, Time etc)
+    missing -- dataframe column name of missing values
+    absent -- expected sensor-hours of the selection without a record, from the coverage bitmaps
+    """
+
+    if len(cells) == 0:
+        return pd.DataFrame(columns=['Frequency','Mean','Mean Diff','Missing Values'],
+                            index=pd.Index([], name=corr))
+
+    count = cells[select + '_count'].sum()
+    mean = cells[select + '_sum'].sum() / count if count > 0 else np.nan
+
+    df_summary = pd.DataFrame({'Frequency': [int(cells['rows'].sum())],
+                               'Mean': [mean],
+                               'Mean Diff': [(avg - mean)/mean],
+                               'Missing Values': [int(cells[missing].sum()) + absent]},
+                              index=pd.Index([label], name=corr))
+
+    return df_summary[['Frequency','Mean','Mean Diff','Missing Values']]
+
+def summarize_selection(state, cells, corr, date_s, date_e, weekday, tod):
+
+    """
+    returns summary table of a selection, one summarize_metrics() row per metric; a sensor-hour
+    without a record is counted missing for every metric
+
+    Keyword arguments:
+    state -- DashboardState the selection is made against
+    cells -- aggregate cube cells of the selection
+    corr, date_s, date_e, weekday, tod -- the selection
+    """
+
+    absent = state.coverage.absent(corr, date_s, date_e, weekday, tod) if state.coverage is not None else 0
+
+    return pd.concat([summarize_metrics(cells, corr, rtdap_avg(state.baselines, corr, col), col, label, missing, absent)
+                      for col, label, missing in METRICS])
+
+def vbar_chart(source, label):
+    """
+    returns bokeh vertical barchart representing a metric's difference distribution
+
+    Keyword arguments:
+    source -- ColumnDataSource of column data derived from metric_histograms()
+    label -- name of the metric (ie Speed, Occupancy, Volume)
+    """
+    p = figure(plot_width=1000, plot_height=150, title="%s Difference Distribution" % label, toolbar_location="above")
+
+    #bars span their bin; the metric's bins are evenly spaced (see HISTOGRAM_BINS)
+    bins = source.data['bins']
+    p.vbar(x='bins' , top='difference', width=float(bins[1] - bins[0]) if len(bins) > 1 else 1,
+           color='navy', alpha=0.5, source = source)
+
+    #p.yaxis.visible = False
+    #p.xaxis.formatter = NumeralTickFormatter(format="0.f%")
+    p.xgrid.visible = False
+    p.ygrid.visible = False
+    #p.background_fill_color = None
+    p.background_fill_alpha = 0.5
+    p.border_fill_color = None
+
+    return p
+
+def hbar_chart(source,col):
+    """
+    returns bokeh horizontal barchart representing mean % diff
+
+    Keyword arguments:
+    source -- ColumnDataSource of column data derived from hbar_data()
+    col -- column name for values to diplay in graph
+    """
+    hover = HoverTool(
+            tooltips=[
+                ("Corridor Attribute", "@type"),
+                ("% Difference", "@{%s}" % (col) + '{%0.2f}'),
+            ]
+        )
+    tools = ['reset','save',hover]
+    p = figure(plot_width=400, plot_height=175, toolbar_location="above",
+               title = 'Mean Difference', tools = tools)
+
+    p.hbar(y='order', height=0.5, left=0,fill_color ='color',line_color=None,
+           right=col, color="navy", source = source)
+
+    p.yaxis.visible = False
+    p.xaxis.formatter = NumeralTickFormatter(format="0.f%")
+    p.xgrid.visible = False
+    p.ygrid.visible = False
+    #p.background_fill_color = None
+    p.background_fill_alpha = 0.5
+    p.border_fill_color = None
+
+    return p
+
+def summary_data_table(source):
+    """
+    returns bokeh DataTable of the selection summary
+
+    Keyword arguments:
+    source -- ColumnDataSource of column data derived from table_data()
+    """
+    columns = [TableColumn(field='attribute', title='Attribute', width=100),
+               TableColumn(field='Frequency', title='Frequency', formatter=NumberFormatter(format='0,0')),
+               TableColumn(field='Mean', title='Mean', formatter=NumberFormatter(format='0,0.0')),
+               TableColumn(field='Mean Diff', title='Mean Diff', formatter=NumberFormatter(format='0.0%')),
+               TableColumn(field='Missing Values', title='Missing Values', formatter=NumberFormatter(format='0,0'))]
+
+    return DataTable(source=source, columns=columns, width=550, height=150,
+                     index_position=None, sortable=False, css_classes=["w3-small"])
+
+def density_plot(source, title_text, x_range, y_range, x_axis_type='linear', width=300, height=250):
+    """
+    returns bokeh figure drawing a scatter of the selected rows as a density raster;
+    the image is binned on the server for the current viewport
+
+    Keyword arguments:
+    source -- ColumnDataSource of column data derived from density_image()
+    title_text -- plot title
+    x_range -- (start, end) of the initial x axis range
+    y_range -- (start, end) of the initial y axis range
+    x_axis_type -- bokeh axis type of the x axis (linear or datetime)
+    width -- plot width in pixels
+    height -- plot height in pixels
+    """
+    hover = HoverTool(tooltips=[("Sensor-hours", "@image{0,0}")])
+
+    p = figure(plot_width=width, plot_height=height, tools=['pan', 'wheel_zoom', 'box_zoom', 'reset', hover],
+               toolbar_location="above", title=title_text, x_axis_type=x_axis_type,
+               x_range=Range1d(*x_range), y_range=Range1d(*y_range))
+
+    color_mapper = LogColorMapper(palette=Viridis256, nan_color='rgba(0, 0, 0, 0)')
+    p.image(image='image', x='x', y='y', dw='dw', dh='dh', color_mapper=color_mapper, source=source)
+
+    #p.background_fill_color = None
+    p.background_fill_alpha = 0.5
+    p.border_fill_color = None
+
+    return p
+
+def compute_selection(state, corr, date_s, date_e, weekday, tod, trace=NULL_TRACE):
+
+    """
+    returns summary table and the column data of the table and charts for a selection
+
+    Keyword arguments:
+    state -- DashboardState the selection is made against
+    corr -- corridor name
+    date_s -- start date
+    date_e -- end date
+    weekday -- day of week (Monday - Friday)
+    tod -- time of day (8 tod time periods)
+    trace -- Trace recording the stage timings and row counts of the selection
+    """
+
+    corr_index = state.corridor_index(corr)
+
+    with trace.stage('filter'):
+        filtered_data = filter_selection(corr_index, corr, date_s, date_e, weekday, tod)
+        selected_cells = filter_selection(state.cube_index, corr, date_s, date_e, weekday, tod)
+    trace.count('rows', len(filtered_data))
+    trace.count('cells', len(selected_cells))
+
+    with trace.stage('summarize'):
+        summary_df = summarize_selection(state, selected_cells, corr, date_s, date_e, weekday, tod)
+
+    with trace.stage('histogram'):
+        devices, full_means = state.device_baselines(corr)
+        selected_means = device_means(filtered_data, devices)
+        hist_data = metric_histograms(devices, full_means, filtered_data, selected_means=selected_means)
+
+    #scatter points of the selection, and their density raster over the full extent
+    scatter = {}
+    with trace.stage('density'):
+        for name, (title, x, y) in DENSITY_PLOTS.items():
+            x_values, y_values = scatter_points(filtered_data, x, y)
+            x_range, y_range = data_extent(x_values), data_extent(y_values)
+            scatter[name] = {'points': (x_values, y_values),
+                             'view': x_range + y_range,
+                             'image': density_image(x_values, y_values, x_range, y_range, *DENSITY_GRID)}
+
+    return {'summary': summary_df,
+            'table_data': table_data(summary_df),
+            'bar_data': hbar_data(summary_df,'Mean Diff'),
+            'hist_data': hist_data,
+            'scatter': scatter,
+            'device_diff': {'devices': devices, 'values': device_differences(full_means, selected_means)}}
+
+def cached_selection(state, corr, date_s, date_e, weekday, tod, trace=NULL_TRACE):
+
+    """
+    returns compute_selection() results, from the shared selection cache when
+    any session has made the same selection against the same data
+    """
+
+    key = selection_key(state.data_key, corr, date_s, date_e, weekday, tod)
+
+    computed = []
+    def compute():
+        computed.append(True)
+        return compute_selection(state, corr, date_s, date_e, weekday, tod, trace)
+
+    results = selection_cache.get_or_compute(key, compute)
+    trace.count('cache_hits', 0 if computed else 1)
+
+    return results
+
 def selection_tab(rtdap_data):
 
-    def make_base_map(tile_map=CARTODBPOSITRON_RETINA,map_width=800,map_height=500, xaxis=None, yaxis=None,
-                    xrange=(-9990000,-9619944), yrange=(5011119,5310000),plot_tools="pan,wheel_zoom,reset,save"):
+    """
+    return selection tab contents
+
+    Keyword arguments:
+    rtdap_data - DashboardState shared by the server's sessions (or a VDSStore / dataframe)
+                 containing rtdap vds detail data
+    """
+
+    state = as_state(rtdap_data)
+
+    #session document, the number and future of the latest submitted selection, and the corridor shown
+    doc = curdoc()
+    requests = {'latest': 0, 'future': None, 'shown': None}
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #submit_selection -- Data Selection Update Function
+
+    def submit_selection():
+
+        """
+        python callback to update table and visual content based on
+        user selections in the data review panel; the selection is computed
+        in selection_executor and applied on a later tick of the session's document
+        """
+
+        if requests['future'] is not None:
+            requests['future'].cancel()
 
-        p = figure(tools=plot_tools, width=map_width,height=map_height, x_axis_location=xaxis, y_axis_location=yaxis,
-                    x_range=xrange, y_range=yrange, toolbar_location="above")
+        requests['latest'] += 1
+        request_id = requests['latest']
 
-        p.grid.grid_line_color = None
-        #p.background_fill_color = None
-        p.background_fill_alpha = 0.5
-        p.border_fill_color = None
+        #timed from the click until the results are applied to the document
+        trace = metrics.trace('submit_selection', doc)
 
-        p.add_tile(tile_map)
+        corr = corridor_select.value
+        future = selection_executor.submit(cached_selection, state, corr,
+                                           str(date_picker_start.value),
+                                           str(date_picker_end.value),
+                                           day_of_week.value,
+                                           time_of_day.value,
+                                           trace)
+        requests['future'] = future
 
-        return p
+        future.add_done_callback(lambda f: doc.add_next_tick_callback(partial(apply_selection, request_id, corr, f, trace)))
 
-    def rtdap_avg(df,corr,value):
+    def apply_selection(request_id, corr, future, trace=NULL_TRACE):
 
         """
-        returns mean for specificed attribute by highway corridor
+        updates table and visual content with a computed selection, unless the
+        session has submitted a newer selection since
 
         Keyword arguments:
-        df -- dataframe to filter by corridor and calculate mean
-        corr -- corridor name
-        value -- dataframe column name to calculate mean
+        request_id -- submit_selection request number of the result
+        corr -- corridor name of the selection
+        future -- completed future holding compute_selection() results
+        trace -- Trace of the selection started by submit_selection
         """
 
-        df_corr = df.loc[df['corridor'] == corr]
-        mean_value = df_corr[value].mean()
+        if request_id != requests['latest'] or future.cancelled():
+            trace.count('dropped', 1)
+            trace.finish()
+            return
 
-        return mean_value
+        try:
+            results = future.result()
+        except Exception:
+            #the shown selection stays in place, with a note that this one failed
+            logger.exception('selection of %s failed', corr)
+            trace.count('errors', 1)
+            trace.finish()
+            summary_title.text = ("<h1>"+requests['shown']+" Summary</h1>"
+                                  "<p>The "+corr+" selection could not be computed, please try again.</p>")
+            return
 
-    def filter_selection(df, corr, date_s, date_e, weekday, tod):
+        requests['shown'] = corr
+
+        with trace.payload(doc):
+            summary_title.text = "<h1>"+corr+" Summary</h1>"
+
+            update_source(summary_table_src, results['table_data'])
+            update_source(bar_viz_src, results['bar_data'])
+            for col, label, missing in METRICS:
+                update_source(diff_vbar_srcs[col], results['hist_data'][col])
+
+            for name in DENSITY_PLOTS:
+                show_density(name, results['scatter'][name])
+
+            if state.sensors is not None:
+                sensor_view['device_diff'] = results['device_diff']
+                color_sensors()
+
+        trace.finish()
+
+    #-----------------------------------------------------------------------------------------------------------------
+    #density plots -- re-binned on the server when a plot's viewport changes
+
+    def show_density(name, scatter):
 
         """
-        returns subset of data based on corridor and time selections
+        shows a selection's points in a density plot, resetting the plot to their extent
 
         Keyword arguments:
-        df -- dataframe to filter by corridor and time selections
-        corr -- corridor name
-        date_s -- start date
-        date_e -- end date
-        weekday -- day of week (Monday - Friday)
-        tod -- time of day (8 tod time periods)
+        name -- DENSITY_PLOTS key of the plot
+        scatter -- compute_selection() scatter results of the plot
         """
 
-        tod_start = tod[0]
-        tod_end = tod[1]
-        date_start = datetime.strptime(date_s, '%Y-%m-%d')
-        date_end = datetime.strptime(date_e, '%Y-%m-%d')
+        view = density_views[name]
+        view['points'] = scatter['points']
+        view['shown'] = scatter['view']
+        view['latest'] += 1
+
+        p = density_figs[name]
+        p.x_range.update(start=scatter['view'][0], end=scatter['view'][1],
+                         reset_start=scatter['view'][0], reset_end=scatter['view'][1])
+        p.y_range.update(start=scatter['view'][2], end=scatter['view'][3],
+                         reset_start=scatter['view'][2], reset_end=scatter['view'][3])
 
-        if weekday == 'All':
-            weekday = df['dow'].drop_duplicates().values.tolist()
-        else:
-            weekday = [weekday]
+        density_srcs[name].data = source_data(scatter['image'])
 
-        select_df = df.loc[(df['corridor'] == corr) &\
-                           (df['date']>=date_start) & (df['date']<=date_end) &\
-                           (df['dow'].isin(weekday)) &\
-                           (df['hour']>=tod_start) & (df['hour']<=tod_end)]
+    def range_changed(name):
+
+        """
+        schedules one re-binning of a density plot for the range changes of the current tick,
+        so a pan that moves both ends of both axes is binned once
+        """
 
-        return select_df
+        if not density_views[name]['pending']:
+            density_views[name]['pending'] = True
+            doc.add_next_tick_callback(partial(submit_density, name))
 
-    def summarize_metrics(df, corr, group, avg, select, label, missing):
+    def submit_density(name):
 
         """
-        return a summary of frequency, mean, mean difference, and count of missing values
+        bins a density plot's points for its current viewport in selection_executor
 
         Keyword arguments:
-        df -- dataframe to summarize
-        corr -- corridor name
-        group -- dataframe column name used to group and summarize data
-        avg -- mean value derived from rtdap_avg(), used calculate mean diff
-        select -- dateframe column name to calculate mean
-        label -- name for values being calculate (ie Speed, Volumne, Time etc)
-        missing -- dataframe column name of missing values
+        name -- DENSITY_PLOTS key of the plot
         """
 
-        df['freq'] = 1
-        df_groupby = df.groupby(group).agg({'freq':'count',
-                                        select:np.mean,
-                                        missing:sum}).reset_index()
+        view = density_views[name]
+        view['pending'] = False
 
-        df_groupby.loc[:,'Mean Diff'] = (avg - df_groupby[select])/df_groupby[select]
-        df_groupby.loc[:, group] = label
-        df_groupby.columns = [corr, 'Frequency','Mean', 'Missing Values','Mean Diff']
-        df_groupby = df_groupby.set_index(corr)
+        p = density_figs[name]
+        viewport = (p.x_range.start, p.x_range.end, p.y_range.start, p.y_range.end)
+        if viewport == view['shown'] or any(v is None for v in viewport):
+            return
 
-        return df_groupby[['Frequency','Mean','Mean Diff','Missing Values']]
+        view['shown'] = viewport
+        view['latest'] += 1
+        request_id = view['latest']
+
+        x_values, y_values = view['points']
+        future = selection_executor.submit(density_image, x_values, y_values,
+                                           viewport[:2], viewport[2:], *DENSITY_GRID)
+
+        future.add_done_callback(lambda f: doc.add_next_tick_callback(partial(apply_density, name, request_id, f)))
+
+    @instrumented(doc)
+    def apply_density(name, request_id, future):
 
-    def vbar_chart(full_df, df):
         """
-        returns bokeh horizontal barchart representing mean % diff
+        shows a re-binned density image unless the plot has moved on since it was submitted
 
         Keyword arguments:
-        df -- dataframe to derive content of barchart
-        col -- column name for values to diplay in graph
+        name -- DENSITY_PLOTS key of the plot
+        request_id -- submit_density request number of the image
+        future -- completed future holding density_image() results
         """
-        df_avg = full_df.groupby('FieldDeviceID').agg({'avgSpeed':np.mean})
 
-        df_select= df.groupby('FieldDeviceID').agg({'avgSpeed':np.mean})
-        df_select.columns = ['speed']
+        if request_id != density_views[name]['latest'] or future.cancelled():
+            return
 
-        diff = df_avg.merge(df_select,how='left',left_index=True, right_index=True).fillna(0)
-        diff_no_zero = diff.loc[(diff['avgSpeed'] > 0 )& (diff['speed'] > 0)]
-        diff_no_zero['speed_difference'] = diff_no_zero['avgSpeed'] - diff_no_zero['speed']
-        diff_no_zero = diff_no_zero.reset_index()
+        try:
+            image = future.result()
+        except Exception:
+            #the shown image stays in place; the next pan or zoom bins the viewport again
+            logger.exception('density binning of %s failed', name)
+            density_views[name]['shown'] = None
+            return
 
-        diff_no_zero['bins'] = pd.cut(diff_no_zero['speed_difference'],bins=list(range(-20,22)),
-                                     labels = list(range(-20,22))[:-1])
+        density_srcs[name].data = image
 
-        source = ColumnDataSource(data = diff_no_zero.groupby('bins').agg({'speed_difference':'count'}).reset_index())
+    #-----------------------------------------------------------------------------------------------------------------
+    #sensor layer -- only the sensors inside the base map viewport are sent, thinned by zoom level
 
-        p = figure(plot_width=1000, plot_height=150, title="Speed Difference Distribution", toolbar_location="above")
+    def color_sensors():
 
-        p.vbar(x='bins' , top='speed_difference', width=1, color='navy', alpha=0.5, source = source)
+        """
+        sets the metric value of every sensor from the latest selection and the map metric, and redraws the layer
+        """
 
-        #p.yaxis.visible = False
-        #p.xaxis.formatter = NumeralTickFormatter(format="0.f%")
-        p.xgrid.visible = False
-        p.ygrid.visible = False
-        #p.background_fill_color = None
-        p.background_fill_alpha = 0.5
-        p.border_fill_color = None
+        col = [m[0] for m in METRICS if m[1] == map_metric.value][0]
+        device_diff = sensor_view['device_diff']
 
-        return p
+        positions = device_diff['devices'].get_indexer(state.sensors.sensors['id'])
+        values = device_diff['values'][:, [m[0] for m in METRICS].index(col)]
+
+        sensor_view['values'] = np.where(positions >= 0, values[positions], np.nan)
+        show_sensors()
+
+    def sensor_data(positions):
 
-    def hbar_chart(df,col):
         """
-        returns bokeh horizontal barchart representing mean % diff
+        returns column data of the sensors at positions of the sensor index
 
         Keyword arguments:
-        df -- dataframe to derive content of barchart
-        col -- column name for values to diplay in graph
+        positions -- positions of state.sensors
         """
-        df_src = df[[col]]
-        df_src['type'] = df_src.index
-        df_src['order'] = 0
-
-        df_src['order'] = np.where(df_src.index =='Speed',2,df_src['order'])
-        df_src['order'] = np.where(df_src.index =='Occupancy',1,df_src['order'])
-        df_src['order'] = np.where(df_src.index =='Volume',0,df_src['order'])
-        df_src['color'] = '#C0C0C0'
-        df_src['color'] = np.where(df_src['Mean Diff'] < -.05, '#FF0000', df_src['color'])
-        df_src['color'] = np.where(df_src['Mean Diff'] > .05, '#008000', df_src['color'])
-        source = ColumnDataSource(data = df_src.sort_values(by='order'))
-
-        hover = HoverTool(
-                tooltips=[
-                    ("Corridor Attribute", "@type"),
-                    ("% Difference", "@{%s}" % (col) + '{%0.2f}'),
-                ]
-            )
-        tools = ['reset','save',hover]
-        p = figure(plot_width=400, plot_height=175, toolbar_location="above",
-                   title = 'Mean Difference', tools = tools)
-
-        p.hbar(y='order', height=0.5, left=0,fill_color ='color',line_color=None,
-               right=col, color="navy", source = source)
-
-        p.yaxis.visible = False
-        p.xaxis.formatter = NumeralTickFormatter(format="0.f%")
-        p.xgrid.visible = False
-        p.ygrid.visible = False
-        #p.background_fill_color = None
-        p.background_fill_alpha = 0.5
-        p.border_fill_color = None
-
-        return source, p
-
-
-    def scatter_plot(title_text):
-        rng = np.random.RandomState(0)
-        x = rng.randn(100)
-        y = rng.randn(100)
-
-        source = ColumnDataSource(
-                data=dict(
-                    x=rng.randn(100),
-                    y=rng.randn(100),
-                    desc=['A', 'b', 'C', 'd', 'E']*20,
-                )
-            )
-
-        hover = HoverTool(
-                tooltips=[
-                    ("index", "$index"),
-                    ("(x,y)", "($x, $y)"),
-                    ("desc", "@desc"),
-                ]
-            )
-
-        p = figure(plot_width=300, plot_height=250, tools=[hover, 'box_select'], toolbar_location="above",
-                   title=title_text)
-
-        p.circle('x', 'y', size=5, source=source)
-        #p.background_fill_color = None
-        p.background_fill_alpha = 0.5
-        p.border_fill_color = None
-
-        return p
 
+        sensors = state.sensors.sensors
+        return {'x': state.sensors.x[positions],
+                'y': state.sensors.y[positions],
+                'id': sensors['id'].values[positions].tolist(),
+                'road': sensors['road'].values[positions].tolist(),
+                'direction': sensors['direction'].values[positions].tolist(),
+                'value': sensor_view['values'][positions]}
 
+    @instrumented(doc)
+    def show_sensors():
 
-    """
-    return selection tab contents
+        """
+        sends the sensors visible in the base map's current viewport
+        """
 
-    Keyword arguments:
-    rtdap_data - dataframe containing rtdap vds detail data
-    """
+        sensor_view['pending'] = False
+
+        positions = state.sensors.visible((base_map.x_range.start, base_map.x_range.end),
+                                          (base_map.y_range.start, base_map.y_range.end),
+                                          base_map.plot_width, base_map.plot_height)
+        sensor_src.data = sensor_data(positions)
+
+    def map_range_changed(attr, old, new):
+
+        """
+        schedules one sensor layer update for the base map range changes of the current tick
+        """
+
+        if not sensor_view['pending']:
+            sensor_view['pending'] = True
+            doc.add_next_tick_callback(show_sensors)
 
     #-----------------------------------------------------------------------------------------------------------------
-    #submit_selection -- Data Selection Update Function
+    #client filter -- the summary is recomputed in the browser from the corridor's cube cells, which are
+    #only sent again when the corridor changes
 
-    def submit_selection():
+    def corridor_baselines(corr):
 
         """
-        python callback to update table and visual content based on
-        user selections in the data review panel
+        returns column data of a corridor's long-run metric means for the browser summary
         """
 
-        avgs_speed = rtdap_avg(rtdap_data, corridor_select.value,'avgSpeed')
-        avgs_occ = rtdap_avg(rtdap_data, corridor_select.value,'avgOccupancy')
-        avgs_volume = rtdap_avg(rtdap_data, corridor_select.value,'avgVolume')
-
-        filtered_data = filter_selection(rtdap_data, corridor_select.value,
-                                         str(date_picker_start.value),
-                                         str(date_picker_end.value),
-                                         day_of_week.value,
-                                         time_of_day.value)
-
-        speed = summarize_metrics(filtered_data, corridor_select.value, 'corridor',avgs_speed,'avgSpeed',
-                                  'Speed','missing_speed')
-        occ = summarize_metrics(filtered_data, corridor_select.value, 'corridor',avgs_occ,'avgOccupancy',
-                                'Occupancy', 'missing_occ')
-        volume = summarize_metrics(filtered_data, corridor_select.value, 'corridor',avgs_volume,'avgVolume',
-                                   'Volume', 'missing_vol')
-
-        summary_df = speed.append(occ)
-        summary_df = summary_df.append(volume)
-
-        summary_title.text = "<h1>"+corridor_select.value+" Summary</h1>"
-
-        summary_df_tbl = summary_df.copy()
-        summary_df_tbl['Mean Diff'] = summary_df_tbl['Mean Diff'] * 100
-        summary_df_tbl = summary_df_tbl.reset_index()
-        summary_table.text = str(summary_df_tbl.fillna(0).to_html(index=False,
-                                                        formatters = [str,'{:20,}'.format,
-                                                        '{:20,.1f}'.format,'{:20,.1f}%'.format,
-                                                        '{:20,}'.format],classes=[ "w3-table" , "w3-hoverable","w3-small"]))
-        if len(summary_df) > 0:
-            new_df = summary_df.fillna(0)
-            bar_viz_new = hbar_chart(new_df,'Mean Diff')[0]
-            bar_viz_src.data.update(bar_viz_new.data)
+        return client_baseline_data([rtdap_avg(state.baselines, corr, col) for col, label, missing in METRICS])
+
+    @instrumented(doc)
+    def send_corridor():
+
+        """
+        sends the selected corridor's cube cells and baselines; the browser summary recomputes when they arrive
+        """
+
+        corr = corridor_select.value
+        requests['shown'] = corr
+        summary_title.text = "<h1>"+corr+" Summary</h1>"
+        baseline_src.data = corridor_baselines(corr)
+        cube_src.data = client_cube_data(state.cube_index, corr, state.store.days_of_week(),
+                                       state.coverage)
+
     #-----------------------------------------------------------------------------------------------------------------
     #Data Review Panel
 
@@ -292,7 +692,7 @@ def selection_tab(rtdap_data):
            specimen book.""", css_classes = ["panel-content","w3-text-white"])
 
     #Panel Buttons
-    corridor_select = Select(options=rtdap_data['corridor'].drop_duplicates().values.tolist(), title = 'Corridor:',
+    corridor_select = Select(options=state.store.corridors(), title = 'Corridor:',
                             height=60, value = 'Dan Ryan Express Lane',css_classes = ["panel-content"])
 
     date_picker_start = DatePicker(min_date = date(2015, 1, 1),max_date = date(2018, 12, 31),
@@ -320,46 +720,30 @@ def selection_tab(rtdap_data):
                           </ol>""",
                           css_classes = ["panel-content", "caption","w3-text-white"])
 
-    day_of_week = Select(options=['All'] + rtdap_data['dow'].drop_duplicates().values.tolist(),
+    day_of_week = Select(options=['All'] + state.store.days_of_week(),
                         title = "Day of Week:",css_classes = ["panel-content"], height=60,
                         value = "All")
 
     select_data = Button(label="Select Subset",css_classes = ["panel-content"], height=60)
 
+    map_metric = Select(options=[m[1] for m in METRICS], title = "Map Metric:",
+                        css_classes = ["panel-content"], height=60, value = "Speed")
+
     select_data.on_click(submit_selection)
     #-----------------------------------------------------------------------------------------------------------------
 
 
     #-----------------------------------------------------------------------------------------------------------------
     #Create initial content
-    avgs_speed = rtdap_avg(rtdap_data, corridor_select.value,'avgSpeed')
-    avgs_occ = rtdap_avg(rtdap_data, corridor_select.value,'avgOccupancy')
-    avgs_volume = rtdap_avg(rtdap_data, corridor_select.value,'avgVolume')
-
-    filtered_data = filter_selection(rtdap_data, corridor_select.value, str(date_picker_start.value),
-                                     str(date_picker_end.value),
-                                     day_of_week.value, time_of_day.value)
-
-    speed = summarize_metrics(filtered_data, corridor_select.value, 'corridor',avgs_speed,'avgSpeed',
-                              'Speed','missing_speed')
-    occ = summarize_metrics(filtered_data, corridor_select.value, 'corridor',avgs_occ,'avgOccupancy',
-                            'Occupancy', 'missing_occ')
-    volume = summarize_metrics(filtered_data, corridor_select.value, 'corridor',avgs_volume,'avgVolume',
-                               'Volume', 'missing_vol')
-
-    summary_df = speed.append(occ)
-    summary_df = summary_df.append(volume)
-    summary_df_tbl = summary_df.copy()
-    summary_df_tbl['Mean Diff'] = summary_df_tbl['Mean Diff'] * 100
-    summary_df_tbl = summary_df_tbl.reset_index()
+    initial = cached_selection(state, corridor_select.value, str(date_picker_start.value),
+                               str(date_picker_end.value),
+                               day_of_week.value, time_of_day.value)
 
+    requests['shown'] = corridor_select.value
     summary_title = Div(text= "<h1>"+corridor_select.value+" Summary</h1>", width = 2000, css_classes = ["w3-panel","w3-white"])
-    summary_table = Div(text="", width = 550, height = 150)
 
-    summary_table.text = str(summary_df_tbl.fillna(0).to_html(index=False,
-                                                    formatters = [str,'{:20,}'.format,
-                                                    '{:20,.1f}'.format,'{:20,.1f}%'.format,
-                                                    '{:20,}'.format],classes=[ "w3-table" , "w3-hoverable","w3-small"]))
+    summary_table_src = ColumnDataSource(data = source_data(initial['table_data']))
+    summary_table = summary_data_table(summary_table_src)
 
     line = Div(text="<hr>", css_classes = ["w3-container"], width = 1000)
     #-----------------------------------------------------------------------------------------------------------------
@@ -375,27 +759,69 @@ def selection_tab(rtdap_data):
     p.yaxis.visible = False
     p.xaxis.formatter = NumeralTickFormatter(format="0.0f%")'''
 
-    bar_viz = hbar_chart(summary_df.fillna(0),'Mean Diff')
-    bar_viz_src = bar_viz[0]
-    bar_viz_chart = bar_viz[1]
+    bar_viz_src = ColumnDataSource(data = source_data(initial['bar_data']))
+    bar_viz_chart = hbar_chart(bar_viz_src,'Mean Diff')
+
+
+    #points and shown viewport of each density plot in this session
+    density_views = dict((name, {'points': initial['scatter'][name]['points'],
+                                 'shown': initial['scatter'][name]['view'],
+                                 'latest': 0, 'pending': False}) for name in DENSITY_PLOTS)
+
+    density_srcs = {}
+    density_figs = {}
+    for name, (title, x, y) in DENSITY_PLOTS.items():
+        view = initial['scatter'][name]['view']
+        density_srcs[name] = ColumnDataSource(data = source_data(initial['scatter'][name]['image']))
+        density_figs[name] = density_plot(density_srcs[name], title, view[:2], view[2:],
+                                          x_axis_type='datetime' if x == 'date' else 'linear')
+
+        for axis_range in [density_figs[name].x_range, density_figs[name].y_range]:
+            for attr in ['start', 'end']:
+                axis_range.on_change(attr, lambda attr, old, new, name=name: range_changed(name))
 
+    volume_scatter = density_figs['volume_time']
+    time_scatter = density_figs['speed_volume']
 
-    volume_scatter = scatter_plot('Volumes')
-    time_scatter = scatter_plot('Time')
+    diff_vbar_srcs = dict((col, ColumnDataSource(data = source_data(initial['hist_data'][col]))) for col, label, missing in METRICS)
+    speed_diff_vbar = vbar_chart(diff_vbar_srcs['avgSpeed'], 'Speed')
+    occ_diff_vbar = vbar_chart(diff_vbar_srcs['avgOccupancy'], 'Occupancy')
+    volume_diff_vbar = vbar_chart(diff_vbar_srcs['avgVolume'], 'Volume')
 
-    corr_df = rtdap_data.loc[rtdap_data['corridor'] == corridor_select.value]
-    speed_diff_vbar = (vbar_chart(corr_df,filtered_data))
-    occ_diff_vbar = (vbar_chart(corr_df,filtered_data))
-    volume_diff_vbar = (vbar_chart(corr_df,filtered_data))
+    #sensors of this session's map: metric values of the latest selection, and whether an update is scheduled
+    sensor_view = {'device_diff': initial['device_diff'], 'values': None, 'pending': False}
+    sensor_src = ColumnDataSource(data = {}) if state.sensors is not None else None
 
     base_map = make_base_map(map_width=450,map_height=960, xaxis=None, yaxis=None,
-                xrange=(-9990000,-9619944), yrange=(5011119,5310000),plot_tools="pan,wheel_zoom,reset,save")
+                xrange=(-9990000,-9619944), yrange=(5011119,5310000),plot_tools="pan,wheel_zoom,reset,save",
+                sensor_source=sensor_src)
+
+    #summary table and chart filtered in the browser; Select Subset still updates the detail charts and map
+    if CLIENT_FILTER:
+        baseline_src = ColumnDataSource(data = corridor_baselines(corridor_select.value))
+        cube_src = ColumnDataSource(data = client_cube_data(state.cube_index, corridor_select.value,
+                                                            state.store.days_of_week(), state.coverage))
+        summarize = summary_callback(cube_src, baseline_src, summary_table_src, bar_viz_src,
+                                     date_picker_start, date_picker_end, day_of_week, time_of_day,
+                                     state.store.days_of_week(), [m[1] for m in METRICS])
+
+        for widget in [date_picker_start, date_picker_end, day_of_week, time_of_day]:
+            widget.js_on_change('value', summarize)
+        cube_src.js_on_change('data', summarize)
+        corridor_select.on_change('value', lambda attr, old, new: send_corridor())
+
+    if state.sensors is not None:
+        color_sensors()
+        for attr in ['start', 'end']:
+            base_map.x_range.on_change(attr, map_range_changed)
+            base_map.y_range.on_change(attr, map_range_changed)
+        map_metric.on_change('value', lambda attr, old, new: color_sensors())
 
     select_content =  row(
            #PANEL
            column(panel_title, panel_text, corridor_select,date_picker_start,
                date_picker_end, day_of_week, time_of_day,tod_description,
-               select_data, height = 1000, css_classes = ["w3-sidebar", "w3-bar-block","w3-darkgrey"]),
+               select_data, *([map_metric] if state.sensors is not None else []), height = 1000, css_classes = ["w3-sidebar", "w3-bar-block","w3-darkgrey"]),
            column(css_classes=["w3-col"], width = 275 ),
           #CONTENT
            column(summary_title,
@@ -0,0 +1,187 @@
+#libraries
+import os
+import pandas as pd
+import numpy as np
+
+#detector locations, filtered to one state as in rtdap_collect_data.ipynb
+SENSOR_FILE = 'vds_sensor_loc_2017.csv'
+
+#web mercator earth radius in meters
+EARTH_RADIUS = 6378137.0
+
+def web_mercator(lon, lat):
+
+    """
+    returns (x, y) arrays of web mercator meters for arrays of longitude and latitude degrees
+
+    Keyword arguments:
+    lon -- array of longitudes
+    lat -- array of latitudes
+    """
+
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+
+    x = EARTH_RADIUS * np.radians(lon)
+    y = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+    return x, y
+
+def load_sensors(path, state='IL', id_col='ID', lat_col='LAT', lon_col='LONG', state_col='STATE'):
+
+    """
+    returns dataframe of detector ids, web mercator x / y, road name and direction,
+    or None if the location file does not exist
+
+    Keyword arguments:
+    path -- detector location csv (vds_sensor_loc_2017.csv)
+    state -- state to keep, None keeps every row
+    id_col -- column name of the detector id (matches FieldDeviceID)
+    lat_col -- column name of the latitude
+    lon_col -- column name of the longitude
+    state_col -- column name of the state
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    locations = pd.read_csv(path)
+    if state is not None and state_col in locations.columns:
+        locations = locations.loc[locations[state_col] == state]
+
+    locations = locations.dropna(subset=[lat_col, lon_col])
+    x, y = web_mercator(locations[lon_col].values, locations[lat_col].values)
+
+    sensors = pd.DataFrame({'id': locations[id_col].astype(str).values, 'x': x, 'y': y})
+    for col, name in [('ROADNAME', 'road'), ('DIR', 'direction')]:
+        sensors[name] = locations[col].astype(str).values if col in locations.columns else ''
+
+    return sensors
+
+class SensorIndex(object):
+
+    """
+    uniform grid index of detector locations; sensors are sorted by grid cell so a viewport
+    query reads one contiguous slice per grid row it covers, and every sensor has a fixed
+    random rank used to thin dense viewports the same way on every pan
+
+    Keyword arguments:
+    sensors -- dataframe from load_sensors()
+    cell_size -- grid cell size in web mercator meters
+    """
+
+    def __init__(self, sensors, cell_size=5000.0):
+
+        self.cell_size = float(cell_size)
+
+        x, y = sensors['x'].values, sensors['y'].values
+        self.x0 = x.min() if len(x) else 0.0
+        self.y0 = y.min() if len(y) else 0.0
+        self.columns = int((x.max() - self.x0) // self.cell_size) + 1 if len(x) else 1
+        self.rows = int((y.max() - self.y0) // self.cell_size) + 1 if len(y) else 1
+
+        cells = self.cell(x, y)
+        order = np.argsort(cells, kind='mergesort')
+
+        self.sensors = sensors.iloc[order].reset_index(drop=True)
+        self.cells = cells[order]
+        self.x = self.sensors['x'].values
+        self.y = self.sensors['y'].values
+        self.rank = np.random.RandomState(0).permutation(len(self.sensors))
+
+    def cell(self, x, y):
+
+        """
+        returns grid cell numbers of arrays of web mercator x / y
+        """
+
+        column = np.clip(((x - self.x0) // self.cell_size).astype(np.int64), 0, self.columns - 1)
+        row = np.clip(((y - self.y0) // self.cell_size).astype(np.int64), 0, self.rows - 1)
+
+        return row * self.columns + column
+
+    def positions(self, x_range, y_range):
+
+        """
+        returns positions of the sensors inside a viewport
+
+        Keyword arguments:
+        x_range -- (start, end) of the viewport in web mercator x
+        y_range -- (start, end) of the viewport in web mercator y
+        """
+
+        x_start, x_end = x_range
+        y_start, y_end = y_range
+
+        column_start, column_end = [int(np.clip((v - self.x0) // self.cell_size, 0, self.columns - 1))
+                                    for v in (x_start, x_end)]
+        row_start, row_end = [int(np.clip((v - self.y0) // self.cell_size, 0, self.rows - 1))
+                              for v in (y_start, y_end)]
+
+        slices = []
+        for row in range(row_start, row_end + 1):
+            lo = np.searchsorted(self.cells, row * self.columns + column_start, side='left')
+            hi = np.searchsorted(self.cells, row * self.columns + column_end, side='right')
+            if hi > lo:
+                slices.append(np.arange(lo, hi))
+
+        if len(slices) == 0:
+            return np.array([], dtype=np.int64)
+
+        candidates = np.concatenate(slices)
+        x, y = self.x[candidates], self.y[candidates]
+        inside = (x >= x_start) & (x <= x_end) & (y >= y_start) & (y <= y_end)
+
+        return candidates[inside]
+
+    def visible(self, x_range, y_range, width, height, pixels=8):
+
+        """
+        returns positions of the sensors drawn for a viewport: the sensors inside it,
+        thinned to at most one per pixels x pixels block of the plot, so a zoomed out map
+        sends a sample of the sensors and a zoomed in map sends all of them
+
+        Keyword arguments:
+        x_range -- (start, end) of the viewport in web mercator x
+        y_range -- (start, end) of the viewport in web mercator y
+        width -- plot width in pixels
+        height -- plot height in pixels
+        pixels -- screen pixels per block
+        """
+
+        positions = self.positions(x_range, y_range)
+        if len(positions) == 0:
+            return positions
+
+        block_width = (x_range[1] - x_range[0]) * pixels / float(width)
+        block_height = (y_range[1] - y_range[0]) * pixels / float(height)
+        if block_width <= 0 or block_height <= 0:
+            return positions
+
+        columns = int(np.ceil(width / float(pixels))) + 1
+        blocks = ((self.y[positions] - y_range[0]) // block_height).astype(np.int64) * columns +\
+                 ((self.x[positions] - x_range[0]) // block_width).astype(np.int64)
+
+        #lowest ranked sensor of every block
+        by_rank = np.argsort(self.rank[positions], kind='mergesort')
+        first = np.unique(blocks[by_rank], return_index=True)[1]
+
+        return np.sort(positions[by_rank[first]])
+
+def load_sensor_index(data_dir, file_name=SENSOR_FILE, **kwargs):
+
+    """
+    returns SensorIndex of the detector locations in the data directory, or None if
+    there is no location file
+
+    Keyword arguments:
+    data_dir -- dashboard data directory
+    file_name -- name of the detector location csv
+    kwargs -- column names / state passed to load_sensors()
+    """
+
+    sensors = load_sensors(os.path.join(data_dir, file_name), **kwargs)
+    if sensors is None or len(sensors) == 0:
+        return None
+
+    return SensorIndex(sensors)
@@ -0,0 +1,343 @@
+#libraries
+import os
+import pandas as pd
+import numpy as np
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SKETCH_FILE = '_speed_sketches.parquet'
+SKETCH_KEYS = ['corridor','date','dow','hour']
+
+#speed histogram bins: 1 mph wide from 0 to 120 mph, the last bin also holds every faster
+#reading; histograms merge exactly by adding counts, and a quantile read from merged bins is
+#within one bin width of the exact quantile of the readings below the last bin
+SPEED_BIN_MPH = 1.0
+SPEED_BINS = 120
+
+#time of day periods of the store
+TODS = 8
+
+#travel times are taken from speeds of at least this many mph, so stalled or failed
+#detector readings do not dominate the mean
+MIN_TRAVEL_SPEED = 5.0
+
+#time of day period (8pm-6am) whose 85th percentile speed is the free flow speed
+FREE_FLOW_TOD = 1
+
+#speed percentiles reported for a selection
+PERCENTILES = [50, 85, 95]
+
+def speed_bins(speeds):
+
+    """
+    returns histogram bin of each speed
+
+    Keyword arguments:
+    speeds -- array of speeds in mph
+    """
+
+    return np.clip((np.asarray(speeds, dtype=np.float64) / SPEED_BIN_MPH).astype(np.int64), 0, SPEED_BINS - 1)
+
+def sketch_cells(df):
+
+    """
+    returns sparse speed histograms of vds detail rows: the number of speed readings per
+    (corridor, date, dow, hour, speed bin), with empty bins left out
+
+    Keyword arguments:
+    df -- dataframe of prepared vds detail rows
+    """
+
+    #rows without a weekday are never selected from the detail rows (see SelectionIndex), so they are left out
+    df = df.loc[df['avgSpeed'].notnull() & df['dow'].notnull()]
+
+    cells = df[SKETCH_KEYS].copy()
+    cells['corridor'] = cells['corridor'].astype(str)
+    cells['dow'] = cells['dow'].astype(str)
+    cells['bin'] = speed_bins(df['avgSpeed'].values).astype(np.int16)
+    cells['count'] = 1
+
+    return cells.groupby(SKETCH_KEYS + ['bin'], sort=False, observed=True)['count'].sum().reset_index()
+
+def sum_sketches(cells):
+
+    """
+    returns sparse speed histograms with rows of the same cell and bin summed together
+
+    Keyword arguments:
+    cells -- dataframe of sketch cells, possibly from several batches
+    """
+
+    sketches = cells.groupby(SKETCH_KEYS + ['bin'], sort=False, observed=True)['count'].sum().reset_index()
+
+    sketches['corridor'] = sketches['corridor'].astype(str)
+    sketches['dow'] = sketches['dow'].astype(str).astype('category')
+    sketches['hour'] = sketches['hour'].astype(np.int8)
+    sketches['bin'] = sketches['bin'].astype(np.int16)
+    sketches['count'] = sketches['count'].astype(np.int32)
+
+    return sketches
+
+def build_sketches(store):
+
+    """
+    returns the speed sketches of the store, built one record batch at a time
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    cells = [sketch_cells(batch) for batch in store.iter_batches(columns=SKETCH_KEYS + ['avgSpeed'])]
+
+    return sum_sketches(pd.concat(cells, ignore_index=True))
+
+def load_sketches(store):
+
+    """
+    returns the speed sketches of the store; read from the sketch file next to the store
+    while the store is unchanged, rebuilt and saved otherwise
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    """
+
+    fingerprint = store.fingerprint()
+    if fingerprint is None:
+        return build_sketches(store)
+
+    sketches = saved_sketches(store, fingerprint)
+    if sketches is not None:
+        return sketches
+
+    sketches = build_sketches(store)
+    save_sketches(store, sketches)
+
+    return sketches
+
+def saved_sketches(store, fingerprint):
+
+    """
+    returns the sketches saved next to the store if they were built for the given store
+    fingerprint, None otherwise
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    fingerprint -- store fingerprint the sketches must match
+    """
+
+    path = os.path.join(store.root, SKETCH_FILE)
+    if not os.path.exists(path):
+        return None
+
+    metadata = pq.read_schema(path).metadata or {}
+    if metadata.get(b'fingerprint', b'').decode() != fingerprint:
+        return None
+
+    #sketches saved with other speed bins, or before the bins were recorded, cannot be merged with these
+    if metadata.get(b'speed_bins', b'').decode() != str(SPEED_BINS):
+        return None
+
+    #sketches saved before rows without a weekday were left out hold them as a 'nan' day of week
+    sketches = pd.read_parquet(path)
+    if 'nan' in sketches['dow'].astype(str).values:
+        return None
+
+    return sketches
+
+def save_sketches(store, sketches):
+
+    """
+    saves the sketches next to the store, tagged with the store's fingerprint and the number
+    of speed bins
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    sketches -- speed sketches from build_sketches()
+    """
+
+    path = os.path.join(store.root, SKETCH_FILE)
+    table = pa.Table.from_pandas(sketches, preserve_index=False)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {}, fingerprint=store.fingerprint(),
+                                                    speed_bins=str(SPEED_BINS)))
+
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def append_sketches(store, previous_fingerprint, cells):
+
+    """
+    merges the sketch cells of rows appended to the store into its saved sketches. returns
+    False, leaving the sketches to be rebuilt on load, if the saved sketches were not built
+    for the store before the append
+
+    Keyword arguments:
+    store -- VDSStore after the append
+    previous_fingerprint -- fingerprint of the store before the append
+    cells -- sketch_cells() of the appended rows
+    """
+
+    sketches = saved_sketches(store, previous_fingerprint)
+    if sketches is None:
+        return False
+
+    save_sketches(store, sum_sketches(pd.concat([sketches.astype({'dow': str}), cells.astype({'dow': str})],
+                                                ignore_index=True)))
+
+    return True
+
+def merge_sketches(index, corr, date_s, date_e, weekday, tod=(1, TODS)):
+
+    """
+    returns (time of day periods x SPEED_BINS) array of speed reading counts of a selection,
+    merged from its daily sketches
+
+    Keyword arguments:
+    index -- SelectionIndex of the speed sketches
+    corr -- corridor name
+    date_s -- start date
+    date_e -- end date
+    weekday -- day of week (Monday - Friday, or All)
+    tod -- (first, last) time of day period
+    """
+
+    positions = index.positions(corr, date_s, date_e, weekday, tod)
+    hours = index.df['hour'].values[positions].astype(np.int64)
+    bins = index.df['bin'].values[positions].astype(np.int64)
+
+    counts = np.bincount((hours - 1) * SPEED_BINS + bins, weights=index.df['count'].values[positions],
+                         minlength=TODS * SPEED_BINS)
+
+    return counts.reshape(TODS, SPEED_BINS)
+
+def sketch_quantiles(histograms, percentiles):
+
+    """
+    returns (histograms x percentiles) array of speeds, interpolated within the bin each
+    percentile falls in; NaN for empty histograms. a percentile in the last bin, which has no
+    upper edge, is reported as the bin's lower edge, a lower bound of the speed
+
+    Keyword arguments:
+    histograms -- (n x SPEED_BINS) array of speed reading counts
+    percentiles -- list of percentiles (0-100)
+    """
+
+    histograms = np.atleast_2d(histograms)
+    cumulative = np.cumsum(histograms, axis=1)
+    totals = cumulative[:, -1]
+    rows = np.arange(len(histograms))
+
+    speeds = np.full((len(histograms), len(percentiles)), np.nan)
+    for j, percentile in enumerate(percentiles):
+        target = totals * percentile / 100.0
+        bins = np.minimum((cumulative < target[:, None]).sum(axis=1), SPEED_BINS - 1)
+        below = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+        inside = histograms[rows, bins]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip(np.where(inside > 0, (target - below) / inside, 0.0), 0, 1)
+        fraction = np.where(bins == SPEED_BINS - 1, 0.0, fraction)
+        speeds[:, j] = np.where(totals > 0, (bins + fraction) * SPEED_BIN_MPH, np.nan)
+
+    return speeds
+
+def mean_travel_times(histograms):
+
+    """
+    returns mean travel time per mile, in hours, of each histogram, from the midpoint speed of its bins
+    """
+
+    histograms = np.atleast_2d(histograms)
+    speeds = np.maximum((np.arange(SPEED_BINS) + 0.5) * SPEED_BIN_MPH, MIN_TRAVEL_SPEED)
+    totals = histograms.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(totals > 0, histograms @ (1.0 / speeds) / totals, np.nan)
+
+def reliability(histograms, free_flow_speed, labels):
+
+    """
+    returns dataframe of speed percentiles and travel time reliability indices per histogram:
+    travel time index (mean / free flow travel time), buffer index ((95th percentile - mean) /
+    mean travel time) and planning time index (95th percentile / free flow travel time).
+    travel times are per mile from detector speeds; the 95th percentile travel time is the
+    travel time at the 5th percentile speed
+
+    Keyword arguments:
+    histograms -- (n x SPEED_BINS) array of speed reading counts
+    free_flow_speed -- free flow speed (mph), a number or an array of one per histogram
+    labels -- index labels of the histograms
+    """
+
+    histograms = np.atleast_2d(histograms)
+    speeds = sketch_quantiles(histograms, [5] + PERCENTILES)
+
+    mean_time = mean_travel_times(histograms)
+    time_95 = 1.0 / np.maximum(speeds[:, 0], MIN_TRAVEL_SPEED)
+    free_flow_time = 1.0 / np.maximum(free_flow_speed, MIN_TRAVEL_SPEED)
+
+    df = pd.DataFrame({'Readings': histograms.sum(axis=1).astype(np.int64)}, index=labels)
+    for j, percentile in enumerate(PERCENTILES):
+        df['P%d Speed' % percentile] = speeds[:, j + 1]
+    df['Travel Time Index'] = mean_time / free_flow_time
+    df['Buffer Index'] = (time_95 - mean_time) / mean_time
+    df['Planning Time Index'] = time_95 / free_flow_time
+
+    return df
+
+def free_flow_speed(tod_histograms):
+
+    """
+    returns free flow speed of a selection: the 85th percentile speed of FREE_FLOW_TOD,
+    or of the whole day when that period has no readings
+
+    Keyword arguments:
+    tod_histograms -- (time of day periods x SPEED_BINS) array from merge_sketches()
+    """
+
+    speed = sketch_quantiles(tod_histograms[FREE_FLOW_TOD - 1], [85])[0, 0]
+    if np.isnan(speed):
+        speed = sketch_quantiles(tod_histograms.sum(axis=0), [85])[0, 0]
+
+    return speed
+
+def corridor_reliability(index, corr, date_s, date_e, weekday):
+
+    """
+    returns reliability() of a corridor selection by time of day period, with a final All Day row
+
+    Keyword arguments:
+    index -- SelectionIndex of the speed sketches
+    corr -- corridor name
+    date_s -- start date
+    date_e -- end date
+    weekday -- day of week (Monday - Friday, or All)
+    """
+
+    histograms = merge_sketches(index, corr, date_s, date_e, weekday)
+
+    return reliability(np.vstack([histograms, histograms.sum(axis=0)]), free_flow_speed(histograms),
+                       pd.Index([str(t) for t in range(1, TODS + 1)] + ['All Day'], name='tod'))
+
+def corridors_reliability(index, corridors, date_s, date_e, weekday, tod):
+
+    """
+    returns reliability() of each corridor over the selected time of day periods, with each
+    corridor's own free flow speed
+
+    Keyword arguments:
+    index -- SelectionIndex of the speed sketches
+    corridors -- corridor names
+    date_s -- start date
+    date_e -- end date
+    weekday -- day of week (Monday - Friday, or All)
+    tod -- (first, last) time of day period
+    """
+
+    histograms, free_flow = [], []
+    for corr in corridors:
+        tod_histograms = merge_sketches(index, corr, date_s, date_e, weekday)
+        histograms.append(tod_histograms[int(tod[0]) - 1:int(tod[1])].sum(axis=0))
+        free_flow.append(free_flow_speed(tod_histograms))
+
+    return reliability(np.vstack(histograms) if histograms else np.zeros((0, SPEED_BINS)), np.array(free_flow),
+                       pd.Index(corridors, name='corridor'))
@@ -0,0 +1,154 @@
+#libraries
+import os
+import pandas as pd
+import numpy as np
+
+import pyarrow as pa
+
+from scripts.prepare import DOW_NAMES
+from scripts.index import SelectionIndex, SELECT_COLUMNS
+from scripts.cube import load_cube
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#uncompressed arrow files, written in SelectionIndex order, that server workers memory map
+SNAPSHOT_DIR = '_serving'
+DETAIL_FILE = 'vds.arrow'
+CUBE_FILE = 'cube.arrow'
+
+def arrow_column(values, categories=None):
+
+    """
+    returns arrow array for a dataframe column; numeric and date columns keep their numpy
+    layout (NaN stays NaN) so they can be read back without copying, text columns are
+    dictionary encoded against a fixed category list
+
+    Keyword arguments:
+    values -- pandas series
+    categories -- category list for text / categorical columns
+    """
+
+    if categories is not None:
+        codes = pd.Categorical(values.astype(str), categories=categories).codes
+        indices = pa.array(codes.astype(np.int32), mask=codes < 0)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(categories, type=pa.string()))
+
+    return pa.array(values.values)
+
+def arrow_batch(df, categories):
+
+    """
+    returns arrow record batch of a dataframe
+
+    Keyword arguments:
+    df -- dataframe to convert
+    categories -- dictionary of column name -> category list for text columns
+    """
+
+    arrays = [arrow_column(df[col], categories.get(col)) for col in df.columns]
+
+    return pa.RecordBatch.from_arrays(arrays, list(df.columns))
+
+def write_arrow(path, batches, fingerprint):
+
+    """
+    writes record batches to an uncompressed arrow ipc file, replacing the file atomically
+
+    Keyword arguments:
+    path -- arrow file to write
+    batches -- iterable of record batches with the same schema
+    fingerprint -- store fingerprint saved in the file's schema metadata
+    """
+
+    tmp_path = path + '.tmp'
+    writer = None
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        for batch in batches:
+            if writer is None:
+                schema = batch.schema.with_metadata({'fingerprint': fingerprint})
+                writer = pa.ipc.new_file(sink, schema)
+            writer.write_batch(batch)
+        if writer is not None:
+            writer.close()
+
+    os.replace(tmp_path, path)
+
+def read_arrow(path):
+
+    """
+    returns (dataframe, fingerprint) of a memory mapped arrow ipc file; numeric and date
+    columns are views of the mapped file and shared between processes through the page cache
+
+    Keyword arguments:
+    path -- arrow file to read
+    """
+
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    fingerprint = (table.schema.metadata or {}).get(b'fingerprint', b'').decode()
+
+    return table.to_pandas(split_blocks=True), fingerprint
+
+def write_snapshot(store):
+
+    """
+    writes the serving snapshot of a store: every corridor's detail rows and the aggregate cube,
+    sorted for SelectionIndex; built one corridor at a time
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    """
+
+    root = os.path.join(store.root, SNAPSHOT_DIR)
+    if not os.path.exists(root):
+        os.makedirs(root)
+
+    fingerprint = store.fingerprint()
+    devices = store.read(columns=['FieldDeviceID'])['FieldDeviceID'].astype(str).unique()
+    categories = {'corridor': store.corridors(),
+                  'dow': DOW_NAMES,
+                  'FieldDeviceID': sorted(devices)}
+
+    def detail_batches():
+        for corr in store.corridors():
+            index = SelectionIndex(store.read(corridors=[corr], columns=SELECT_COLUMNS))
+            yield arrow_batch(index.df, categories)
+
+    write_arrow(os.path.join(root, DETAIL_FILE), detail_batches(), fingerprint)
+
+    cube = SelectionIndex(load_cube(store)).df
+    write_arrow(os.path.join(root, CUBE_FILE), [arrow_batch(cube, categories)], fingerprint)
+
+def open_snapshot(store):
+
+    """
+    returns (detail SelectionIndex, cube SelectionIndex) memory mapped from the store's serving
+    snapshot, writing the snapshot first if it is missing or older than the store; one process
+    writes while any others starting at the same time wait for it
+
+    Keyword arguments:
+    store -- VDSStore of prepared vds detail rows
+    """
+
+    root = os.path.join(store.root, SNAPSHOT_DIR)
+    if not os.path.exists(root):
+        os.makedirs(root)
+
+    fingerprint = store.fingerprint()
+
+    with open(os.path.join(root, '.lock'), 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        paths = [os.path.join(root, DETAIL_FILE), os.path.join(root, CUBE_FILE)]
+        frames = [read_arrow(p) if os.path.exists(p) else (None, None) for p in paths]
+
+        if any(f[1] != fingerprint for f in frames):
+            write_snapshot(store)
+            frames = [read_arrow(p) for p in paths]
+
+    detail, cube = frames[0][0], frames[1][0]
+
+    return SelectionIndex(detail, presorted=True), SelectionIndex(cube, presorted=True)
@@ -0,0 +1,79 @@
+#libraries
+import os
+import time
+import logging
+
+#bokeh
+from bokeh.document import Document
+from bokeh.io import curdoc
+from bokeh.io.doc import set_curdoc
+from bokeh.models import Panel
+from bokeh.models.widgets import Div, Tabs
+
+from scripts.instrument import instrumented
+
+logger = logging.getLogger('rtdap.startup')
+
+#fast session startup, on unless RTDAP_FAST_START=0: tabs marked deferred are built when first
+#opened and every tab's default content is computed when the server loads
+FAST_START = os.environ.get('RTDAP_FAST_START', '1') == '1'
+
+def build_tabs(tabs, **kwargs):
+
+    """
+    returns bokeh Tabs of the given tabs; in the fast start mode a deferred tab shows a
+    placeholder until it is first activated, and is then built in a session callback
+
+    Keyword arguments:
+    tabs -- list of (title, function returning the tab's contents, deferred) tuples
+    kwargs -- keyword arguments passed on to Tabs
+    """
+
+    panels, builders = [], {}
+    for position, (title, build, deferred) in enumerate(tabs):
+        if deferred and FAST_START:
+            builders[position] = build
+            panels.append(Panel(child=Div(text="Loading...", css_classes=["panel-content"]), title=title))
+        else:
+            panels.append(Panel(child=build(), title=title))
+
+    tab_widget = Tabs(tabs=panels, **kwargs)
+
+    if builders:
+        @instrumented(curdoc())
+        def tab_activated(attr, old, new):
+
+            """
+            builds a deferred tab the first time it is activated
+            """
+
+            build = builders.pop(new, None)
+            if build is not None:
+                panels[new].child = build()
+
+        tab_widget.on_change('active', tab_activated)
+
+    return tab_widget
+
+def prewarm(state, tabs):
+
+    """
+    builds every tab once in a scratch document when the server loads, so the imports,
+    bokeh model setup and default selections of the tabs are done before the first session
+    and their default content is served from the shared selection cache
+
+    Keyword arguments:
+    state -- DashboardState shared by the server's sessions
+    tabs -- list of functions taking the state and returning a tab's contents
+    """
+
+    doc = Document()
+    previous = curdoc()
+    set_curdoc(doc)
+    try:
+        start = time.time()
+        for build in tabs:
+            doc.add_root(build(state))
+        logger.info('prewarmed %d tabs in %.2fs', len(tabs), time.time() - start)
+    finally:
+        set_curdoc(previous)
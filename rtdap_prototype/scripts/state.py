@@ -0,0 +1,267 @@
+#libraries
+import os
+import threading
+
+import pandas as pd
+
+from scripts.store import open_vds_store, MemoryStore, VDSStore, changed_corridors
+from scripts.index import SelectionIndex, SELECT_COLUMNS
+from scripts.baseline import load_baselines
+from scripts.cube import load_cube
+from scripts.sketch import load_sketches
+from scripts.coverage import load_coverage
+from scripts.snapshot import open_snapshot
+from scripts.histogram import corridor_devices, device_means
+from scripts.sensors import load_sensor_index
+from scripts.compare import CompareCube, compare_cells, COMPARE_COLUMNS
+
+class DashboardState(object):
+
+    """
+    vds data and derived structures loaded once per server process and shared,
+    read only, by every session: the store, corridor baselines, the aggregate cube
+    index, the speed sketch index, the sensor-hour coverage bitmaps, per corridor SelectionIndexes,
+    the device compare cube and the detector location index
+
+    Keyword arguments:
+    store -- VDSStore or MemoryStore of prepared vds detail rows
+    snapshot -- memory map the detail rows and cube from the store's serving snapshot, so
+                every server process shares one copy through the page cache
+    sensors -- SensorIndex of the detector locations, None when there are none
+    """
+
+    def __init__(self, store, snapshot=False, sensors=None):
+        self.store = store
+        self.sensors = sensors
+        self.snapshot = snapshot
+        self.data_key = store.fingerprint() or id(store)
+
+        self.baselines = load_baselines(store)
+
+        #all corridors' rows in one memory mapped index, or one index per corridor read from the store
+        self.detail_index = None
+        if snapshot:
+            detail_index, cube_index = open_snapshot(store)
+            self.detail_index = freeze_index(detail_index)
+            self.cube_index = freeze_index(cube_index)
+        else:
+            self.cube_index = freeze_index(SelectionIndex(load_cube(store)))
+
+        self.sketch_index = freeze_index(SelectionIndex(load_sketches(store)))
+
+        #None for stores written without clock hours
+        self.coverage = load_coverage(store)
+
+        self.corridor_indexes = {}
+        self.device_means = {}
+        self.compare_cells = {}
+        self.compare = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+
+        """
+        reloads the store when an extract has rewritten its manifest, keeping the corridor
+        indexes and device baselines of corridors whose partitions did not change; the
+        baselines, cube, speed sketches and coverage bitmaps are read from the files an
+        incremental extract merged them into.
+        returns the set of changed corridors
+        """
+
+        if not self.store.changed():
+            return set()
+
+        store = VDSStore(self.store.root)
+        changed = changed_corridors(self.store, store)
+
+        baselines = load_baselines(store)
+        detail_index = None
+        if self.snapshot:
+            detail_index, cube_index = open_snapshot(store)
+            detail_index = freeze_index(detail_index)
+            cube_index = freeze_index(cube_index)
+        else:
+            cube_index = freeze_index(SelectionIndex(load_cube(store)))
+        sketch_index = freeze_index(SelectionIndex(load_sketches(store)))
+        coverage = load_coverage(store)
+
+        with self.lock:
+            self.corridor_indexes = dict((c, i) for c, i in self.corridor_indexes.items() if c not in changed)
+            self.device_means = dict((c, m) for c, m in self.device_means.items() if c not in changed)
+            self.compare_cells = dict((c, m) for c, m in self.compare_cells.items() if c not in changed)
+            self.compare = None
+            self.store, self.baselines = store, baselines
+            self.detail_index, self.cube_index = detail_index, cube_index
+            self.sketch_index, self.coverage = sketch_index, coverage
+
+            #new selection cache keys once everything else is in place
+            self.data_key = store.fingerprint()
+
+        if not self.snapshot:
+            self.warm()
+
+        return changed
+
+    def corridor_index(self, corr):
+
+        """
+        returns SelectionIndex over a corridor's rows, reading the corridor from the store on first use
+
+        Keyword arguments:
+        corr -- corridor name
+        """
+
+        if self.detail_index is not None:
+            return self.detail_index
+
+        index = self.corridor_indexes.get(corr)
+        if index is None:
+            with self.lock:
+                index = self.corridor_indexes.get(corr)
+                if index is None:
+                    index = freeze_index(SelectionIndex(self.store.read(corridors=[corr], columns=SELECT_COLUMNS)))
+                    self.corridor_indexes[corr] = index
+
+        return index
+
+    def device_baselines(self, corr):
+
+        """
+        returns (device ids, long-run per device metric means) of a corridor, computed on first use
+
+        Keyword arguments:
+        corr -- corridor name
+        """
+
+        baselines = self.device_means.get(corr)
+        if baselines is None:
+            rows = self.corridor_index(corr).corridor_rows(corr)
+            devices = corridor_devices(rows)
+            baselines = (devices, device_means(rows, devices))
+            self.device_means[corr] = baselines
+
+        return baselines
+
+    def compare_cube(self):
+
+        """
+        returns the CompareCube of every corridor, assembled on first use from each corridor's
+        compare cells; a refresh only reads the cells of changed corridors again
+        """
+
+        cube = self.compare
+        if cube is None:
+            with self.lock:
+                cube = self.compare
+                if cube is None:
+                    corridors = self.store.corridors()
+                    for corr in corridors:
+                        if corr not in self.compare_cells:
+                            self.compare_cells[corr] = compare_cells(self.store.read(corridors=[corr], columns=COMPARE_COLUMNS))
+
+                    cube = CompareCube(pd.concat([self.compare_cells[c] for c in corridors], ignore_index=True),
+                                       self.store.years())
+                    self.compare = cube
+
+        return cube
+
+    def warm(self):
+
+        """
+        builds the SelectionIndex and device baselines of every corridor in the store, and the compare cube
+        """
+
+        for corr in self.store.corridors():
+            self.corridor_index(corr)
+            self.device_baselines(corr)
+
+        self.compare_cube()
+
+def freeze_index(index):
+
+    """
+    returns the SelectionIndex with its search arrays marked read only; selections
+    taken from it are copies, so sessions never write to the shared rows
+
+    Keyword arguments:
+    index -- SelectionIndex to freeze
+    """
+
+    index.dates.flags.writeable = False
+
+    return index
+
+#state of this server process, set by load_state()
+_state = None
+_state_lock = threading.Lock()
+
+def load_state(data_dir, warm=True, snapshot=None):
+
+    """
+    loads the process wide DashboardState from the data directory; returns None if
+    there is no vds data
+
+    Keyword arguments:
+    data_dir -- dashboard data directory
+    warm -- build every corridor's SelectionIndex now rather than on first selection
+    snapshot -- serve from the memory mapped snapshot (default: RTDAP_SNAPSHOT environment variable is 1)
+    """
+
+    global _state
+
+    if snapshot is None:
+        snapshot = os.environ.get('RTDAP_SNAPSHOT', '0') == '1'
+
+    with _state_lock:
+        if _state is None:
+            store = open_vds_store(data_dir)
+            if store is None:
+                return None
+
+            _state = DashboardState(store, snapshot=snapshot, sensors=load_sensor_index(data_dir))
+            if warm and not snapshot:
+                _state.warm()
+
+    return _state
+
+def refresh_state():
+
+    """
+    reloads the process wide DashboardState if its store has changed; returns the set of changed corridors
+    """
+
+    if _state is None:
+        return set()
+
+    return _state.refresh()
+
+def get_state(data_dir):
+
+    """
+    returns the process wide DashboardState, loading it on first use when the server
+    lifecycle hook has not already done so
+
+    Keyword arguments:
+    data_dir -- dashboard data directory
+    """
+
+    if _state is not None:
+        return _state
+
+    return load_state(data_dir, warm=False)
+
+def as_state(rtdap_data):
+
+    """
+    returns a DashboardState for a DashboardState, store or dataframe of vds detail rows
+
+    Keyword arguments:
+    rtdap_data -- DashboardState, VDSStore, MemoryStore or dataframe
+    """
+
+    if isinstance(rtdap_data, DashboardState):
+        return rtdap_data
+    if isinstance(rtdap_data, pd.DataFrame):
+        rtdap_data = MemoryStore(rtdap_data)
+
+    return DashboardState(rtdap_data)
@@ -0,0 +1,298 @@
+#libraries
+import os
+import json
+import hashlib
+import logging
+from urllib.parse import unquote
+import pandas as pd
+import numpy as np
+
+#columnar storage
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from scripts.prepare import prepare_vds_table, memory_mb
+
+logger = logging.getLogger('rtdap.store')
+
+#store layout
+MANIFEST = '_manifest.json'
+PARTITION_COLUMNS = ['year', 'corridor']
+
+def write_vds_store(vds_table, root, part_name='part-0'):
+
+    """
+    writes vds detail rows to a parquet store partitioned by year and corridor,
+    adding files to any partitions that already exist
+
+    Keyword arguments:
+    vds_table -- dataframe of prepared vds detail rows
+    root -- directory of the parquet store
+    part_name -- file name prefix for the files written by this call
+    """
+
+    vds_table = vds_table.copy()
+    vds_table['corridor'] = vds_table['corridor'].astype(str)
+
+    table = pa.Table.from_pandas(vds_table, preserve_index=False)
+    ds.write_dataset(table, root, format='parquet',
+                     partitioning=PARTITION_COLUMNS, partitioning_flavor='hive',
+                     basename_template=part_name + '-{i}.parquet',
+                     existing_data_behavior='overwrite_or_ignore')
+
+def write_manifest(root, corridors, years, dows, rows):
+
+    """
+    writes the store manifest listing the corridors, years and days of week held in the store
+
+    Keyword arguments:
+    root -- directory of the parquet store
+    corridors -- corridor names in the store
+    years -- years in the store
+    dows -- day of week names in the store
+    rows -- number of rows in the store
+    """
+
+    manifest = {'corridors': sorted(corridors),
+                'years': sorted(int(y) for y in years),
+                'dows': [d for d in ['Monday','Tuesday','Wednesday','Thursday','Friday'] if d in dows],
+                'rows': int(rows)}
+
+    with open(os.path.join(root, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+def csv_to_vds_store(csv_path, root, chunksize=1000000):
+
+    """
+    converts the vds csv extract into a partitioned parquet store, one chunk at a time
+
+    Keyword arguments:
+    csv_path -- path to vds_table_2008_2018.csv
+    root -- directory of the parquet store to create
+    chunksize -- number of csv rows to prepare and write per chunk
+    """
+
+    corridors, years, dows = set(), set(), set()
+    rows = 0
+
+    #memory of the csv rows and of the prepared rows, summed over the chunks and logged once
+    report = logger.isEnabledFor(logging.INFO)
+    before = after = 0.0
+
+    for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize, dtype={'corridor': str, 'FieldDeviceID': str})):
+        if report:
+            before += memory_mb(chunk)
+        chunk = prepare_vds_table(chunk)
+        if report:
+            after += memory_mb(chunk)
+        write_vds_store(chunk, root, part_name='part-%d' % i)
+
+        corridors.update(chunk['corridor'].astype(str).unique())
+        years.update(chunk['year'].unique())
+        dows.update(chunk['dow'].astype(str).unique())
+        rows += len(chunk)
+
+    logger.info('converted %s: %d rows, %.1f MB as csv rows -> %.1f MB prepared', csv_path, rows, before, after)
+
+    return write_manifest(root, corridors, years, dows, rows)
+
+def open_vds_store(data_dir, store_name='vds_store', csv_name='vds_table_2008_2018.csv'):
+
+    """
+    returns the vds store in the data directory, converting the csv extract on first use;
+    returns None if neither the store nor the csv exist
+
+    Keyword arguments:
+    data_dir -- dashboard data directory
+    store_name -- directory name of the parquet store
+    csv_name -- file name of the vds csv extract
+    """
+
+    root = os.path.join(data_dir, store_name)
+    csv_path = os.path.join(data_dir, csv_name)
+
+    if not os.path.exists(os.path.join(root, MANIFEST)):
+        if not os.path.exists(csv_path):
+            return None
+        csv_to_vds_store(csv_path, root)
+
+    return VDSStore(root)
+
+class VDSStore(object):
+
+    """
+    vds detail rows held in a year/corridor partitioned parquet store;
+    reads touch only the partitions and columns requested and are memory mapped
+
+    Keyword arguments:
+    root -- directory of the parquet store
+    memory_map -- memory map partition files instead of reading them into buffers
+    """
+
+    def __init__(self, root, memory_map=True):
+        self.root = root
+
+        #the manifest is written last by csv conversion and extracts, so a new manifest marks new data
+        manifest_path = os.path.join(root, MANIFEST)
+        self.manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        with open(manifest_path) as f:
+            self.manifest = json.load(f)
+
+        self.dataset = ds.dataset(root, format='parquet', partitioning='hive',
+                                  filesystem=fs.LocalFileSystem(use_mmap=memory_map))
+
+        #relative path -> (size, modification time) of the partition files when the store was opened
+        self.file_stats = {}
+        for path in self.dataset.files:
+            stat = os.stat(path)
+            self.file_stats[os.path.relpath(path, root)] = (stat.st_size, stat.st_mtime_ns)
+
+    def corridors(self):
+        return list(self.manifest['corridors'])
+
+    def years(self):
+        return list(self.manifest['years'])
+
+    def days_of_week(self):
+        return list(self.manifest['dows'])
+
+    def columns(self):
+        return list(self.dataset.schema.names)
+
+    def fingerprint(self):
+
+        """
+        returns a hash of the store's file names, sizes and modification times when it was
+        opened; changes whenever partition files are added, removed or rewritten
+        """
+
+        digest = hashlib.sha1()
+        for path in sorted(self.file_stats):
+            size, mtime = self.file_stats[path]
+            digest.update(('%s:%d:%d;' % (path, size, mtime)).encode())
+
+        return digest.hexdigest()
+
+    def changed(self):
+
+        """
+        returns True when the store's manifest has been rewritten since the store was opened
+        """
+
+        path = os.path.join(self.root, MANIFEST)
+
+        return os.path.exists(path) and os.stat(path).st_mtime_ns != self.manifest_mtime
+
+    def iter_batches(self, columns=None):
+
+        """
+        yields dataframes of vds detail rows one record batch at a time, for grouped passes
+        over the whole store without holding it in memory
+
+        Keyword arguments:
+        columns -- list of column names to read (all if None)
+        """
+
+        for batch in self.dataset.to_batches(columns=columns):
+            yield batch.to_pandas()
+
+    def read(self, corridors=None, years=None, columns=None):
+
+        """
+        returns dataframe of vds detail rows for the selected partitions
+
+        Keyword arguments:
+        corridors -- list of corridor names to read (all if None)
+        years -- list of years to read (all if None)
+        columns -- list of column names to read (all if None)
+        """
+
+        filters = None
+        if corridors is not None:
+            filters = ds.field('corridor').isin(list(corridors))
+        if years is not None:
+            year_filter = ds.field('year').isin([int(y) for y in years])
+            filters = year_filter if filters is None else filters & year_filter
+
+        table = self.dataset.to_table(columns=columns, filter=filters)
+
+        return table.to_pandas()
+
+class MemoryStore(object):
+
+    """
+    vds detail rows already held in a dataframe, read through the same api as VDSStore
+
+    Keyword arguments:
+    vds_table -- dataframe of prepared vds detail rows
+    """
+
+    def __init__(self, vds_table):
+        self.vds_table = vds_table
+
+    def corridors(self):
+        return self.vds_table['corridor'].drop_duplicates().values.tolist()
+
+    def years(self):
+        return sorted(self.vds_table['year'].drop_duplicates().values.tolist())
+
+    def days_of_week(self):
+        return self.vds_table['dow'].drop_duplicates().values.tolist()
+
+    def columns(self):
+        return self.vds_table.columns.tolist()
+
+    def fingerprint(self):
+        return None
+
+    def changed(self):
+        return False
+
+    def iter_batches(self, columns=None):
+        yield self.read(columns=columns)
+
+    def read(self, corridors=None, years=None, columns=None):
+
+        """
+        returns dataframe of vds detail rows for the selected corridors and years
+
+        Keyword arguments:
+        corridors -- list of corridor names to read (all if None)
+        years -- list of years to read (all if None)
+        columns -- list of column names to read (all if None)
+        """
+
+        df = self.vds_table
+        if corridors is not None:
+            df = df.loc[df['corridor'].isin(corridors)]
+        if years is not None:
+            df = df.loc[df['year'].isin(years)]
+        if columns is not None:
+            df = df[columns]
+
+        return df
+
+def changed_corridors(old_store, new_store):
+
+    """
+    returns the set of corridors with partition files added, removed or rewritten between
+    two openings of a store
+
+    Keyword arguments:
+    old_store -- VDSStore opened before the change
+    new_store -- VDSStore opened after the change
+    """
+
+    old, new = old_store.file_stats, new_store.file_stats
+    paths = set(p for p in set(old) | set(new) if old.get(p) != new.get(p))
+
+    corridors = set()
+    for path in paths:
+        for part in path.split(os.sep):
+            if part.startswith('corridor='):
+                corridors.add(unquote(part[len('corridor='):]))
+
+    return corridors
@@ -0,0 +1,143 @@
+#libraries
+import os
+import pandas as pd
+import numpy as np
+
+from scripts.prepare import prepare_vds_table
+from scripts.store import write_vds_store, write_manifest
+from scripts.sensors import SENSOR_FILE
+
+#corridors of the generated detectors; '0' marks detectors without a corridor, as in the extract
+SYNTHETIC_CORRIDORS = ['Dan Ryan Express Lane', 'Kennedy', 'Stevenson/I-55', 'Edens', 'Eisenhower',
+                       'Bishop Ford', 'Tri-State', 'Jane Addams', 'Reagan', 'Veterans Memorial', '0']
+
+#(corridors, detectors per corridor, years, first year) of the benchmark scales, from one
+#corridor-year to ten years of every Illinois detector (about 980 in vds_sensor_loc_2017.csv)
+SYNTHETIC_SCALES = {'corridor-year': (1, 30, 1, 2018),
+                    'region-3y': (4, 30, 3, 2016),
+                    'statewide-1y': (11, 90, 1, 2018),
+                    'statewide-10y': (11, 90, 10, 2009)}
+
+#relative hourly volume, and the share of free flow speed lost to congestion, by hour of day
+VOLUME_PROFILE = np.array([.15,.10,.08,.08,.12,.35,.75,1.0,.95,.70,.60,.62,
+                           .65,.65,.72,.85,.98,1.0,.80,.55,.42,.35,.28,.20])
+CONGESTION_PROFILE = np.array([0,0,0,0,0,.05,.30,.55,.45,.15,.08,.08,
+                               .10,.10,.15,.35,.55,.60,.30,.10,.05,0,0,0])
+
+def synthetic_devices(corridors=1, devices_per_corridor=30, seed=0):
+
+    """
+    returns dataframe of generated detectors: FieldDeviceID, corridor, free flow speed,
+    peak volume, latitude and longitude
+
+    Keyword arguments:
+    corridors -- number of corridors, taken in order from SYNTHETIC_CORRIDORS
+    devices_per_corridor -- detectors on each corridor
+    seed -- random seed
+    """
+
+    rng = np.random.RandomState(seed)
+    names = SYNTHETIC_CORRIDORS[:corridors]
+
+    rows = []
+    for i, corr in enumerate(names):
+        #detectors spaced along a straight line through the region
+        lat0, lon0 = 41.6 + rng.rand() * 0.5, -88.1 + rng.rand() * 0.5
+        heading = rng.rand() * np.pi
+        for j in range(devices_per_corridor):
+            tag = corr.split('/')[0].upper().replace(' ', '_')
+            rows.append(('IL-TESTTSC-%s-%s-%d' % (tag, 'NS'[j % 2], 1000 + j), corr,
+                         lat0 + np.sin(heading) * j * 0.01, lon0 + np.cos(heading) * j * 0.01))
+
+    devices = pd.DataFrame(rows, columns=['FieldDeviceID', 'corridor', 'LAT', 'LONG'])
+    devices['free_flow'] = rng.normal(62, 4, len(devices))
+    devices['peak_volume'] = rng.uniform(800, 2000, len(devices))
+
+    return devices
+
+def synthetic_vds_year(devices, year, seed=0, missing_rate=0.02, outage_rate=0.01):
+
+    """
+    returns one year of hourly weekday detector summaries shaped like vds_table_2008_2018.csv
+    (FieldDeviceID, avgOccupancy, avgVolume, avgSpeed, dow, year, month, day, hour, corridor,
+    missing_speed, missing_occ, missing_vol); missing readings are NaN and flagged, and sensor-hours
+    in an outage have no row, as if the extract had dropped them
+
+    Keyword arguments:
+    devices -- dataframe from synthetic_devices()
+    year -- year to generate
+    seed -- random seed, combined with the year
+    missing_rate -- share of readings missing per metric
+    outage_rate -- share of sensor-hours with no row
+    """
+
+    rng = np.random.RandomState(seed * 10000 + year)
+
+    days = pd.bdate_range('%d-01-01' % year, '%d-12-31' % year)
+    n_devices, n_days = len(devices), len(days)
+    n = n_devices * n_days * 24
+
+    device = np.repeat(np.arange(n_devices), n_days * 24)
+    day = np.tile(np.repeat(np.arange(n_days), 24), n_devices)
+    hour = np.tile(np.arange(24), n_devices * n_days)
+
+    #day to day variation shared by a corridor's detectors, plus detector noise
+    day_factor = rng.normal(1, 0.08, n_days)[day]
+    volume = devices['peak_volume'].values[device] * VOLUME_PROFILE[hour] * day_factor * rng.normal(1, 0.1, n)
+    speed = devices['free_flow'].values[device] * (1 - CONGESTION_PROFILE[hour] * day_factor) + rng.normal(0, 3, n)
+    occupancy = volume / np.maximum(speed, 5) * 0.12 + rng.normal(0, 0.3, n)
+
+    df = pd.DataFrame({'FieldDeviceID': devices['FieldDeviceID'].values[device],
+                       'avgOccupancy': np.clip(occupancy, 0, None),
+                       'avgVolume': np.clip(volume, 0, None),
+                       'avgSpeed': np.clip(speed, 3, None),
+                       'dow': days.dayofweek.values[day] + 1,
+                       'year': year,
+                       'month': days.month.values[day],
+                       'day': days.day.values[day],
+                       'hour': hour,
+                       'corridor': devices['corridor'].values[device]})
+
+    for col, missing in [('avgSpeed','missing_speed'), ('avgOccupancy','missing_occ'), ('avgVolume','missing_vol')]:
+        flag = rng.rand(n) < missing_rate
+        df.loc[flag, col] = np.nan
+        df[missing] = flag.astype(np.int8)
+
+    return df.loc[rng.rand(n) >= outage_rate].reset_index(drop=True)
+
+def write_synthetic_data(data_dir, corridors=1, devices_per_corridor=30, years=1, start_year=2015, seed=0,
+                         store_name='vds_store'):
+
+    """
+    writes a generated vds store and detector location file to a dashboard data directory,
+    one year at a time; returns the store manifest
+
+    Keyword arguments:
+    data_dir -- dashboard data directory to create
+    corridors -- number of corridors
+    devices_per_corridor -- detectors on each corridor
+    years -- number of years, starting at start_year
+    start_year -- first year generated
+    seed -- random seed
+    store_name -- directory name of the parquet store
+    """
+
+    root = os.path.join(data_dir, store_name)
+    if not os.path.exists(root):
+        os.makedirs(root)
+
+    devices = synthetic_devices(corridors, devices_per_corridor, seed)
+    devices.assign(ID=devices['FieldDeviceID'], STATE='IL', DIR='NORTH_BOUND', ROADNAME=devices['corridor'])\
+           [['ID','STATE','LAT','LONG','DIR','ROADNAME']].to_csv(os.path.join(data_dir, SENSOR_FILE), index=False)
+
+    corridor_names, dows = set(), set()
+    rows = 0
+    for year in range(start_year, start_year + years):
+        table = prepare_vds_table(synthetic_vds_year(devices, year, seed), verbose=False)
+        write_vds_store(table, root, part_name='synthetic-%d' % year)
+
+        corridor_names.update(table['corridor'].astype(str).unique())
+        dows.update(table['dow'].dropna().astype(str).unique())
+        rows += len(table)
+
+    return write_manifest(root, corridor_names, range(start_year, start_year + years), dows, rows)
@@ -0,0 +1,51 @@
+import os
+from os.path import dirname, join
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.state import load_state, refresh_state
+from scripts.live import get_feed
+from scripts.instrument import metrics, start_metrics_server
+from scripts.startup import prewarm, FAST_START
+from scripts.select import selection_tab
+from scripts.analytics_tab import analytics_tab
+from scripts.compare_tab import compare_tab
+
+#minutes between checks for data added by the extractor (0 turns reloading off)
+REFRESH_MINUTES = float(os.environ.get('RTDAP_REFRESH_MINUTES', 10))
+
+#reloads run off the event loop, one at a time
+refresh_executor = ThreadPoolExecutor(max_workers=1)
+
+def on_server_loaded(server_context):
+    """load the vds store, baselines, cube and corridor indexes once for all sessions,
+    prewarm the tabs' default content, start the live feed and the /metrics endpoint,
+    and reload changed corridors when an extract updates the store"""
+    state = load_state(join(dirname(__file__),'data'))
+
+    #with fast startup, bokeh's document validation (a development check of the layout, run on
+    #every session) is turned off unless BOKEH_VALIDATE_DOC is set explicitly
+    if FAST_START:
+        os.environ.setdefault('BOKEH_VALIDATE_DOC', 'false')
+
+    #build the tabs once so the first session finds their default selections cached (RTDAP_FAST_START)
+    if state is not None and FAST_START:
+        prewarm(state, [selection_tab, analytics_tab, compare_tab])
+
+    #start reading the live source, if one is configured, before the first session
+    get_feed(state)
+
+    if REFRESH_MINUTES > 0:
+        server_context.add_periodic_callback(lambda: refresh_executor.submit(refresh_state),
+                                             REFRESH_MINUTES * 60 * 1000)
+
+    #callback metrics, on their own local port since bokeh serve does not take extra handlers
+    #(RTDAP_METRICS_PORT, RTDAP_METRICS_ADDRESS)
+    start_metrics_server()
+
+def on_session_created(session_context):
+    """count the session's callbacks in the callback metrics"""
+    metrics.session_created(session_context.id)
+
+def on_session_destroyed(session_context):
+    """stop counting the session's callbacks"""
+    metrics.session_destroyed(session_context.id)
@@ -0,0 +1,27 @@
+#libraries
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+#the dashboard modules are imported as scripts.*, from the app directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.prepare import prepare_vds_table
+from scripts.synthetic import synthetic_devices, synthetic_vds_year
+
+@pytest.fixture(scope='session')
+def vds_rows():
+
+    """
+    prepared vds detail rows of two corridors of four detectors over two years, with
+    missing readings, outages and some rows without a weekday
+    """
+
+    devices = synthetic_devices(corridors=2, devices_per_corridor=4, seed=1)
+    raw = pd.concat([synthetic_vds_year(devices, 2016, seed=1),
+                     synthetic_vds_year(devices, 2017, seed=2)], ignore_index=True)
+    raw.loc[raw.index[::97], 'dow'] = 6
+
+    return prepare_vds_table(raw)
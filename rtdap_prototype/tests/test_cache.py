@@ -0,0 +1,59 @@
+#libraries
+import numpy as np
+
+from scripts.cache import SelectionCache, result_size
+
+MB = 1024 * 1024
+
+def result(mb):
+    return {'values': np.zeros(int(mb * MB) // 8)}
+
+def test_least_recently_used_results_are_evicted_over_the_cap():
+
+    cache = SelectionCache(max_mb=1)
+    for key in 'abc':
+        cache.put(key, result(0.4))
+
+    assert list(cache.entries) == ['b', 'c']
+    assert cache.total_bytes == sum(result_size(v) for v in cache.entries.values())
+    assert cache.total_bytes <= cache.max_bytes
+
+def test_a_hit_keeps_a_result_from_eviction():
+
+    cache = SelectionCache(max_mb=1)
+    cache.put('a', result(0.4))
+    cache.put('b', result(0.4))
+    assert cache.get('a') is not None
+
+    cache.put('c', result(0.4))
+
+    assert list(cache.entries) == ['a', 'c']
+
+def test_results_larger_than_the_cap_are_not_cached():
+
+    cache = SelectionCache(max_mb=1)
+    cache.put('a', result(0.4))
+    cache.put('big', result(2))
+
+    assert list(cache.entries) == ['a']
+
+def test_replacing_a_result_updates_its_size():
+
+    cache = SelectionCache(max_mb=1)
+    cache.put('a', result(0.4))
+    cache.put('a', result(0.1))
+
+    assert cache.total_bytes == result_size(cache.entries['a'])
+
+def test_get_or_compute_computes_once():
+
+    cache = SelectionCache(max_mb=1)
+    calls = []
+    compute = lambda: calls.append(1) or result(0.1)
+
+    first = cache.get_or_compute('a', compute)
+    second = cache.get_or_compute('a', compute)
+
+    assert first is second
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
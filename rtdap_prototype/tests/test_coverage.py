@@ -0,0 +1,51 @@
+#libraries
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.store import MemoryStore
+from scripts.coverage import build_coverage
+from scripts.prepare import TOD_BUCKETS, DOW_NAMES, CLOCK_HOUR
+
+SELECTIONS = [('2016-01-01', '2017-12-31', 'All', (1, 8)),
+              ('2016-02-01', '2016-02-29', 'All', (3, 4)),
+              ('2016-06-15', '2017-03-01', 'Wednesday', (1, 2)),
+              ('2017-12-20', '2018-01-10', 'Friday', (6, 8))]
+
+def brute_force_absent(df, corr, date_s, date_e, weekday, tod):
+
+    """
+    returns expected sensor-hours without a record, counted hour by hour: every weekday hour
+    of the period from each detector's first to its last reporting day is expected
+    """
+
+    hours = np.flatnonzero((TOD_BUCKETS >= tod[0]) & (TOD_BUCKETS <= tod[1]))
+    weekdays = range(len(DOW_NAMES)) if weekday == 'All' else [DOW_NAMES.index(weekday)]
+
+    absent = 0
+    for device, rows in df.loc[df['corridor'] == corr].groupby('FieldDeviceID', observed=True):
+        present = set(zip(rows['date'].dt.normalize(), rows[CLOCK_HOUR]))
+        days = pd.date_range(max(rows['date'].min(), pd.Timestamp(date_s)),
+                             min(rows['date'].max(), pd.Timestamp(date_e)), freq='D')
+        for day in days[days.dayofweek.isin(weekdays)]:
+            absent += sum((day, h) not in present for h in hours)
+
+    return absent
+
+@pytest.fixture(scope='module')
+def coverage(vds_rows):
+    return build_coverage(MemoryStore(vds_rows))
+
+@pytest.mark.parametrize('date_s, date_e, weekday, tod', SELECTIONS)
+def test_absent_matches_brute_force(coverage, vds_rows, date_s, date_e, weekday, tod):
+
+    for corr in vds_rows['corridor'].cat.categories:
+        expected = brute_force_absent(vds_rows, corr, date_s, date_e, weekday, tod)
+
+        assert coverage.absent(corr, date_s, date_e, weekday, tod) == expected
+
+def test_outages_are_counted(coverage, vds_rows):
+
+    corr = vds_rows['corridor'].cat.categories[0]
+
+    assert coverage.absent(corr, '2016-01-01', '2017-12-31') > 0
@@ -0,0 +1,95 @@
+#libraries
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.store import VDSStore, MemoryStore, write_vds_store, write_manifest
+from scripts.index import SelectionIndex
+from scripts.cube import CUBE_KEYS, cube_cells, build_cube, load_cube, saved_cube, append_cube
+from scripts.sketch import SKETCH_KEYS, sketch_cells, build_sketches, load_sketches, saved_sketches, append_sketches,\
+                           merge_sketches
+from scripts.coverage import coverage_hours, build_coverage, load_coverage, saved_coverage, append_coverage
+
+def write_part(root, df, part_name):
+
+    """
+    returns the store after writing rows to it as a new part, with the manifest rewritten
+    """
+
+    write_vds_store(df, root, part_name=part_name)
+    write_manifest(root, df['corridor'].astype(str).unique(), df['year'].unique(),
+                   df['dow'].dropna().astype(str).unique(), len(df))
+
+    return VDSStore(root)
+
+def sorted_frame(df, keys):
+    df = df.astype({'dow': str})
+    return df.sort_values(keys + [c for c in ['bin'] if c in df.columns]).reset_index(drop=True)
+
+@pytest.fixture
+def appended_store(tmp_path, vds_rows):
+
+    """
+    returns (store, fingerprint before the append, appended rows); side files are built for
+    the first rows, and the appended rows share cells with them
+    """
+
+    root = str(tmp_path / 'vds_store')
+    appended = np.random.RandomState(0).rand(len(vds_rows)) < 0.3
+
+    store = write_part(root, vds_rows.loc[~appended], 'part-a')
+    load_cube(store)
+    load_sketches(store)
+    load_coverage(store)
+
+    return write_part(root, vds_rows.loc[appended], 'part-b'), store.fingerprint(), vds_rows.loc[appended]
+
+@pytest.mark.parametrize('weekday, tod', [('All', (1, 8)), ('Monday', (2, 5))])
+def test_cube_and_sketches_count_the_selected_detail_rows(vds_rows, weekday, tod):
+
+    store = MemoryStore(vds_rows)
+    detail, cube, sketches = SelectionIndex(vds_rows), SelectionIndex(build_cube(store)), SelectionIndex(build_sketches(store))
+
+    for corr in vds_rows['corridor'].cat.categories:
+        rows = detail.select(corr, '2016-01-01', '2017-12-31', weekday, tod)
+        cells = cube.select(corr, '2016-01-01', '2017-12-31', weekday, tod)
+
+        assert cells['rows'].sum() == len(rows)
+        assert cells['avgSpeed_count'].sum() == rows['avgSpeed'].notnull().sum()
+        assert merge_sketches(sketches, corr, '2016-01-01', '2017-12-31', weekday, tod).sum() == rows['avgSpeed'].notnull().sum()
+
+def test_appended_cube_matches_a_rebuild(appended_store):
+
+    store, previous, rows = appended_store
+
+    assert append_cube(store, previous, cube_cells(rows))
+
+    merged = saved_cube(store, store.fingerprint())
+    pd.testing.assert_frame_equal(sorted_frame(merged, CUBE_KEYS), sorted_frame(build_cube(store), CUBE_KEYS))
+
+def test_appended_sketches_match_a_rebuild(appended_store):
+
+    store, previous, rows = appended_store
+
+    assert append_sketches(store, previous, sketch_cells(rows))
+
+    merged = saved_sketches(store, store.fingerprint())
+    pd.testing.assert_frame_equal(sorted_frame(merged, SKETCH_KEYS), sorted_frame(build_sketches(store), SKETCH_KEYS))
+
+def test_appended_coverage_matches_a_rebuild(appended_store):
+
+    store, previous, rows = appended_store
+
+    assert append_coverage(store, previous, coverage_hours(rows))
+
+    merged, rebuilt = saved_coverage(store, store.fingerprint()), build_coverage(store)
+    assert merged.devices.equals(rebuilt.devices)
+    assert merged.start == rebuilt.start
+    assert np.array_equal(merged.present, rebuilt.present)
+
+def test_append_is_refused_for_side_files_of_another_store(appended_store):
+
+    store, previous, rows = appended_store
+
+    assert not append_cube(store, 'not-the-previous-store', cube_cells(rows))
+    assert not append_sketches(store, 'not-the-previous-store', sketch_cells(rows))
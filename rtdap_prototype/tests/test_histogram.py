@@ -0,0 +1,48 @@
+#libraries
+import numpy as np
+import pandas as pd
+
+from scripts.histogram import metric_histograms, HISTOGRAM_BINS
+from scripts.prepare import METRIC_COLUMNS
+
+def device_pairs(n=500, seed=0):
+
+    """
+    returns (devices, full means, selected means) spread around and beyond every metric's bins
+    """
+
+    rng = np.random.RandomState(seed)
+    scale = np.array([HISTOGRAM_BINS[col][-1] for col in METRIC_COLUMNS])
+
+    full = rng.uniform(1, 3, (n, len(METRIC_COLUMNS))) * scale
+    selected = full - rng.uniform(-1.2, 1.2, (n, len(METRIC_COLUMNS))) * scale
+    full[::50] = np.nan
+    selected[::70, 0] = -1.0
+
+    return pd.Index(['d%d' % i for i in range(n)]), full, selected
+
+def test_histograms_match_np_histogram():
+
+    devices, full, selected = device_pairs()
+    histograms = metric_histograms(devices, full, None, selected_means=selected)
+
+    for i, col in enumerate(METRIC_COLUMNS):
+        edges = HISTOGRAM_BINS[col]
+        with np.errstate(invalid='ignore'):
+            difference = (full[:, i] - selected[:, i])[(full[:, i] > 0) & (selected[:, i] > 0)]
+
+        counts, _ = np.histogram(difference, bins=edges)
+
+        assert np.array_equal(histograms[col]['bins'], edges[:-1])
+        assert np.array_equal(histograms[col]['difference'], counts)
+
+def test_bins_are_right_closed():
+
+    edges = HISTOGRAM_BINS['avgSpeed']
+    full = np.array([[50.0 + edges[1], 10.0, 100.0]])
+    selected = np.array([[50.0, 10.0, 100.0]])
+
+    histograms = metric_histograms(pd.Index(['d0']), full, None, selected_means=selected)
+
+    #a difference equal to edges[1] falls in (edges[0], edges[1]]
+    assert histograms['avgSpeed']['difference'][0] == 1
@@ -0,0 +1,37 @@
+#libraries
+import numpy as np
+import pytest
+
+from scripts.index import SelectionIndex
+from scripts.prepare import DOW_NAMES
+
+SELECTIONS = [('2016-01-01', '2017-12-31', 'All', (1, 8)),
+              ('2016-03-15', '2016-03-15', 'All', (1, 8)),
+              ('2016-02-29', '2017-01-31', 'Tuesday', (3, 4)),
+              ('2017-06-01', '2018-06-01', 'Friday', (8, 8)),
+              ('2015-01-01', '2015-12-31', 'All', (1, 8))]
+
+@pytest.fixture(scope='module')
+def index(vds_rows):
+    return SelectionIndex(vds_rows)
+
+@pytest.mark.parametrize('date_s, date_e, weekday, tod', SELECTIONS)
+def test_positions_match_boolean_mask(index, vds_rows, date_s, date_e, weekday, tod):
+
+    df = index.df
+    for corr in vds_rows['corridor'].cat.categories:
+        dows = DOW_NAMES if weekday == 'All' else [weekday]
+        mask = ((df['corridor'] == corr) & df['dow'].isin(dows) &
+                (df['hour'] >= tod[0]) & (df['hour'] <= tod[1]) &
+                (df['date'] >= date_s) & (df['date'] <= date_e))
+
+        positions = index.positions(corr, date_s, date_e, weekday, tod)
+
+        assert np.array_equal(np.sort(positions), np.flatnonzero(mask.values))
+
+def test_rows_without_a_weekday_are_not_selected(index):
+
+    positions = index.positions(index.df['corridor'].iloc[0], '2016-01-01', '2017-12-31', 'All', (1, 8))
+
+    assert index.df['dow'].iloc[positions].notnull().all()
+    assert index.df['dow'].isnull().any()
@@ -0,0 +1,28 @@
+#libraries
+import numpy as np
+
+from scripts.sketch import SPEED_BINS, SPEED_BIN_MPH, speed_bins, sketch_quantiles
+
+def test_speeds_up_to_the_last_bin_keep_their_own_bin():
+
+    speeds = np.array([0.0, 55.5, 99.0, 105.2, SPEED_BINS * SPEED_BIN_MPH - 0.5])
+
+    assert np.array_equal(speed_bins(speeds), (speeds // SPEED_BIN_MPH).astype(np.int64))
+
+def test_quantiles_are_within_one_bin_of_the_readings():
+
+    speeds = np.random.RandomState(0).uniform(20, 110, 5000)
+    histogram = np.bincount(speed_bins(speeds), minlength=SPEED_BINS)
+
+    estimated = sketch_quantiles(histogram, [5, 50, 85, 95])[0]
+
+    assert np.all(np.abs(estimated - np.percentile(speeds, [5, 50, 85, 95])) <= SPEED_BIN_MPH)
+
+def test_quantiles_in_the_last_bin_are_its_lower_edge():
+
+    histogram = np.zeros(SPEED_BINS)
+    histogram[60], histogram[-1] = 10, 90
+
+    speeds = sketch_quantiles(histogram, [50, 95])[0]
+
+    assert np.array_equal(speeds, [(SPEED_BINS - 1) * SPEED_BIN_MPH] * 2)